@@ -0,0 +1,63 @@
+"""Benchmark of the Orbita kinematics: per-sample calls vs batched calls.
+
+Converts a disk trajectory (as it could be logged from the head) sample by sample
+and as a single batch, and reports the cost per sample of both paths.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from reachy_pyluos_hal.config import load_config
+from reachy_pyluos_hal.orbita import OrbitaActuator
+
+
+def get_orbita() -> OrbitaActuator:
+    """Get the orbita actuator of the head config."""
+    return load_config('mini')[0]['neck']
+
+
+def disk_trajectory(nb_samples: int) -> np.ndarray:
+    """Generate a smooth (N, 3) disk trajectory (in radians)."""
+    t = np.linspace(0, 2 * np.pi, nb_samples)
+    return 0.3 * np.stack([np.sin(t), np.sin(t + 2 * np.pi / 3), np.sin(t - 2 * np.pi / 3)], axis=1)
+
+
+def timeit(func, repeat: int) -> float:
+    """Get the best time (in s) of func over repeat calls."""
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    """Run the kinematics benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    orbita = get_orbita()
+    disks = disk_trajectory(args.samples)
+
+    per_sample = timeit(lambda: [orbita.forward(d) for d in disks], args.repeat)
+    batch = timeit(lambda: orbita.forward_batch(disks), args.repeat)
+
+    print(f'forward  per-sample: {per_sample / args.samples * 1e6:>10.1f} us/sample')
+    print(f'forward  batch:      {batch / args.samples * 1e6:>10.1f} us/sample ({per_sample / batch:.0f}x)')
+
+    rpys = orbita.forward_batch(disks)
+
+    per_sample = timeit(lambda: [orbita.inverse(rpy) for rpy in rpys], args.repeat)
+    batch = timeit(lambda: orbita.inverse_batch(rpys), args.repeat)
+
+    print(f'inverse  per-sample: {per_sample / args.samples * 1e6:>10.1f} us/sample')
+    print(f'inverse  batch:      {batch / args.samples * 1e6:>10.1f} us/sample ({per_sample / batch:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Micro-benchmark of the gate frame parser (GateProtocol.pop_messages).
+
+Feeds gate traffic through the parser, chunk by chunk as the serial ReaderThread did,
+and reports the parsing throughput compared to the 1 Mbaud line rate.
+
+The traffic comes from a traffic recording (see REACHY_TRAFFIC_RECORDING_DIR), replayed with its recorded chunks.
+Without --recording, one is made by streaming the present positions of a simulated full kit.
+Large reads (eg. after a stall of the reader thread) are measured by cutting a synthetic capture
+of a gate under full publish load in fixed size chunks.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import struct
+import tempfile
+import time
+
+from typing import List
+
+from reachy_pyluos_hal.pycore import GateProtocol
+from reachy_pyluos_hal.reachy import Reachy
+from reachy_pyluos_hal.recorder import RX, read_recording
+from reachy_pyluos_hal.simulator import simulate_config, unregister_simulated_gate
+
+
+LINE_RATE = 1000000 / 10  # bytes/s at 1 Mbaud (8N1)
+
+
+def frame(payload: bytes) -> bytes:
+    """Wrap a payload as a gate frame."""
+    return bytes([255, 255, len(payload)]) + payload
+
+
+def full_publish_load(duration: float = 1.0) -> bytes:
+    """Generate the traffic published by a gate during duration (in s)."""
+    dxl_ids = [10, 11, 12, 13, 14, 15, 16, 17]
+
+    positions = bytes([GateProtocol.MSG_TYPE_DXL_PUB_DATA, 36, 2])
+    temperatures = bytes([GateProtocol.MSG_TYPE_DXL_PUB_DATA, 43, 1])
+    for id in dxl_ids:
+        positions += bytes([id]) + struct.pack('<HH', 0, 2048)
+        temperatures += bytes([id]) + struct.pack('<HB', 0, 37)
+
+    loads = bytes([GateProtocol.MSG_TYPE_LOAD_PUB_DATA, 10]) + struct.pack('<f', 1.5)
+    orbita = bytes([GateProtocol.MSG_TYPE_ORBITA_PUB_DATA, 40, 10]) + struct.pack('<iii', 1000, -1000, 0)
+
+    period = (
+        frame(positions) + frame(orbita) + frame(loads)
+    ) * 10 + frame(temperatures)
+
+    # One period corresponds to 100ms of publication (position and load @100Hz, temperature @10Hz).
+    return period * int(duration * 10)
+
+
+class LegacyParser:
+    """Copy-per-message parser, as it was before the read cursor."""
+
+    def __init__(self) -> None:
+        """Prepare the input buffer."""
+        self.buffer = bytearray()
+
+    def data_received(self, data: bytes) -> List[bytearray]:
+        """Handle new received data."""
+        self.buffer.extend(data)
+        return self.pop_messages()
+
+    def pop_messages(self) -> List[bytearray]:
+        """Parse buffer and pop complete messages."""
+        msgs = []
+
+        while len(self.buffer) >= 3:
+            if self.buffer[0] != 255 or self.buffer[1] != 255:
+                start = self.buffer.find(bytearray([255, 255]))
+                if start == -1:
+                    self.buffer.clear()
+                else:
+                    self.buffer = self.buffer[start:]
+                continue
+
+            payload_size = self.buffer[2]
+            if len(self.buffer) < 3 + payload_size:
+                break
+
+            msgs.append(self.buffer[3: 3 + payload_size])
+            self.buffer = self.buffer[3 + payload_size:]
+
+        return msgs
+
+
+class CursorParser(GateProtocol):
+    """Read cursor parser, as run by GateProtocol.data_received (without the message handling)."""
+
+    def parse(self, data: bytes) -> int:
+        """Parse buffer and pop complete messages."""
+        self.buffer.extend(data)
+        return len(self.pop_messages())
+
+
+def record_simulated_traffic(duration: float) -> List[bytes]:
+    """Record the chunks received from the gates of a simulated full kit streaming its present positions for duration (in s)."""
+    ports = simulate_config('full_kit')
+    with tempfile.TemporaryDirectory() as recording_dir:
+        os.environ['REACHY_TRAFFIC_RECORDING_DIR'] = recording_dir
+        try:
+            with Reachy('full_kit', logging.getLogger('benchmark'), ports=ports) as reachy:
+                reachy.start_streaming(period=10)
+                names = list(reachy.dxls.keys())
+                end = time.monotonic() + duration
+                while time.monotonic() < end:
+                    reachy.get_joints_value('present_position', names)
+                    time.sleep(0.01)
+        finally:
+            del os.environ['REACHY_TRAFFIC_RECORDING_DIR']
+            for i in range(len(ports)):
+                unregister_simulated_gate(f'full_kit_{i}')
+
+        return sum((load_recorded_chunks(path) for path in sorted(glob.glob(os.path.join(recording_dir, '*.rec')))), [])
+
+
+def load_recorded_chunks(path: str) -> List[bytes]:
+    """Get the chunks received in a traffic recording."""
+    return [record.data for record in read_recording(path) if record.direction == RX]
+
+
+def run(chunks: List[bytes], label: str, repeat: int, rounds: int):
+    """Feed the chunks through both parsers (alternately, keeping the best of rounds) and print their throughput."""
+    def legacy_run(parser: LegacyParser) -> int:
+        return sum(len(parser.data_received(c)) for _ in range(repeat) for c in chunks)
+
+    def cursor_run(parser: CursorParser) -> int:
+        return sum(parser.parse(c) for _ in range(repeat) for c in chunks)
+
+    best = {'legacy': float('inf'), 'cursor': float('inf')}
+    nb_msgs = {}
+    for _ in range(rounds):
+        for name, parser, run_parser in (('legacy', LegacyParser(), legacy_run), ('cursor', CursorParser(), cursor_run)):
+            t0 = time.perf_counter()
+            nb_msgs[name] = run_parser(parser)
+            best[name] = min(best[name], time.perf_counter() - t0)
+
+    assert nb_msgs['legacy'] == nb_msgs['cursor']
+
+    size = sum(len(c) for c in chunks) * repeat
+    for name, elapsed in best.items():
+        print(
+            f'{name:>8} {label:>20}: {nb_msgs[name] / elapsed:>12.0f} msgs/s '
+            f'{size / elapsed / 1e6:>8.2f} MB/s ({size / elapsed / LINE_RATE:>7.1f}x 1 Mbaud line rate)'
+        )
+
+
+def main():
+    """Run the parser benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recording', nargs='*', default=[], help='traffic recordings of gates (made on a simulated full kit if none)')
+    parser.add_argument('--duration', type=float, default=5.0, help='duration (in s) of the simulated recording and of the synthetic traffic')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=5, help='number of timed runs of each parser (the best one is kept)')
+    args = parser.parse_args()
+
+    if args.recording:
+        chunks = sum((load_recorded_chunks(path) for path in args.recording), [])
+    else:
+        chunks = record_simulated_traffic(args.duration)
+    sizes = sorted(len(c) for c in chunks)
+    print(f'{len(chunks)} recorded chunks (median {sizes[len(sizes) // 2]}B, max {sizes[-1]}B)')
+    run(chunks, 'recorded', args.repeat, args.rounds)
+
+    traffic = full_publish_load(args.duration)
+    for chunk_size in (1024, 16384):
+        run([traffic[i: i + chunk_size] for i in range(0, len(traffic), chunk_size)], f'chunk={chunk_size}B', args.repeat, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
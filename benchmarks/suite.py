@@ -0,0 +1,179 @@
+"""Benchmark suite of the HAL hot paths, with machine-readable results.
+
+Measures the latency of each operation (p50, p99 and max over all calls) and its throughput:
+    - JointLuos.get_joint_positions and set_goal_positions, end-to-end on simulated gates,
+    - gate frame parsing and decoding (GateProtocol.data_received) under full publish load,
+    - Dynamixel position conversions, Orbita forward/inverse kinematics and load_config.
+
+Results are printed (or written with --output) as JSON.
+With --baseline, the p50 of each benchmark is compared to a previous result
+and the script exits with an error if any regressed by more than --tolerance.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from reachy_pyluos_hal.config import load_config
+from reachy_pyluos_hal.dynamixel import DynamixelMotor, DynamixelPositionConverter
+from reachy_pyluos_hal.joint_hal import JointLuos
+from reachy_pyluos_hal.pycore import GateProtocol
+from reachy_pyluos_hal.simulator import simulate_config, unregister_simulated_gate
+
+from pop_messages import full_publish_load
+
+
+def measure(func: Callable[[], object], calls: int, warmup: int = 10, msgs_per_call: int = 0) -> Dict[str, float]:
+    """Call func repeatedly and return its latency stats (in us) and throughput.
+
+    If each call processes msgs_per_call messages, the messages throughput is reported as well.
+    """
+    for _ in range(warmup):
+        func()
+
+    latencies = np.empty(calls)
+    for i in range(calls):
+        t0 = time.perf_counter()
+        func()
+        latencies[i] = time.perf_counter() - t0
+
+    total = latencies.sum()
+    result = {
+        'calls': calls,
+        'p50_us': float(np.percentile(latencies, 50) * 1e6),
+        'p99_us': float(np.percentile(latencies, 99) * 1e6),
+        'max_us': float(latencies.max() * 1e6),
+        'ops_per_s': float(calls / total),
+    }
+    if msgs_per_call:
+        result['msgs_per_s'] = float(calls * msgs_per_call / total)
+    return result
+
+
+class DecodingProtocol(GateProtocol):
+    """Gate protocol decoding the messages without storing them anywhere."""
+
+    def handle_dxl_pub_data(self, register, ids, errors, values):
+        """Drop decoded dxl data."""
+
+    def handle_load_pub_data(self, ids, values):
+        """Drop decoded load data."""
+
+    def handle_orbita_pub_data(self, orbita_id, reg_type, values):
+        """Drop decoded orbita data."""
+
+    def handle_fan_pub_data(self, fan_ids, states):
+        """Drop decoded fan data."""
+
+
+def bench_decoding(calls: int) -> Dict[str, float]:
+    """Parse and decode 100ms of gate traffic (in 64 bytes chunks, as read by the serial thread)."""
+    traffic = full_publish_load(0.1)
+    chunks = [bytearray(traffic[i: i + 64]) for i in range(0, len(traffic), 64)]
+
+    protocol = DecodingProtocol()
+    counter = GateProtocol()
+    counter.buffer.extend(traffic)
+    nb_msgs = len(counter.pop_messages())
+
+    def decode():
+        for c in chunks:
+            protocol.data_received(c)
+
+    return measure(decode, calls, msgs_per_call=nb_msgs)
+
+
+def bench_hal(calls: int, config_name: str) -> Dict[str, Dict[str, float]]:
+    """Measure JointLuos reads and writes on simulated gates."""
+    os.environ['REACHY_DISCOVERY_CACHE_FILE'] = ''
+    ports = simulate_config(config_name)
+    logger = logging.getLogger('benchmark')
+
+    try:
+        with JointLuos(config_name, logger, ports=ports) as hal:
+            names = [name for name in hal.get_all_joint_names() if name in hal.reachy.dxls]
+            hal.set_compliance({name: False for name in names})
+            goals = {name: 0.0 for name in names}
+
+            results = {
+                'joint_luos.get_joint_positions': measure(lambda: hal.get_joint_positions(names), calls),
+                'joint_luos.set_goal_positions': measure(lambda: hal.set_goal_positions(goals), calls),
+            }
+    finally:
+        for i in range(len(ports)):
+            unregister_simulated_gate(f'{config_name}_{i}')
+
+    return results
+
+
+def run(calls: int, config_name: str) -> Dict[str, Dict[str, float]]:
+    """Run all benchmarks."""
+    motors: List[DynamixelMotor] = [
+        dev for part in load_config(config_name) for dev in part.values() if isinstance(dev, DynamixelMotor)
+    ]
+    converter = DynamixelPositionConverter(motors)
+    positions = np.linspace(-1.0, 1.0, len(motors))
+    raw_positions = b''.join(converter.to_raw(positions))
+
+    orbita = load_config('mini')[0]['neck']
+    disks = (0.1, 0.2, 0.3)
+    rpy = orbita.forward(disks)
+
+    results = {
+        'gate_protocol.decoding': bench_decoding(calls),
+        'dynamixel.to_usi': measure(lambda: converter.to_usi(raw_positions), calls),
+        'dynamixel.to_raw': measure(lambda: converter.to_raw(positions), calls),
+        'orbita.forward': measure(lambda: orbita.forward(disks), calls),
+        'orbita.inverse': measure(lambda: orbita.inverse(rpy), calls),
+        'config.load_config': measure(lambda: load_config(config_name), max(calls // 10, 1), warmup=1),
+    }
+    results.update(bench_hal(calls, config_name))
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Find the benchmarks whose p50 regressed by more than tolerance compared to the baseline."""
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result['p50_us'] > baseline[name]['p50_us'] * (1 + tolerance):
+            regressions.append(f'{name}: p50 {result["p50_us"]:.1f}us (baseline {baseline[name]["p50_us"]:.1f}us)')
+    return regressions
+
+
+def main():
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--config', default='full_kit')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p50 regression (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    results = run(args.calls, args.config)
+
+    output = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
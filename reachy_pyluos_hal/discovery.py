@@ -1,11 +1,14 @@
 """Discover utility functions to find the correct serial port where the given devices are connected."""
 
-import time
+import json
+import os
+import warnings
 
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
 from typing import Dict, List, Optional, Tuple
 
-from serial import Serial
+from serial import serial_for_url
 from serial.threaded import ReaderThread
 
 from .device import Device
@@ -16,26 +19,186 @@ from .orbita import OrbitaActuator
 from .pycore import GateProtocol, LuosContainer
 
 
+def find_gates(parts: List[Dict[str, Device]],
+               ports: List[str],
+               logger: Optional[Logger],
+               retry: int = 10,
+               cache_file: Optional[str] = None,
+               ) -> List[Tuple[str, List[Device], List[Device]]]:
+    """Identify the correct gate of each part among possible serial ports based on the identified luos devices.
+
+    If a cache file is given, the containers previously found on each port are first confirmed (one pipelined query per gate).
+    If this is enough to find all parts, no detection is run at all.
+
+    Otherwise, the detection runs concurrently on the remaining ports and its result is shared by all parts.
+    It is only run again (up to retry times) if some devices are still missing,
+    unless the detection succeeded on all ports and found the same containers as the previous attempt (retrying would not help).
+    """
+    if cache_file is not None:
+        cached = validate_cached_containers(load_discovery_cache(cache_file), ports, logger)
+        solutions = [match_gate(devices, cached) for devices in parts]
+        if all(len(missing) == 0 for _, _, missing in solutions):
+            if logger is not None:
+                logger.info(f'All devices found using discovery cache "{cache_file}".')
+            return solutions
+    else:
+        cached = {}
+
+    previous_containers_per_port = None
+
+    for attempt in range(retry + 1):
+        containers_per_port = dict(cached)
+        containers_per_port.update(discover_gates([port for port in ports if port not in cached], logger))
+        solutions = [match_gate(devices, containers_per_port) for devices in parts]
+
+        if all(len(missing) == 0 for _, _, missing in solutions):
+            if cache_file is not None:
+                save_discovery_cache(cache_file, containers_per_port)
+            break
+
+        if len(containers_per_port) == len(ports) and containers_per_port == previous_containers_per_port:
+            if logger is not None:
+                logger.warning(f'Some devices are still missing after detection #{attempt + 1} with the same containers found, giving up.')
+            break
+        previous_containers_per_port = containers_per_port
+
+        # The cached containers are not enough, run a full detection everywhere.
+        cached = {}
+        if logger is not None:
+            logger.info(f'Some devices are still missing after detection #{attempt + 1}.')
+    else:
+        failed_ports = [port for port in ports if port not in containers_per_port]
+        if failed_ports:
+            raise TimeoutError(f'Luos detection timed out on {failed_ports}')
+
+    return solutions
+
+
 def find_gate(devices: Dict[str, Device], ports: List[str], logger: Optional[Logger], retry: int = 10) -> Tuple[str, List[Device], List[Device]]:
-    """Try to identify the correct gate among possible serial ports based on the identified luos device."""
-    solutions = {}
+    """Try to identify the correct gate among possible serial ports based on the identified luos device.
+
+    Deprecated: use find_gates, which shares a single detection between all parts.
+    """
+    warnings.warn('find_gate is deprecated, use find_gates instead.', DeprecationWarning, stacklevel=2)
+    return find_gates([devices], ports, logger, retry)[0]
 
-    for port in ports:
-        containers: List[LuosContainer] = sum(identify_luos_containers(port, logger).values(), [])
 
+def match_gate(devices: Dict[str, Device], containers_per_port: Dict[str, List[LuosContainer]]) -> Tuple[str, List[Device], List[Device]]:
+    """Find the port whose detected luos containers best match the given devices."""
+    solutions = {}
+
+    for port, containers in containers_per_port.items():
         matching, missing = corresponding_containers(devices, containers)
         solutions[port] = (matching, missing)
         if len(missing) == 0:
             return (port, matching, missing)
 
-    if retry > 0:
-        return find_gate(devices, ports, logger, retry - 1)
+    if not solutions:
+        return ('', [], list(devices.values()))
 
     best_solution = sorted(solutions.items(), key=lambda item: len(item[1][1]))[0]
     port, (matching, missing) = best_solution
     return (port, matching, missing)
 
 
+def discover_gates(ports: List[str], logger: Optional[Logger]) -> Dict[str, List[LuosContainer]]:
+    """Run the luos detection concurrently on all ports and return the containers found for each port.
+
+    Ports where the detection timed out are left out.
+    """
+    if not ports:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        futures = {port: executor.submit(identify_luos_containers, port, logger) for port in ports}
+
+    containers_per_port: Dict[str, List[LuosContainer]] = {}
+    for port, future in futures.items():
+        try:
+            containers_per_port[port] = sum(future.result().values(), [])
+        except TimeoutError:
+            if logger is not None:
+                logger.warning(f'Luos detection timed out on "{port}".')
+
+    return containers_per_port
+
+
+def get_discovery_cache_file() -> Optional[str]:
+    """Get the path of the discovery cache file, set by REACHY_DISCOVERY_CACHE_FILE (None if unset or empty, the cache is then disabled).
+
+    The cache is opt-in: it is written by each successful discovery, eg. REACHY_DISCOVERY_CACHE_FILE=~/.reachy_discovery_cache.json.
+    """
+    cache_file = os.getenv('REACHY_DISCOVERY_CACHE_FILE')
+    return os.path.expanduser(cache_file) if cache_file else None
+
+
+def load_discovery_cache(cache_file: str) -> Dict[str, List[LuosContainer]]:
+    """Load the containers last found on each port (empty if there is no valid cache)."""
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+        return {
+            port: [LuosContainer(*c) for c in containers]
+            for port, containers in cache.items()
+        }
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def save_discovery_cache(cache_file: str, containers_per_port: Dict[str, List[LuosContainer]]):
+    """Save the containers found on each port.
+
+    The cache is written to a temporary file first, then renamed, so it is never left half written.
+    """
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump({port: [list(c) for c in containers] for port, containers in containers_per_port.items()}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+def validate_cached_containers(
+        cached: Dict[str, List[LuosContainer]],
+        ports: List[str],
+        logger: Optional[Logger],
+        ) -> Dict[str, List[LuosContainer]]:
+    """Confirm concurrently the cached containers of each port and return only the valid ones.
+
+    Every cached container of a port is queried, the port is only valid if all of them answer with the same alias and type
+    (a moved part or a missing container invalidates it).
+    """
+    ports = [port for port in ports if cached.get(port)]
+    if not ports:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        futures = {port: executor.submit(check_luos_containers, port, cached[port], logger) for port in ports}
+
+    return {port: cached[port] for port, future in futures.items() if future.result()}
+
+
+def check_luos_containers(port: str, containers: List[LuosContainer], logger: Optional[Logger] = None) -> bool:
+    """Check that all the given luos containers are connected to the serial port."""
+    class GateHandler(GateProtocol):
+        def handle_assert(self, msg):
+            raise AssertionError(msg)
+
+    GateHandler.logger = logger
+    try:
+        with serial_for_url(port, baudrate=1000000) as s:
+            with ReaderThread(s, GateHandler) as p:
+                infos = p.send_container_info_requests([c.id for c in containers])
+    except (OSError, TimeoutError):
+        return False
+
+    return all(infos[c.id] == (c.alias, c.type) for c in containers)
+
+
 def identify_luos_containers(port: str, logger: Optional[Logger] = None) -> Dict[int, List[LuosContainer]]:
     """Found which luos containers are connected to the serial port."""
     class GateHandler(GateProtocol):
@@ -43,12 +206,11 @@ def identify_luos_containers(port: str, logger: Optional[Logger] = None) -> Dict
             raise AssertionError(msg)
 
     GateHandler.logger = logger
-    with Serial(port, baudrate=1000000) as s:
+    with serial_for_url(port, baudrate=1000000) as s:
         with ReaderThread(s, GateHandler) as p:
             p.send_detection_run_signal()
-            containers = p.send_detection_signal()
-            time.sleep(p.timeout)
-            return containers
+            # Every answer has already been waited for (on the detection condition), the port can be closed right away.
+            return p.send_detection_signal()
 
 
 def corresponding_containers(
@@ -2,7 +2,8 @@
 
 from abc import abstractproperty
 from enum import Enum
-from typing import Dict, List, Tuple, Type
+from logging import Logger
+from typing import Dict, List, Optional, Sequence, Tuple, Type
 from struct import pack, unpack
 
 import numpy as np
@@ -11,6 +12,10 @@ from numpy import clip, deg2rad, pi
 from .joint import Joint
 
 
+MX_MAX_RADIAN = float(deg2rad(360))
+AX_MAX_RADIAN = float(deg2rad(300))
+
+
 class DynamixelModelNumber(Enum):
     """Enum representing the different Dynamixel models."""
 
@@ -323,7 +328,7 @@ class MX(DynamixelMotorV1):
     @property
     def max_radian(self) -> float:
         """Return the max position (in rad)."""
-        return deg2rad(360)
+        return MX_MAX_RADIAN
 
 
 class AX18(DynamixelMotorV1):
@@ -359,7 +364,7 @@ class AX18(DynamixelMotorV1):
     @property
     def max_radian(self) -> float:
         """Return the max position (in rad)."""
-        return deg2rad(300)
+        return AX_MAX_RADIAN
 
     @property
     def motor_type(self):
@@ -405,7 +410,7 @@ class XL320(DynamixelMotorV2):
     @property
     def max_radian(self) -> float:
         """Return the max position (in rad)."""
-        return deg2rad(300)
+        return AX_MAX_RADIAN
 
     @property
     def motor_type(self):
@@ -413,6 +418,93 @@ class XL320(DynamixelMotorV2):
         return 'XL320'
 
 
+class DynamixelPositionConverter:
+    """Batched position conversion for a group of dynamixel motors.
+
+    The per-motor offset, direction, reduction and resolution are gathered once as arrays,
+    so a whole group can be converted in a single vectorized call.
+    Any subset of the motors (in any order) can be converted by giving their indices in the group.
+    Conversions are the same as DynamixelMotor.position_to_usi and position_to_raw.
+    """
+
+    def __init__(self, motors: Sequence[DynamixelMotor], logger: Optional[Logger] = None) -> None:
+        """Precompute the conversion arrays for the given motors."""
+        self.ids = [m.id for m in motors]
+        self.logger = logger
+
+        self.offsets = np.array([m.offset for m in motors], dtype=float)
+        self.signs = np.array([1.0 if m.direct else -1.0 for m in motors])
+        self.reductions = np.array([m.reduction for m in motors], dtype=float)
+        self.max_positions = np.array([m.max_position for m in motors])
+        self.max_radians = np.array([m.max_radian for m in motors], dtype=float)
+
+        # Both conversions are affine: fold everything into a single scale and bias per motor.
+        rad_per_tick = self.max_radians / (self.max_positions - 1)
+        self._usi_scale = rad_per_tick / self.reductions * self.signs
+        self._usi_bias = -self.max_radians / 2 / self.reductions * self.signs - self.offsets
+        self._raw_scale = self.reductions * self.signs / rad_per_tick
+        self._raw_bias = (self.offsets * self.signs + self.max_radians / 2) / rad_per_tick
+        self._raw_max = self.max_positions - 1
+
+    def to_usi(self, raw: bytes, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Convert concatenated raw positions (2 bytes per motor, for the motors at indices or all of them) to positions (in rad)."""
+        dxl_raw_pos = np.frombuffer(raw, dtype='<u2')
+
+        if indices is None:
+            max_positions, usi_scale, usi_bias = self.max_positions, self._usi_scale, self._usi_bias
+        else:
+            max_positions, usi_scale, usi_bias = self.max_positions[indices], self._usi_scale[indices], self._usi_bias[indices]
+
+        corrupted = dxl_raw_pos >= max_positions
+        if corrupted.any():
+            if self.logger is not None:
+                for i in np.flatnonzero(corrupted):
+                    id = self.ids[i if indices is None else indices[i]]
+                    self.logger.warning(f'Corrupted dynamixel position received on id={id} ({dxl_raw_pos[i]} should be in (0, {max_positions[i]}))!')
+            dxl_raw_pos = np.minimum(dxl_raw_pos, max_positions)
+
+        return dxl_raw_pos * usi_scale + usi_bias
+
+    def to_raw(self, values: Sequence[float], indices: Optional[np.ndarray] = None) -> List[bytes]:
+        """Convert positions (in rad, for the motors at indices or all of them) to raw values (one 2 bytes value per motor)."""
+        if indices is None:
+            raw_scale, raw_bias, raw_max = self._raw_scale, self._raw_bias, self._raw_max
+        else:
+            raw_scale, raw_bias, raw_max = self._raw_scale[indices], self._raw_bias[indices], self._raw_max[indices]
+
+        dxl_raw_pos = np.asarray(values, dtype=float) * raw_scale + raw_bias
+        dxl_raw_pos = np.clip(np.round(dxl_raw_pos), 0, raw_max).astype('<u2')
+
+        raw = dxl_raw_pos.tobytes()
+        return [raw[i: i + 2] for i in range(0, len(raw), 2)]
+
+
+def coalesce_writes(writes_for_id: Dict[int, Dict[int, bytes]]) -> List[Tuple[int, int, Dict[int, bytes]]]:
+    """Merge raw register writes {id: {addr: value}} into as few (addr, num_bytes, {id: value}) set requests as possible.
+
+    Writes at contiguous addresses on a same motor are concatenated into a single span.
+    Motors with the exact same span then share the same request.
+    """
+    value_for_id_per_span: Dict[Tuple[int, int], Dict[int, bytes]] = {}
+
+    for id, value_for_addr in writes_for_id.items():
+        spans: List[Tuple[int, bytes]] = []
+        for addr in sorted(value_for_addr):
+            value = value_for_addr[addr]
+            if spans and spans[-1][0] + len(spans[-1][1]) == addr:
+                spans[-1] = (spans[-1][0], spans[-1][1] + value)
+            else:
+                spans.append((addr, value))
+
+        for addr, value in spans:
+            value_for_id_per_span.setdefault((addr, len(value)), {})[id] = value
+
+    return [
+        (addr, num_bytes, value_for_id)
+        for (addr, num_bytes), value_for_id in sorted(value_for_id_per_span.items())
+    ]
+
+
 def get_motor_from_model(model: DynamixelModelNumber) -> Type[DynamixelMotor]:
     """Get the motor class corresponding to the specified model number."""
     return {
@@ -11,7 +11,7 @@ class Fan:
     def __init__(self, id: int) -> None:
         """Set up new Fan."""
         self.id = id
-        self._state = Register(self.cvt_as_usi, self.cvt_as_raw)
+        self._state = Register(self.cvt_as_usi, self.cvt_as_raw, kind='Fan.state')
 
         self.logger: Optional[Logger] = None
 
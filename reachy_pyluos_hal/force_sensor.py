@@ -14,7 +14,7 @@ class ForceSensor:
     def __init__(self, id: int) -> None:
         """Wrap a force Register."""
         self.id = id
-        self.force = Register(self.cvt_as_usi, self.cvt_as_raw, timeout=1.0)
+        self.force = Register(self.cvt_as_usi, self.cvt_as_raw, timeout=1.0, kind='ForceSensor.force')
         self.logger: Optional[Logger] = None
 
     def __repr__(self) -> str:
@@ -31,7 +31,7 @@ class Joint(ABC):
                  ) -> None:
         """Set up internal registers."""
         self.registers = {
-            reg: Register(cvt_as_usi, cvt_as_raw)
+            reg: Register(cvt_as_usi, cvt_as_raw, kind=f'Joint.{reg}')
             for reg, (cvt_as_usi, cvt_as_raw) in register_config.items()
         }
         self.logger: Optional[Logger] = None
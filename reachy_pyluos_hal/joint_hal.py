@@ -4,22 +4,23 @@ import time
 from typing import Dict, List, Optional, Tuple
 from logging import Logger
 
-from .reachy import Reachy
+from .reachy import JointSample, Reachy
 
 
 class JointLuos:
     """Implementation of the joint hal via serial communication to the luos boards."""
 
-    def __init__(self, config_name: str, logger: Logger) -> None:
-        """Create and start Reachy which wraps serial Luos GateClients."""
+    def __init__(self, config_name: str, logger: Logger, ports: Optional[List[str]] = None) -> None:
+        """Create and start Reachy which wraps serial Luos GateClients (looked for on ports if given)."""
         self.logger = logger
         self.config_name = config_name
+        self.ports = ports
 
     def __enter__(self):
         """Enter context handler."""
         while True:
             try:
-                self.reachy = Reachy(config_name=self.config_name, logger=self.logger)
+                self.reachy = Reachy(config_name=self.config_name, logger=self.logger, ports=self.ports)
                 self.reachy.__enter__()
                 return self
             except TimeoutError as e:
@@ -44,6 +45,14 @@ class JointLuos:
         """Return the current position (in rad) of the specified joints."""
         return self.reachy.get_joints_value(register='present_position', joint_names=names)
 
+    def get_latest_joint_positions(self, names: List[str], max_age: Optional[float] = None) -> List[JointSample]:
+        """Return the last received position (in rad) of the specified joints, with its timestamp and staleness, without blocking."""
+        return self.reachy.get_latest_joints_value(register='present_position', joint_names=names, max_age=max_age)
+
+    def get_latest_joint_temperatures(self, names: List[str], max_age: Optional[float] = None) -> List[JointSample]:
+        """Return the last received temperature (in C) of the specified joints, with its timestamp and staleness, without blocking."""
+        return self.reachy.get_latest_joints_value(register='temperature', joint_names=names, max_age=max_age)
+
     def get_joint_velocities(self, names: List[str]) -> Optional[List[float]]:
         """Return the current velocity (in rad/s) of the specified joints."""
         pass
@@ -108,6 +117,26 @@ class JointLuos:
             self.logger.warning(f'Set_goal_efforts failed with error {e}')
             return False
 
+    def set_goals(self,
+                  goal_positions: Optional[Dict[str, float]] = None,
+                  goal_velocities: Optional[Dict[str, float]] = None,
+                  goal_efforts: Optional[Dict[str, float]] = None,
+                  ) -> bool:
+        """Set new goal positions, velocities and efforts at once (sent in as few frames as possible)."""
+        try:
+            with self.reachy.command_batch() as batch:
+                for register, values in (
+                    ('goal_position', goal_positions),
+                    ('moving_speed', goal_velocities),
+                    ('torque_limit', goal_efforts),
+                ):
+                    if values:
+                        batch.set_joints_value(register, values)
+            return True
+        except (ValueError, TimeoutError) as e:
+            self.logger.warning(f'Set_goals failed with error {e}')
+            return False
+
     def set_goal_pids(self, goal_pids: Dict[str, Tuple[float, float, float]]) -> bool:
         """Set the new PIDs to the specified joints.
 
@@ -133,6 +162,10 @@ class JointLuos:
             self.logger.warning(f'Set_compliance failed with error {e}')
             return False
 
+    def get_metrics(self) -> Dict:
+        """Return a snapshot of the communication metrics (per gate traffic, round trip times per register, retries)."""
+        return self.reachy.get_metrics()
+
     def get_all_force_sensor_names(self) -> List[str]:
         """Return the names of all force sensors."""
         return list(self.reachy.force_sensors.keys())
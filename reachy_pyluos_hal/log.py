@@ -0,0 +1,37 @@
+"""Logging helpers for the communication hot paths."""
+
+import time
+
+from logging import Logger
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class RateLimiter:
+    """Emit a repeated log message at most once per period for each key.
+
+    Messages are formatted by the logger (lazy %-style arguments) and only if they are emitted.
+    The number of suppressed messages is appended to the next emitted one of the same key.
+    """
+
+    def __init__(self, period: float = 1.0) -> None:
+        """Set up the minimum period (in s) between two messages with the same key."""
+        self.period = period
+        # Time of the last emitted message and number of suppressed messages since, by key.
+        self._last: Dict[Hashable, Tuple[float, int]] = {}
+
+    def log(self, logger: Optional[Logger], level: int, key: Hashable, msg: str, *args):
+        """Log msg % args at level unless a message with the same key has been emitted less than period ago."""
+        if logger is None or not logger.isEnabledFor(level):
+            return
+
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last[0] < self.period:
+            self._last[key] = (last[0], last[1] + 1)
+            return
+
+        self._last[key] = (now, 0)
+        if last is not None and last[1] > 0:
+            msg += ' (%d similar messages suppressed)'
+            args += (last[1], )
+        logger.log(level, msg, *args)
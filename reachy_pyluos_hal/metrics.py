@@ -0,0 +1,153 @@
+"""Lightweight communication metrics (counters and latency histograms) exposed as snapshots."""
+
+import time
+
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class LatencyHistogram:
+    """Latency histogram with fixed logarithmic buckets (from 50us up to ~1.6s).
+
+    Recording is a bisect and a few additions, without any lock.
+    It is meant to be updated by a single thread (eg. a gate reader thread), concurrent updates may rarely be lost.
+    """
+
+    bounds = tuple(50e-6 * 2 ** i for i in range(16))
+
+    def __init__(self) -> None:
+        """Start with empty buckets."""
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration: float):
+        """Add a duration (in s) to the histogram."""
+        self.counts[bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile as the upper bound (in s) of the bucket containing it."""
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        cumulated = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict:
+        """Get the count, mean, p50, p99, max (in us) and the non empty buckets (by upper bound in us)."""
+        return {
+            'count': self.count,
+            'mean_us': 1e6 * self.total / self.count if self.count else 0.0,
+            'p50_us': 1e6 * self.quantile(0.5),
+            'p99_us': 1e6 * self.quantile(0.99),
+            'max_us': 1e6 * self.max,
+            'buckets': {
+                (f'{1e6 * bound:g}' if i < len(self.bounds) else 'inf'): count
+                for i, (bound, count) in enumerate(zip(self.bounds + (float('inf'), ), self.counts))
+                if count
+            },
+        }
+
+
+class GateMetrics:
+    """Traffic counters and message handling durations of a gate protocol."""
+
+    def __init__(self) -> None:
+        """Reset all counters."""
+        self.start = time.monotonic()
+        self.bytes_received = 0
+        self.frames_received = 0
+        self.corrupted_buffers = 0
+        self.bytes_sent = 0
+        self.frames_sent = 0
+        # Messages are sent from several threads (user, streaming...), unlike received ones (reader thread only).
+        self._sent_lock = Lock()
+        # Durations of the message handlers (ie. the callbacks run by the reader thread), by message type.
+        self.handler_durations: Dict[int, LatencyHistogram] = {}
+
+    def record_sent(self, nb_bytes: int):
+        """Count a frame of nb_bytes sent (from any thread)."""
+        with self._sent_lock:
+            self.bytes_sent += nb_bytes
+            self.frames_sent += 1
+
+    def record_handler_duration(self, msg_type: int, duration: float):
+        """Add the handling duration (in s) of a message of type msg_type."""
+        histogram = self.handler_durations.get(msg_type)
+        if histogram is None:
+            histogram = self.handler_durations[msg_type] = LatencyHistogram()
+        histogram.record(duration)
+
+    def snapshot(self, msg_type_names: Optional[Dict[int, str]] = None) -> Dict:
+        """Get the counters, their average rate (per s) since start and the handler durations."""
+        uptime = time.monotonic() - self.start
+        names = msg_type_names or {}
+
+        return {
+            'uptime': uptime,
+            'bytes_received': self.bytes_received,
+            'frames_received': self.frames_received,
+            'corrupted_buffers': self.corrupted_buffers,
+            'bytes_sent': self.bytes_sent,
+            'frames_sent': self.frames_sent,
+            'bytes_received_per_s': self.bytes_received / uptime if uptime > 0 else 0.0,
+            'frames_received_per_s': self.frames_received / uptime if uptime > 0 else 0.0,
+            'handler_durations': {
+                names.get(msg_type, str(msg_type)): histogram.snapshot()
+                for msg_type, histogram in list(self.handler_durations.items())
+            },
+        }
+
+
+class RoundTripTracker:
+    """Measure the round trip time between requests and their answers, per register.
+
+    Each request is identified by a key (eg. (device, id, register address)).
+    Only the last request of a key is kept, so retries are measured from the last resend.
+    Requests are recorded by the user threads and answers by the gate reader threads, both under a lock.
+    """
+
+    def __init__(self) -> None:
+        """Start without pending requests."""
+        self._pending: Dict[Hashable, Tuple[str, float]] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = Lock()
+
+    def sent(self, register: str, key: Hashable):
+        """Record a request for register."""
+        sent_at = time.perf_counter()
+        with self._lock:
+            self._pending[key] = (register, sent_at)
+
+    def received(self, key: Hashable):
+        """Record an answer, measuring its round trip time if it was requested."""
+        received_at = time.perf_counter()
+        with self._lock:
+            request = self._pending.pop(key, None)
+            if request is None:
+                return
+
+            register, sent_at = request
+            histogram = self.histograms.get(register)
+            if histogram is None:
+                histogram = self.histograms[register] = LatencyHistogram()
+            histogram.record(received_at - sent_at)
+
+    def snapshot(self) -> Dict:
+        """Get the round trip histograms by register and the number of requests still waiting for their answer."""
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'registers': {register: histogram.snapshot() for register, histogram in self.histograms.items()},
+            }
@@ -67,6 +67,7 @@ class OrbitaActuator:
         self.logger: Optional[Logger] = None
 
         self.kin_model = OrbitaKinematicModel(R0=R0)
+        self._zero_offset_rotation = R.from_euler('z', zero_offset)
 
     def __str__(self) -> str:
         """Get Orbita Actuator string representation."""
@@ -114,16 +115,19 @@ class OrbitaActuator:
 
     def forward(self, disks: Tuple[float, float, float]) -> Tuple[float, float, float]:
         """Use KNN regression to compute an approximate forward kinematics."""
-        disks = [d - self.zero_offset for d in disks]
+        return self.forward_batch(np.array(disks).reshape(1, 3))[0]
 
-        q = self.kin_model.forward_kinematics(disks)
-        rpy = R.from_quat(q).as_euler('xyz')
+    def forward_batch(self, disks: np.ndarray) -> np.ndarray:
+        """Compute the forward kinematics of (N, 3) disk positions and return (N, 3) roll, pitch, yaw.
 
-        rpy[0, 2] = rpy.ravel()[2] + self.zero_offset
+        Can be used to convert several samples at once, eg. a logged disk trajectory.
+        """
+        disks = np.asarray(disks, dtype=float).reshape(-1, 3) - self.zero_offset
 
-        rpy = R.from_euler('xyz', rpy).as_euler('XYZ')
+        q = self.kin_model.forward_kinematics_batch(disks)
 
-        return rpy.ravel()
+        # Adding the zero offset to the extrinsic yaw is a rotation around the fixed z axis.
+        return (self._zero_offset_rotation * R.from_quat(q)).as_euler('XYZ')
 
     def inverse(self, roll_pitch_yaw: Tuple[float, float, float]) -> Tuple[float, float, float]:
         """Compute analytical IK from roll, pitch, yaw and return the disk position (in radians)."""
@@ -132,6 +136,14 @@ class OrbitaActuator:
 
         return disks
 
+    def inverse_batch(self, roll_pitch_yaw: np.ndarray) -> np.ndarray:
+        """Compute analytical IK of a (N, 3) roll, pitch, yaw trajectory and return (N, 3) disk positions (in radians).
+
+        The trajectory continuity is kept from the last computed position, as if each sample was sent one after the other.
+        """
+        q = R.from_euler('xyz', np.asarray(roll_pitch_yaw).reshape(-1, 3)).as_quat()
+        return self.kin_model.inverse_kinematics_batch(q)
+
 
 class OrbitaDisk:
     """Single Orbita disk abstraction."""
@@ -140,21 +152,21 @@ class OrbitaDisk:
         """Create all Orbita Register."""
         self.name = name
 
-        self.present_position = Register(self.position_as_usi, self.position_as_raw)
-        self.goal_position = Register(self.position_as_usi, self.position_as_raw)
-        self.torque_limit = Register(self.max_torque_as_usi, self.max_torque_as_raw)
-        self.temperature = Register(self.temperature_as_usi, self.temperature_as_raw)
-        self.temperature_shutdown = Register(self.temperature_as_usi, self.temperature_as_raw)
-        self.torque_enable = Register(self.torque_enable_as_usi, self.torque_enable_as_raw)
-        self.angle_limit = Register(self.limits_as_usi, self.limits_as_raw)
-        self.pid = Register(self.gain_as_usi, self.gain_as_raw)
-        self.zero = Register(self.encoder_position_as_usi, self.encoder_position_as_raw)
-        self.absolute_position = Register(self.encoder_position_as_usi, self.encoder_position_as_raw)
-        self.recalibrate = Register(self.state_as_usi, self.state_as_raw)
-        self.magnetic_quality = Register(self.quality_as_usi, self.quality_as_raw)
-        self.fan_state = Register(self.state_as_usi, self.state_as_raw)
-        self.fan_trigger_temperature_threshold = Register(self.temperature_as_usi, self.temperature_as_raw)
-        self.position_pub_period = Register(self.period_as_usi, self.period_as_raw)
+        self.present_position = Register(self.position_as_usi, self.position_as_raw, kind='OrbitaDisk.present_position')
+        self.goal_position = Register(self.position_as_usi, self.position_as_raw, kind='OrbitaDisk.goal_position')
+        self.torque_limit = Register(self.max_torque_as_usi, self.max_torque_as_raw, kind='OrbitaDisk.torque_limit')
+        self.temperature = Register(self.temperature_as_usi, self.temperature_as_raw, kind='OrbitaDisk.temperature')
+        self.temperature_shutdown = Register(self.temperature_as_usi, self.temperature_as_raw, kind='OrbitaDisk.temperature_shutdown')
+        self.torque_enable = Register(self.torque_enable_as_usi, self.torque_enable_as_raw, kind='OrbitaDisk.torque_enable')
+        self.angle_limit = Register(self.limits_as_usi, self.limits_as_raw, kind='OrbitaDisk.angle_limit')
+        self.pid = Register(self.gain_as_usi, self.gain_as_raw, kind='OrbitaDisk.pid')
+        self.zero = Register(self.encoder_position_as_usi, self.encoder_position_as_raw, kind='OrbitaDisk.zero')
+        self.absolute_position = Register(self.encoder_position_as_usi, self.encoder_position_as_raw, kind='OrbitaDisk.absolute_position')
+        self.recalibrate = Register(self.state_as_usi, self.state_as_raw, kind='OrbitaDisk.recalibrate')
+        self.magnetic_quality = Register(self.quality_as_usi, self.quality_as_raw, kind='OrbitaDisk.magnetic_quality')
+        self.fan_state = Register(self.state_as_usi, self.state_as_raw, kind='OrbitaDisk.fan_state')
+        self.fan_trigger_temperature_threshold = Register(self.temperature_as_usi, self.temperature_as_raw, kind='OrbitaDisk.fan_trigger_temperature_threshold')
+        self.position_pub_period = Register(self.period_as_usi, self.period_as_raw, kind='OrbitaDisk.position_pub_period')
 
         self.resolution = resolution
         self.reduction = reduction
@@ -1,21 +1,137 @@
 """Orbita kinematic theoretical model."""
-import pickle
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, List, Tuple, Union, TYPE_CHECKING
 
 import numpy as np
 from numpy import linalg as LA
 
-from pyquaternion import Quaternion
-
 from scipy.spatial.transform import Rotation as R
 
+if TYPE_CHECKING:
+    from pyquaternion import Quaternion
+
 
 def rot(axis, deg):
     """Compute 3D rotation matrix given euler rotation."""
     return R.from_euler(axis, np.deg2rad(deg)).as_matrix()
 
 
+class MLPForwardModel:
+    """NumPy-only inference of the multi-layer perceptron used as forward kinematic model.
+
+    The weights are loaded from a compact .npz file (see reachy-export-kinematic-model),
+    so neither scikit-learn nor unpickling are needed at runtime.
+    """
+
+    activations = {
+        'identity': lambda x: x,
+        'relu': lambda x: np.maximum(x, 0, out=x),
+        'tanh': np.tanh,
+        'logistic': lambda x: 1 / (1 + np.exp(-x)),
+    }
+
+    def __init__(self,
+                 coefs: List[np.ndarray], intercepts: List[np.ndarray],
+                 activation: str, out_activation: str,
+                 ) -> None:
+        """Set up the layers weights and activations."""
+        if activation not in self.activations or out_activation not in self.activations:
+            raise ValueError(f'Unsupported activation ({activation}, {out_activation})!')
+
+        self.coefs = [np.asarray(c, dtype=float) for c in coefs]
+        self.intercepts = [np.asarray(b, dtype=float) for b in intercepts]
+        self.activation = activation
+        self.out_activation = out_activation
+
+    @classmethod
+    def from_estimator(cls, estimator) -> 'MLPForwardModel':
+        """Extract the weights of a fitted scikit-learn MLPRegressor."""
+        return cls(estimator.coefs_, estimator.intercepts_, estimator.activation, estimator.out_activation_)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'MLPForwardModel':
+        """Load weights from a .npz file."""
+        with np.load(path) as data:
+            nb_layers = int(data['nb_layers'])
+            return cls(
+                coefs=[data[f'coef_{i}'] for i in range(nb_layers)],
+                intercepts=[data[f'intercept_{i}'] for i in range(nb_layers)],
+                activation=str(data['activation']),
+                out_activation=str(data['out_activation']),
+            )
+
+    def save(self, path: Union[str, Path]):
+        """Save weights to a .npz file."""
+        layers: Dict[str, np.ndarray] = {}
+        for i, (coef, intercept) in enumerate(zip(self.coefs, self.intercepts)):
+            layers[f'coef_{i}'] = coef
+            layers[f'intercept_{i}'] = intercept
+
+        np.savez(
+            path,
+            nb_layers=len(self.coefs),
+            activation=self.activation,
+            out_activation=self.out_activation,
+            **layers,
+        )
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Evaluate the network on (N, nb_features) inputs."""
+        activation = self.activations[self.activation]
+
+        x = np.asarray(X, dtype=float)
+        for coef, intercept in zip(self.coefs[:-1], self.intercepts[:-1]):
+            x = activation(x @ coef + intercept)
+
+        return self.activations[self.out_activation](x @ self.coefs[-1] + self.intercepts[-1])
+
+
+@lru_cache(maxsize=None)
+def load_forward_model(model_dir: Path):
+    """Load the forward kinematic model, from its .npz weights or as a fallback from the original pickled estimator.
+
+    The model is immutable, so it is loaded once per process and shared by all OrbitaKinematicModel.
+    """
+    npz_path = model_dir / 'mlpreg.npz'
+    if npz_path.exists():
+        return MLPForwardModel.load(npz_path)
+
+    # Requires scikit-learn.
+    import pickle
+    with open(model_dir / 'mlpreg.obj', 'rb') as f:
+        return pickle.load(f)
+
+
+def quat_multiply(q1: np.ndarray, q2: np.ndarray) -> np.ndarray:
+    """Compute the (broadcasted) Hamilton product of (..., 4) quaternions (w, x, y, z)."""
+    w1, x1, y1, z1 = q1[..., 0], q1[..., 1], q1[..., 2], q1[..., 3]
+    w2, x2, y2, z2 = q2[..., 0], q2[..., 1], q2[..., 2], q2[..., 3]
+    return np.stack((
+        w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+        w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+        w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+    ), axis=-1)
+
+
+def quat_rotate(q: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """Rotate the 3D vector v by the (..., 4) unit quaternions (w, x, y, z)."""
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    vx, vy, vz = v
+
+    # t = 2 * (u x v), v' = v + w * t + u x t
+    tx = 2 * (y * vz - z * vy)
+    ty = 2 * (z * vx - x * vz)
+    tz = 2 * (x * vy - y * vx)
+
+    return np.stack((
+        vx + w * tx + y * tz - z * ty,
+        vy + w * ty + z * tx - x * tz,
+        vz + w * tz + x * ty - y * tx,
+    ), axis=-1)
+
+
 class OrbitaKinematicModel(object):
     """
     Orbita theoretical kinematic model.
@@ -43,30 +159,126 @@ class OrbitaKinematicModel(object):
         self.R0 = np.array(R0)
         self.x0, self.y0, self.z0 = self.R0
 
-        self.x0_quat = Quaternion(0, self.x0[0], self.x0[1], self.x0[2])
-        self.y0_quat = Quaternion(0, self.y0[0], self.y0[1], self.y0[2])
-        self.z0_quat = Quaternion(0, self.z0[0], self.z0[1], self.z0[2])
+        self._disks_offset_quat = np.array([
+            [1.0, 0.0, 0.0, 0.0],
+            np.concatenate(([np.cos(np.pi / 3)], np.sin(np.pi / 3) * self.z0)),
+            np.concatenate(([np.cos(-np.pi / 3)], np.sin(-np.pi / 3) * self.z0)),
+        ])
 
         self.last_angles = np.array([0, 2 * np.pi / 3, -2 * np.pi / 3])
         self.offset = np.array([0, 0, 0])
 
+        # Shared by all instances, only R0 and the continuity state (last_angles, offset) are per actuator.
         import reachy_pyluos_hal
-        path_model = Path(reachy_pyluos_hal.__file__).parent / 'mlpreg.obj'
-
-        with open(path_model, 'rb') as f:
-            self.model = pickle.load(f)
+        self.model = load_forward_model(Path(reachy_pyluos_hal.__file__).parent.resolve())
 
     def inverse_kinematics(self, q: Tuple[float, float, float, float]) -> Tuple[float, float, float]:
         """Compute analytical IK from roll, pitch, yaw and return the disk position (in radians)."""
-        return np.deg2rad(self.get_angles_from_quaternion(q[3], q[0], q[1], q[2]))
+        return self.inverse_kinematics_batch(np.reshape(q, (1, 4)))[0]
+
+    def inverse_kinematics_batch(self, q: np.ndarray) -> np.ndarray:
+        """Compute analytical IK of (N, 4) quaternions (x, y, z, w) and return (N, 3) disk positions (in radians).
+
+        Same model as get_angles_from_quaternion, evaluated with numpy array math for the whole batch.
+        Samples are considered as a trajectory: each one is unwrapped against the previous one
+        (starting from last_angles), which is then updated to the last sample.
+        """
+        q = np.asarray(q, dtype=float).reshape(-1, 4)
+        quat = np.concatenate((q[:, 3:], q[:, :3]), axis=1)
+        quat /= LA.norm(quat, axis=1, keepdims=True)
+
+        # Platform orientation for each disk: the goal rotated by 0°, +120° and -120° around z0.
+        disks_quat = quat_multiply(quat[:, np.newaxis, :], self._disks_offset_quat)
+        X = quat_rotate(disks_quat, self.x0)
+        Z = quat_rotate(disks_quat, self.z0)
+
+        angles = self._eq_batch(X, Z)
+        angles = self._unwrap(angles)
+
+        return angles + np.array([0, -2 * np.pi / 3, 2 * np.pi / 3])
+
+    def _eq_batch(self, X: np.ndarray, Z: np.ndarray) -> np.ndarray:
+        """Vectorized version of _eq, returns the q1 angles of (..., 3) X and Z frame vectors."""
+        radius = self.R
+        Pc = self.Pc_z
+        C = self.Cp_z
+
+        d1 = (
+            radius**2 * X[..., 2]**2 +
+            radius**2 * Z[..., 2]**2 -
+            C[2]**2 + 2 * C[2] * Pc[2] - Pc[2]**2
+        )
+        if np.any(d1 < 0):
+            raise ValueError('math domain error')
+
+        d1 = np.sqrt(d1)
+
+        x11 = radius * X[..., 2] - d1
+        x12 = radius * X[..., 2] + d1
+        x2 = radius * Z[..., 2] + C[2] - Pc[2]
+
+        sol1 = 2 * np.arctan2(x11, x2)
+        sol2 = 2 * np.arctan2(x12, x2)
+
+        q3 = np.where((sol1 >= 0) & (sol1 <= np.pi), sol1, sol2)
+
+        return np.arctan2(
+            Z[..., 1] * np.cos(q3) + X[..., 1] * np.sin(q3),
+            Z[..., 0] * np.cos(q3) + X[..., 0] * np.sin(q3),
+        )
+
+    def _unwrap(self, angles: np.ndarray) -> np.ndarray:
+        """Add or remove 2*pi radians on discontinuities, depending on the sign of the previous angles.
+
+        Each sample is shifted by -2*pi, 0 or 2*pi depending on the shift of the unwrapped previous one.
+        So the shift transition of each sample is computed for the 3 possible previous shifts,
+        and the transitions are composed over the samples with a prefix scan (log2(N) vectorized steps).
+        The first sample only depends on last_angles, it is unwrapped directly (eg. for inverse_kinematics).
+        """
+        if len(angles) == 0:
+            return angles
+
+        last_angles = np.array(self.last_angles, dtype=float)
+        first = angles[0] + (np.abs(angles[0] - last_angles) >= 2.96) * np.sign(last_angles) * 2 * np.pi
+        if len(angles) == 1:
+            self.last_angles = first
+            return first[np.newaxis]
+
+        shifts = np.array([-1.0, 0.0, 1.0])
+        angles = angles[1:]
+
+        # Previous unwrapped angle of each (sample, disk) for each possible shift of the previous sample.
+        previous = np.empty(angles.shape + (3, ))
+        previous[0] = first[:, np.newaxis]
+        previous[1:] = angles[:-1, :, np.newaxis] + shifts * 2 * np.pi
+
+        jump = np.abs(angles[..., np.newaxis] - previous) >= 2.96
+        # Index (in shifts) of the shift of each (sample, disk) for each previous shift index.
+        transitions = np.where(jump, np.sign(previous).astype(np.intp) + 1, 1)
+
+        step = 1
+        while step < len(angles):
+            transitions[step:] = np.take_along_axis(transitions[step:], transitions[:-step], axis=2)
+            step *= 2
+
+        # The first transition does not depend on a previous shift, so neither do the composed ones.
+        unwrapped = np.concatenate((first[np.newaxis], angles + shifts[transitions[..., 1]] * 2 * np.pi))
+
+        self.last_angles = unwrapped[-1]
+        return unwrapped
 
     def forward_kinematics(self, disks: Tuple[float, float, float]) -> Tuple[float, float, float, float]:
         """Use KNN regression to compute an approximate forward kinematics given the disk position (in radians)."""
-        rpy = self.model.predict(np.array(disks).reshape(1, -1))
-        M1 = R.from_euler('XYZ', rpy).as_matrix()
-        M = np.dot(M1, self.R0)
-        q = R.from_matrix(M).as_quat()
-        return q
+        return self.forward_kinematics_batch(np.array(disks).reshape(1, -1))
+
+    def forward_kinematics_batch(self, disks: np.ndarray) -> np.ndarray:
+        """Compute the forward kinematics of (N, 3) disk positions (in radians) and return (N, 4) quaternions (x, y, z, w).
+
+        The regression and rotation conversions are run once for the whole batch.
+        """
+        rpy = self.model.predict(np.asarray(disks, dtype=float).reshape(-1, 3))
+        M = R.from_euler('XYZ', rpy).as_matrix() @ self.R0
+        return R.from_matrix(M).as_quat()
 
     def get_new_frame_from_vector(self, vector: np.ndarray, angle: float = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
@@ -100,41 +312,24 @@ class OrbitaKinematicModel(object):
         alpha = np.arccos(np.vdot(self.z0, goal_norm))  # Angle of rotation
 
         if alpha == 0:
-            v = Quaternion(0.0, 0.0, 0.0, 1.0)
+            v = np.array([0.0, 0.0, 1.0])
 
-        else:  # Vector of rotation as a quaternion
+        else:  # Vector of rotation
             # VECTOR AND ANGLE OF ROTATION
             vec = np.cross(self.z0, goal_norm)
-            vector_norm = [
-                i / LA.norm(vec) for i in vec
-            ]
-            v = Quaternion(0.0, vector_norm[0], vector_norm[1], vector_norm[2])
+            v = vec / LA.norm(vec)
 
         # QUATERNION OF ROTATION ###
-        w1 = np.cos(alpha / 2.0)
-        x1 = np.sin(alpha / 2.0) * v.x
-        y1 = np.sin(alpha / 2.0) * v.y
-        z1 = np.sin(alpha / 2.0) * v.z
-
-        q1 = Quaternion(w1, x1, y1, z1)  # 1st rotation quaternion
+        q1 = np.concatenate(([np.cos(alpha / 2.0)], np.sin(alpha / 2.0) * v))  # 1st rotation quaternion
 
-        z_prime = q1 * self.z0_quat * q1.inverse
-
-        w2 = np.cos(beta / 2.0)
-        x2 = np.sin(beta / 2.0) * z_prime.x
-        y2 = np.sin(beta / 2.0) * z_prime.y
-        z2 = np.sin(beta / 2.0) * z_prime.z
+        z_prime = quat_rotate(q1, self.z0)
 
         # Quaternion of the rotation on new z axis
-        q2 = Quaternion(w2, x2, y2, z2)
-
-        new_z = q2 * z_prime * q2.inverse  # Final Z
-        new_x = q2 * (q1 * self.x0_quat * q1.inverse) * q2.inverse  # Final X
-        new_y = q2 * (q1 * self.y0_quat * q1.inverse) * q2.inverse  # Final Y
+        q2 = np.concatenate(([np.cos(beta / 2.0)], np.sin(beta / 2.0) * z_prime))
 
-        X = np.array([new_x.x, new_x.y, new_x.z])
-        Y = np.array([new_y.x, new_y.y, new_y.z])
-        Z = np.array([new_z.x, new_z.y, new_z.z])
+        Z = quat_rotate(q2, z_prime)  # Final Z
+        X = quat_rotate(q2, quat_rotate(q1, self.x0))  # Final X
+        Y = quat_rotate(q2, quat_rotate(q1, self.y0))  # Final Y
 
         return X, Y, Z
 
@@ -268,21 +463,16 @@ class OrbitaKinematicModel(object):
             New Z vector of the platform's frame
 
         """
-        q1 = Quaternion(qw, qx, qy, qz)
-        q1_inv = q1.inverse
+        q1 = np.array([qw, qx, qy, qz], dtype=float)
+        q1 /= LA.norm(q1)
 
-        new_z = q1 * self.z0_quat * q1_inv  # Final Z
-        new_x = q1 * self.x0_quat * q1_inv  # Final X
-        new_y = q1 * self.y0_quat * q1_inv  # Final Y
-
-        X = np.array([new_x.x, new_x.y, new_x.z])
-        Y = np.array([new_y.x, new_y.y, new_y.z])
-        Z = np.array([new_z.x, new_z.y, new_z.z])
+        Z = quat_rotate(q1, self.z0)  # Final Z
+        X = quat_rotate(q1, self.x0)  # Final X
+        Y = quat_rotate(q1, self.y0)  # Final Y
 
         return X, Y, Z
 
-    # FIXME: too complex
-    def get_angles_from_quaternion(self, qw: float, qx: float, qy: float, qz: float) -> Tuple[float, float, float]:  # noqa: C901
+    def get_angles_from_quaternion(self, qw: float, qx: float, qy: float, qz: float) -> Tuple[float, float, float]:
         """Compute the angles of the disks needed to rotate the platform to the new frame, using the get_new_frame_from_vector function.
 
         The expression of q3 and q1 angles are found with the notebook
@@ -307,62 +497,17 @@ class OrbitaKinematicModel(object):
             angle of the bottom disk in degrees
 
         """
-        def get_frame(q):
-            return self.get_new_frame_from_quaternion(q.w, q.x, q.y, q.z)
-
-        quat = Quaternion(qw, qx, qy, qz)
-        q31, q11 = self._eq(*get_frame(quat))
-
-        # Find q32 and q12
-        # Add an offset of +120°
-        w_offset = np.cos(2 * np.pi / 6.0)
-        x_offset = np.sin(2 * np.pi / 6.0) * self.z0_quat.x
-        y_offset = np.sin(2 * np.pi / 6.0) * self.z0_quat.y
-        z_offset = np.sin(2 * np.pi / 6.0) * self.z0_quat.z
-        q_offset = Quaternion(w_offset, x_offset, y_offset, z_offset)
-        Q = quat * q_offset
-        q32, q12 = self._eq(*get_frame(Q))
-
-        # Find q33 and q13
-        # Add an offset of -120°
-        w_offset = np.cos(-2 * np.pi / 6.0)
-        x_offset = np.sin(-2 * np.pi / 6.0) * self.z0_quat.x
-        y_offset = np.sin(-2 * np.pi / 6.0) * self.z0_quat.y
-        z_offset = np.sin(-2 * np.pi / 6.0) * self.z0_quat.z
-        q_offset = Quaternion(w_offset, x_offset, y_offset, z_offset)
-        Q = quat * q_offset
-        q33, q13 = self._eq(*get_frame(Q))
-
-        last_angles = self.last_angles
-
-        # If there are discontinuities, add or remove 2*pi radians depending on
-        # The sign of the last angles
-        if (abs(q11 - last_angles[0]) >= 2.96):
-            if last_angles[0] > 0:
-                q11 += 2 * np.pi
-            elif last_angles[0] < 0:
-                q11 -= 2 * np.pi
-        if (abs(q12 - last_angles[1]) >= 2.96):
-            if last_angles[1] > 0:
-                q12 += 2 * np.pi
-            elif last_angles[1] < 0:
-                q12 -= 2 * np.pi
-        if (abs(q13 - last_angles[2]) >= 2.96):
-            if last_angles[2] > 0:
-                q13 += 2 * np.pi
-            elif last_angles[2] < 0:
-                q13 -= 2 * np.pi
+        disks = self.inverse_kinematics_batch(np.array([[qx, qy, qz, qw]]))[0]
+        q11, q12, q13 = np.rad2deg(disks)
+        return q11, q12, q13
 
-        self.last_angles = np.array([q11, q12, q13])
+    def find_quaternion_transform(self, vect_origin: np.ndarray, vect_target: np.ndarray) -> 'Quaternion':
+        """Find the quaternion to transform the vector origin to the target one.
 
-        return (
-            np.rad2deg(q11),
-            np.rad2deg(q12) - 120,
-            np.rad2deg(q13) + 120,
-        )
+        It is returned as a pyquaternion Quaternion, only imported here as nothing else depends on it.
+        """
+        from pyquaternion import Quaternion
 
-    def find_quaternion_transform(self, vect_origin: np.ndarray, vect_target: np.ndarray) -> Quaternion:
-        """Find the quaternion to transform the vector origin to the target one."""
         vo = np.array(vect_origin)
         if np.any(vo):
             vo = vo / LA.norm(vo)
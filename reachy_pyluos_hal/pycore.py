@@ -4,19 +4,45 @@ import sys
 import time
 import struct
 
-from logging import Logger
+from logging import DEBUG, WARNING, Logger
 from collections import defaultdict, namedtuple
-from threading import Event, Thread
-from typing import Dict, Iterable, List, Optional, Type, Tuple
+from functools import lru_cache
+from threading import Condition, Event, Thread
+from typing import Callable, Dict, List, Optional, Type, Tuple
 
-from serial import Serial
+from serial import serial_for_url
 from serial.threaded import Protocol, ReaderThread
 
+from .log import RateLimiter
+from .metrics import GateMetrics
 from .orbita import OrbitaRegister
+from .recorder import TrafficRecorder
 
 LuosContainer = namedtuple('LuosContainer', ('id', 'alias', 'type'))
 
 
+@lru_cache(maxsize=None)
+def dxl_pub_data_struct(val_size: int, nb_ids: int) -> struct.Struct:
+    """Get the precompiled decoder for nb_ids (ID, ERR, VAL) blocks of a dxl pub data message."""
+    return struct.Struct('<' + f'BH{val_size}s' * nb_ids)
+
+
+@lru_cache(maxsize=None)
+def load_pub_data_struct(nb_sensors: int) -> struct.Struct:
+    """Get the precompiled decoder for nb_sensors (ID, VAL) blocks of a load pub data message."""
+    return struct.Struct('<' + 'B4s' * nb_sensors)
+
+
+@lru_cache(maxsize=None)
+def msg_type_names() -> Dict[int, str]:
+    """Get the name of each message type (eg. {15: 'dxl_pub_data'})."""
+    names = {}
+    for attr in dir(GateProtocol):
+        if attr.startswith('MSG_'):
+            names[getattr(GateProtocol, attr)] = attr.lower().replace('msg_type_', '').replace('msg_', '')
+    return names
+
+
 class GateProtocol(Protocol):
     """Serial communication protocol with Reachy Luos Gate."""
 
@@ -48,6 +74,10 @@ class GateProtocol(Protocol):
     DXL_BROADCAST_ID = 0xFE
 
     logger: Optional[Logger] = None
+    # Maximum number of detection requests waiting for their answer at the same time.
+    detection_window = 8
+    # Measure the duration of each message handler, off by default as it costs two clock reads and a histogram update per received frame.
+    measure_handler_durations = False
     header = bytes([255, 255])
 
     def __init__(self, timeout: float = 0.5) -> None:
@@ -56,8 +86,26 @@ class GateProtocol(Protocol):
         self.buffer = bytearray()
         self.timeout = timeout
 
-        self._nodes: Dict[int, List[int]] = {}
+        self._nodes: Dict[int, Optional[List[int]]] = {}
+        self._nodes_received = False
         self._containers: Dict[int, Tuple[str, str]] = {}
+        self._detection_cond = Condition()
+        self.detection_timings: Dict[str, float] = {}
+        self.metrics = GateMetrics()
+        self.recorder: Optional[TrafficRecorder] = None
+        # Repeated warnings (eg. corrupted buffers) are emitted at most once per period.
+        self.log_rate_limiter = RateLimiter()
+
+        self._msg_handlers: Dict[int, Callable[[bytes], None]] = {
+            self.MSG_MODULE_ASSERT: self._on_assert,
+            self.MSG_TYPE_DXL_PUB_DATA: self._on_dxl_pub_data,
+            self.MSG_TYPE_LOAD_PUB_DATA: self._on_load_pub_data,
+            self.MSG_TYPE_ORBITA_PUB_DATA: self._on_orbita_pub_data,
+            self.MSG_TYPE_FAN_PUB_DATA: self._on_fan_pub_data,
+            self.MSG_DETECTION_PUB_NODES: self._on_detection_pub_nodes,
+            self.MSG_DETECTION_PUB_CONTAINERS: self._on_detection_pub_containers,
+            self.MSG_DETECTION_PUB_CONTAINER_INFO: self._on_detection_pub_container_info,
+        }
 
     def connection_made(self, transport: ReaderThread):
         """Handle connection made."""
@@ -79,14 +127,19 @@ class GateProtocol(Protocol):
 
     def data_received(self, data: bytearray):
         """Handle new received data."""
+        if self.recorder is not None:
+            self.recorder.record_rx(data)
         self.buffer.extend(data)
 
-        for msg in self.pop_messages():
+        msgs = self.pop_messages()
+        self.metrics.bytes_received += len(data)
+        self.metrics.frames_received += len(msgs)
+        for msg in msgs:
             try:
                 self.handle_message(msg)
             except Exception:
                 if self.logger is not None:
-                    self.logger.exception(f'Error happened during handling of corrupted message {msg}')
+                    self.logger.exception(f'Error happened during handling of corrupted message {bytes(msg)}')
                 else:
                     raise
 
@@ -95,39 +148,107 @@ class GateProtocol(Protocol):
         assert (self.transport is not None)
 
         data = self.header + bytes([len(payload)]) + payload
-        if self.logger is not None:
-            self.logger.debug(f'Sending {list(data)}')
+        if self.logger is not None and self.logger.isEnabledFor(DEBUG):
+            self.logger.debug('Sending %s', list(data))
         self.transport.write(data)
+        if self.recorder is not None:
+            self.recorder.record_tx(data)
+        self.metrics.record_sent(len(data))
 
     def send_detection_run_signal(self) -> None:
         """Send request to run a Luos detection from the gate."""
         self.send_msg(bytes([self.MSG_DETECTION_RUN]))
 
     def send_detection_signal(self) -> Dict[int, List[LuosContainer]]:
-        """Send request to the gate to retrieve all nodes/containers info."""
-        self._waiting_for_nodes = Event()
-        self.send_msg(bytes([self.MSG_DETECTION_GET_NODES]))
-
-        if not self._waiting_for_nodes.wait(self.timeout):
-            raise TimeoutError
-        for id, evt in self._waiting_for_containers.items():
-            if not evt.wait(self.timeout):
-                raise TimeoutError
+        """Send request to the gate to retrieve all nodes/containers info.
+
+        Requests are sent from the calling thread, keeping at most detection_window of them outstanding,
+        each of them must be answered within timeout of being sent (so the whole detection scales with the number of nodes and containers).
+        The duration of each phase is stored in detection_timings.
+        """
+        start = time.monotonic()
+
+        with self._detection_cond:
+            self._nodes = {}
+            self._containers = {}
+            self._nodes_received = False
+            self.send_msg(bytes([self.MSG_DETECTION_GET_NODES]))
+            self._wait_detection(lambda: self._nodes_received, start + self.timeout)
+        nodes_received = time.monotonic()
+
+        node_ids = list(self._nodes.keys())
+        self._send_detection_requests(self.MSG_DETECTION_GET_CONTAINERS, node_ids, lambda id: self._nodes[id] is not None)
+        containers_received = time.monotonic()
+
+        container_ids = [id for node_id in node_ids for id in self._nodes[node_id]]
+        self._send_detection_requests(self.MSG_DETECTION_GET_CONTAINER_INFO, container_ids, lambda id: id in self._containers)
+        end = time.monotonic()
+
+        self.detection_timings = {
+            'nodes': nodes_received - start,
+            'containers': containers_received - nodes_received,
+            'container_info': end - containers_received,
+            'total': end - start,
+        }
+        if self.logger is not None:
+            self.logger.info(
+                f'Detected {len(container_ids)} containers on {len(node_ids)} nodes in {1000 * (end - start):.1f}ms '
+                f'({", ".join(f"{phase}={1000 * dt:.1f}ms" for phase, dt in self.detection_timings.items() if phase != "total")}).'
+            )
 
         devices = defaultdict(list)
-
-        for id, (alias, type) in self._containers.items():
-            for node_id, containers in self._nodes.items():
-                if id in containers:
-                    devices[node_id].append(LuosContainer(id, alias, type))
-                    break
+        for node_id in node_ids:
+            for id in self._nodes[node_id]:
+                alias, type = self._containers[id]
+                devices[node_id].append(LuosContainer(id, alias, type))
 
         return dict(devices)
 
+    def send_container_info_request(self, container_id: int) -> Tuple[str, str]:
+        """Request the info of a single container [MSG_DETECTION_GET_CONTAINER_INFO, ID] and wait for its (alias, type)."""
+        return self.send_container_info_requests([container_id])[container_id]
+
+    def send_container_info_requests(self, container_ids: List[int]) -> Dict[int, Tuple[str, str]]:
+        """Request the info of the given containers (keeping at most detection_window outstanding) and wait for their (alias, type)."""
+        for id in container_ids:
+            self._containers.pop(id, None)
+        self._send_detection_requests(self.MSG_DETECTION_GET_CONTAINER_INFO, container_ids, lambda id: id in self._containers)
+        return {id: self._containers[id] for id in container_ids}
+
+    def _send_detection_requests(self, msg_type: int, ids: List[int], is_answered: Callable[[int], bool]):
+        """Send a [MSG_TYPE, ID] request for each id, with at most detection_window outstanding, and wait for all answers.
+
+        Raises a TimeoutError if a request is not answered within timeout of being sent.
+        """
+        pending = list(reversed(ids))
+        # Deadline of each outstanding request (in sending order, so the first one is the earliest).
+        outstanding: Dict[int, float] = {}
+
+        with self._detection_cond:
+            while True:
+                outstanding = {id: deadline for id, deadline in outstanding.items() if not is_answered(id)}
+                while pending and len(outstanding) < self.detection_window:
+                    id = pending.pop()
+                    outstanding[id] = time.monotonic() + self.timeout
+                    self.send_msg(bytes([msg_type, id]))
+
+                if not outstanding:
+                    return
+                self._wait_detection(lambda: any(is_answered(id) for id in outstanding), next(iter(outstanding.values())))
+
+    def _wait_detection(self, predicate: Callable[[], bool], deadline: float):
+        """Wait (with the detection condition held) for a detection answer, raises TimeoutError after deadline."""
+        if not self._detection_cond.wait_for(predicate, max(0.0, deadline - time.monotonic())):
+            raise TimeoutError
+
     def send_keep_alive(self):
         """Send keep alive message [MSG_TYPE_KEEP_ALIVE]."""
         self.send_msg(bytes([self.MSG_TYPE_KEEP_ALIVE]))
 
+    def send_dxl_pub_period(self, period: int):
+        """Send the dxl present position publication period (in ms) [MSG_TYPE_DXL_SET_POS_PUB_PERIOD, PERIOD]."""
+        self.send_msg(bytes([self.MSG_TYPE_DXL_SET_POS_PUB_PERIOD, period]))
+
     def send_dxl_get(self, register: int, num_bytes: int, ids: List[int]):
         """Send a dxl get message [MSG_TYPE_DXL_GET_REG, REG, NUM_BYTES, (ID)+]."""
         self.send_msg(bytes([self.MSG_TYPE_DXL_GET_REG, register, num_bytes] + ids))
@@ -170,34 +291,42 @@ class GateProtocol(Protocol):
         msg = [self.MSG_TYPE_LOAD_SET_SCALE, id] + list(struct.pack('f', scale))
         self.send_msg(bytes(msg))
 
-    def pop_messages(self) -> Iterable[bytearray]:
-        """Parse buffer and check for complete messages."""
-        msgs = []
+    def pop_messages(self) -> List[bytearray]:
+        """Parse buffer and check for complete messages.
 
-        while True:
-            if len(self.buffer) < 3:
-                break
-
-            if self.buffer[0] != 255 or self.buffer[1] != 255:
-                self.logger.warning(f'Corrupted buffer {self.buffer}')
+        The buffer is scanned with a read cursor and the parsed part is discarded at once,
+        instead of being sliced after each message (quadratic on large reads).
+        """
+        msgs: List[bytearray] = []
+        buffer = self.buffer
+        end = len(buffer)
+        pos = 0
 
-                start = self.buffer.find(bytearray([255, 255]))
-                if start == -1:
-                    self.buffer.clear()
-                else:
-                    self.buffer = self.buffer[start:]
+        while end - pos >= 3:
+            if buffer[pos] != 255 or buffer[pos + 1] != 255:
+                pos = self._skip_corrupted(pos)
                 continue
 
-            payload_size = self.buffer[2]
-            if len(self.buffer) < 3 + payload_size:
+            next_pos = pos + 3 + buffer[pos + 2]
+            if next_pos > end:
                 break
 
-            msg = self.buffer[3: 3 + payload_size]
-            msgs.append(msg)
-            self.buffer = self.buffer[3 + payload_size:]
+            msgs.append(buffer[pos + 3: next_pos])
+            pos = next_pos
 
+        if pos:
+            del buffer[:pos]
         return msgs
 
+    def _skip_corrupted(self, pos: int) -> int:
+        """Find the next frame header after corrupted bytes at pos (the end of the buffer if there is none)."""
+        self.metrics.corrupted_buffers += 1
+        # Only the beginning of the corrupted data is copied for the log.
+        self.log_rate_limiter.log(self.logger, WARNING, 'corrupted_buffer', 'Corrupted buffer %s', bytes(self.buffer[pos: pos + 64]))
+
+        start = self.buffer.find(self.header, pos)
+        return len(self.buffer) if start == -1 else start
+
     def check_msg(self, msg: bytes) -> bool:
         """Check if the msg is complete."""
         s = len(msg)
@@ -205,82 +334,66 @@ class GateProtocol(Protocol):
 
     def handle_message(self, payload: bytes):
         """Handle the reception of a complete message."""
-        if self.logger is not None:
-            self.logger.debug(f'Got msg {list(payload)}')
-
-        if payload[0] == self.MSG_MODULE_ASSERT:
-            self.handle_assert(payload[1:])
-
-        elif payload[0] == self.MSG_TYPE_DXL_PUB_DATA:
-            register = payload[1]
-            val_size = payload[2]
-            size_per_id = 1 + 2 + val_size
-
-            nb_ids = (len(payload) - 3) // size_per_id
-            ids, errors, values = [], [], []
-
-            for i in range(nb_ids):
-                data_for_id = payload[3 + i * size_per_id: 3 + (i + 1) * size_per_id]
-
-                ids.append(data_for_id[0])
-                errors.append(struct.unpack('H', data_for_id[1:3])[0])
-                values.append(data_for_id[3:])
-
-            self.handle_dxl_pub_data(register, ids, errors, values)
-
-        elif payload[0] == self.MSG_TYPE_LOAD_PUB_DATA:
-            nb_sensors = (len(payload) - 1) // 5
-            ids, loads = [], []
-            for i in range(nb_sensors):
-                ids.append(payload[5 * i + 1])
-                loads.append(payload[5 * i + 2: 5 * i + 6])
-            self.handle_load_pub_data(ids, loads)
-
-        elif payload[0] == self.MSG_TYPE_ORBITA_PUB_DATA:
-            orbita_id = payload[1]
-            reg_type = payload[2]
-            self.handle_orbita_pub_data(orbita_id, OrbitaRegister(reg_type), payload[3:])
-
-        elif payload[0] == self.MSG_TYPE_FAN_PUB_DATA:
-            data = list(payload[1:])
-            ids = data[::2]
-            states = data[1::2]
-            self.handle_fan_pub_data(ids, states)
-
-        elif payload[0] == self.MSG_DETECTION_PUB_NODES:
-            self._nodes.clear()
-            self._containers.clear()
-
-            self._numbers_of_nodes_waiting = len(payload) - 1
-            self._waiting_for_containers = {}
-
-            if self._numbers_of_nodes_waiting == 0:
-                self._waiting_for_nodes.set()
-
-            for node_id in payload[1:]:
-                self._nodes[node_id] = []
-                self.send_msg(payload=bytes([self.MSG_DETECTION_GET_CONTAINERS, node_id]))
-
-        elif payload[0] == self.MSG_DETECTION_PUB_CONTAINERS:
-            node_id = payload[1]
-            for container_id in payload[2:]:
-                self._nodes[node_id].append(container_id)
-                self.send_msg(bytes([self.MSG_DETECTION_GET_CONTAINER_INFO, container_id]))
-                self._waiting_for_containers[container_id] = Event()
-
-            self._numbers_of_nodes_waiting -= 1
-            if self._numbers_of_nodes_waiting == 0:
-                self._waiting_for_nodes.set()
-
-        elif payload[0] == self.MSG_DETECTION_PUB_CONTAINER_INFO:
-            container_id = payload[1]
-            alias, type = payload[2:].decode().split(' ')
-            self._containers[container_id] = (alias, type)
-            self._waiting_for_containers[container_id].set()
-
+        if self.logger is not None and self.logger.isEnabledFor(DEBUG):
+            self.logger.debug('Got msg %s', list(payload))
+
+        msg_type = payload[0]
+        handler = self._msg_handlers.get(msg_type)
+        if handler is None:
+            self.log_rate_limiter.log(self.logger, WARNING, ('unrecognized', msg_type), 'Got unrecognized message %s', list(payload))
+        elif self.measure_handler_durations:
+            t0 = time.perf_counter()
+            handler(payload)
+            self.metrics.record_handler_duration(msg_type, time.perf_counter() - t0)
         else:
-            if self.logger is not None:
-                self.logger.warning(f'Got unrecognized message {list(payload)}')
+            handler(payload)
+
+    def get_metrics(self) -> Dict:
+        """Get a snapshot of the traffic counters and of the message handling durations (by message type name, if measured)."""
+        return self.metrics.snapshot(msg_type_names())
+
+    def _on_assert(self, payload: bytes):
+        self.handle_assert(bytes(payload[1:]))
+
+    def _on_dxl_pub_data(self, payload: bytes):
+        """Decode [MSG_TYPE_DXL_PUB_DATA, REG, VAL_SIZE, (ID, ERR, (VAL)+)+] in a single unpack."""
+        val_size = payload[2]
+        nb_ids = (len(payload) - 3) // (3 + val_size)
+
+        data = dxl_pub_data_struct(val_size, nb_ids).unpack_from(payload, 3)
+        self.handle_dxl_pub_data(payload[1], list(data[0::3]), list(data[1::3]), list(data[2::3]))
+
+    def _on_load_pub_data(self, payload: bytes):
+        """Decode [MSG_TYPE_LOAD_PUB_DATA, (ID, (VAL)*4)+] in a single unpack."""
+        nb_sensors = (len(payload) - 1) // 5
+
+        data = load_pub_data_struct(nb_sensors).unpack_from(payload, 1)
+        self.handle_load_pub_data(list(data[0::2]), list(data[1::2]))
+
+    def _on_orbita_pub_data(self, payload: bytes):
+        orbita_id = payload[1]
+        reg_type = payload[2]
+        self.handle_orbita_pub_data(orbita_id, OrbitaRegister(reg_type), bytes(payload[3:]))
+
+    def _on_fan_pub_data(self, payload: bytes):
+        self.handle_fan_pub_data(list(payload[1::2]), list(payload[2::2]))
+
+    def _on_detection_pub_nodes(self, payload: bytes):
+        with self._detection_cond:
+            self._nodes = {node_id: None for node_id in payload[1:]}
+            self._nodes_received = True
+            self._detection_cond.notify_all()
+
+    def _on_detection_pub_containers(self, payload: bytes):
+        with self._detection_cond:
+            self._nodes[payload[1]] = list(payload[2:])
+            self._detection_cond.notify_all()
+
+    def _on_detection_pub_container_info(self, payload: bytes):
+        alias, type = bytes(payload[2:]).decode().split(' ')
+        with self._detection_cond:
+            self._containers[payload[1]] = (alias, type)
+            self._detection_cond.notify_all()
 
     def handle_dxl_pub_data(self, register: int, ids: List[int], errors: List[int], values: List[bytes]):
         """Handle dxl update received on a gate client."""
@@ -306,13 +419,29 @@ class GateProtocol(Protocol):
 class GateClient:
     """Gate client running a serial ReaderThread."""
 
-    def __init__(self, port: str, protocol_factory: Type[GateProtocol]) -> None:
-        """Set up the serial communication."""
-        self.serial = Serial(port=port, baudrate=1000000)
-        if sys.platform == 'linux':
+    def __init__(self,
+                 port: str,
+                 protocol_factory: Type[GateProtocol],
+                 recording_file: Optional[str] = None,
+                 logger: Optional[Logger] = None,
+                 ) -> None:
+        """Set up the serial communication (and the recording of its raw traffic to recording_file if given).
+
+        If the recording file cannot be created, the error is logged and the traffic is not recorded.
+        """
+        self.port = port
+        self.serial = serial_for_url(port, baudrate=1000000)
+        if sys.platform == 'linux' and hasattr(self.serial, 'set_low_latency_mode'):
             self.serial.set_low_latency_mode(True)
 
         self.protocol_factory = protocol_factory
+        self.recorder: Optional[TrafficRecorder] = None
+        if recording_file is not None:
+            try:
+                self.recorder = TrafficRecorder(recording_file)
+            except OSError as e:
+                if logger is not None:
+                    logger.error(f'Could not record the traffic of "{port}" to "{recording_file}" ({e}), recording disabled.')
         self.alive = Event()
 
     def start(self):
@@ -323,7 +452,13 @@ class GateClient:
 
     def run(self):
         """Run the ReaderThread loop."""
-        with ReaderThread(self.serial, self.protocol_factory) as protocol:
+        def make_protocol() -> GateProtocol:
+            # The recorder is set before the reader thread starts so no received data is missed.
+            protocol = self.protocol_factory()
+            protocol.recorder = self.recorder
+            return protocol
+
+        with ReaderThread(self.serial, make_protocol) as protocol:
             self.protocol = protocol
             self.alive.set()
 
@@ -338,3 +473,5 @@ class GateClient:
         # Make sure all messages buffered by the gate were received.
         if hasattr(self, 't') and self.t.is_alive():
             self.t.join()
+        if self.recorder is not None:
+            self.recorder.close()
@@ -1,25 +1,32 @@
 """Reachy wrapper around serial LUOS GateClients which handle the communication with the hardware."""
 
+import asyncio
 import sys
 import time
 import numpy as np
 
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, namedtuple
 from glob import glob
-from logging import Logger
+from logging import DEBUG, INFO, WARNING, Logger
 from operator import attrgetter
 from threading import Lock
-from typing import Dict, List, Tuple
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
 
 from .config import load_config
 from .device import Device
-from .discovery import find_gate
-from .dynamixel import AX18, DynamixelMotor
+from .discovery import find_gates, get_discovery_cache_file
+from .dynamixel import AX18, DynamixelMotor, DynamixelPositionConverter, coalesce_writes
 from .fan import DxlFan, Fan, OrbitaFan
 from .force_sensor import ForceSensor
 from .joint import Joint
+from .log import RateLimiter
+from .metrics import RoundTripTracker
 from .orbita import OrbitaActuator, OrbitaRegister
 from .pycore import GateClient, GateProtocol
+from .recorder import get_traffic_recording_file
+from .retry import RetryPolicy
+
+JointSample = namedtuple('JointSample', ('value', 'timestamp', 'stale'))
 
 
 class Reachy(GateProtocol):
@@ -37,38 +44,58 @@ class Reachy(GateProtocol):
     else:
         raise OSError('Unsupported platform')
 
-    def __init__(self, config_name: str, logger: Logger) -> None:
-        """Create all GateClient defined in the devices class variable."""
+    # Registers converted as positions, handled as a whole group with a DynamixelPositionConverter.
+    dxl_position_registers = ('cw_angle_limit', 'ccw_angle_limit', 'goal_position', 'present_position')
+    # Present position publication period (in ms) of the gates and orbitas at power up, restored by stop_streaming.
+    default_pub_period = 10
+
+    def __init__(self, config_name: str, logger: Logger, ports: Optional[List[str]] = None) -> None:
+        """Create all GateClient defined in the devices class variable.
+
+        The gates are looked for on the given serial ports (or URLs, eg. "sim://..."), by default on port_template.
+        """
         self.logger = logger
         self.config = load_config(config_name)
 
+        # Registers have per slot writer locks (see RegisterStore), so each gate reader thread publishes its updates directly.
         class GateProtocolDelegate(GateProtocol):
-            lock = Lock()
-
             def handle_dxl_pub_data(_self, register, ids, errors, values):
-                with _self.lock:
-                    return self.handle_dxl_pub_data(register, ids, errors, values)
+                return self.handle_dxl_pub_data(register, ids, errors, values)
 
             def handle_load_pub_data(_self, ids: List[int], values: List[bytes]):
-                with _self.lock:
-                    return self.handle_load_pub_data(ids, values)
+                return self.handle_load_pub_data(ids, values)
 
             def handle_orbita_pub_data(_self, id: int, register: OrbitaRegister, values: bytes):
-                with _self.lock:
-                    return self.handle_orbita_pub_data(id, register, values)
+                return self.handle_orbita_pub_data(id, register, values)
 
             def handle_fan_pub_data(_self, fan_ids: List[int], states: List[int]):
-                with _self.lock:
-                    return self.handle_fan_pub_data(fan_ids, states)
+                return self.handle_fan_pub_data(fan_ids, states)
 
             def handle_assert(_self, msg: bytes):
-                with _self.lock:
-                    return self.handle_assert(msg)
+                return self.handle_assert(msg)
 
         self.gates: List[GateClient] = []
         self.gate4name: Dict[str, GateClient] = {}
         self.dxls: Dict[str, Joint] = OrderedDict({})
         self.dxl4id: Dict[int, DynamixelMotor] = {}
+        self.retry_policy = RetryPolicy()
+        # Time between each register get request and its answer.
+        self.round_trips = RoundTripTracker()
+        # Warnings repeated on every received message (eg. a flapping motor error) are emitted at most once per period.
+        self.log_rate_limiter = RateLimiter(period=1.0)
+        # Registers whose writes are dropped for the ids where the raw value is the same as the last one sent (eg. {'goal_position'}).
+        self.dead_band_registers: Set[str] = set()
+        self._last_sent_dxl: Dict[int, Dict[int, bytes]] = {}
+        self._last_sent_orbita: Dict[int, Dict[Tuple[int, int], bytes]] = {}
+        self._subscriptions: Dict[Tuple[str, int], List[JointSubscription]] = {}
+        self._subscriptions_lock = Lock()
+        # Present position publication period (in ms) once streaming is started.
+        self.streaming_period: Optional[int] = None
+        self._streaming_rates_start: Optional[Tuple[float, Dict[str, int]]] = None
+        # Last commanded roll, pitch, yaw of each orbita (used to complete partial goals).
+        self._last_orbita_rpys: Dict[str, Dict[str, float]] = {}
+        # Write-through cache of the dynamixels torque state (by id), updated on torque_enable writes and received values.
+        self._torque_enabled: Dict[int, bool] = {}
 
         self.fans: Dict[str, Fan] = OrderedDict({})
         self.fan4id: Dict[int, Fan] = {}
@@ -79,7 +106,7 @@ class Reachy(GateProtocol):
         self.force_sensors: Dict[str, ForceSensor] = OrderedDict({})
         self.force4id: Dict[int, ForceSensor] = {}
 
-        self.ports = glob(self.port_template)
+        self.ports = glob(self.port_template) if ports is None else ports
         if len(self.ports) == 0:
             raise IOError(f'No Gate found on "{self.port_template}"')
 
@@ -91,10 +118,10 @@ class Reachy(GateProtocol):
             "neck": "head",
         }
 
-        for devices in self.config:
-            self.logger.info(f'Looking for {list(devices.keys())} on {self.ports}.')
-            port, matching, missing = find_gate(devices, self.ports, self.logger)
+        self.logger.info(f'Looking for {[list(devices.keys()) for devices in self.config]} on {self.ports}.')
+        gates_for_parts = find_gates(self.config, self.ports, self.logger, cache_file=get_discovery_cache_file())
 
+        for devices, (port, matching, missing) in zip(self.config, gates_for_parts):
             missing_containers = [{container.__module__: container.id} for container in missing]
 
             first_piece = list(devices.keys())[0]
@@ -106,7 +133,10 @@ class Reachy(GateProtocol):
 
             self.logger.info(f'Found devices on="{port}", connecting...')
 
-            gate = GateClient(port=port, protocol_factory=GateProtocolDelegate)
+            gate = GateClient(
+                port=port, protocol_factory=GateProtocolDelegate,
+                recording_file=get_traffic_recording_file(port), logger=self.logger,
+            )
             self.gates.append(gate)
 
             for name, dev in devices.items():
@@ -135,6 +165,14 @@ class Reachy(GateProtocol):
 
                 dev.logger = self.logger
 
+        # A single converter for all dynamixels, each call converts the subset it needs by index.
+        position_motors = [(name, dxl) for name, dxl in self.dxls.items() if isinstance(dxl, DynamixelMotor)]
+        self._dxl_position_converter = DynamixelPositionConverter(
+            motors=[dxl for _, dxl in position_motors],
+            logger=self.logger,
+        )
+        self._dxl_position_index = {name: i for i, (name, _) in enumerate(position_motors)}
+
         if not np.array_equal(np.asarray(list(missing_parts_cards.values())).flatten(), np.array([])):
             raise MissingContainerError(missing_parts_cards)
 
@@ -149,6 +187,10 @@ class Reachy(GateProtocol):
 
     def start(self):
         """Start all GateClients (start sending/receiving data with hardware)."""
+        # The boards may have been reset since the previous connection, no write can be assumed received.
+        self._last_sent_dxl.clear()
+        self._last_sent_orbita.clear()
+
         for gate in self.gates:
             gate.start()
             gate.protocol.logger = self.logger
@@ -161,12 +203,81 @@ class Reachy(GateProtocol):
 
     def setup(self):
         """Set up everything before actually using (eg. offset for instance)."""
+        try:
+            self.get_dxls_value('torque_enable', list(self.dxls.keys()), clear_value=True, retry=10)
+        except TimeoutError as e:
+            # Missing states will be read again on the first goal write.
+            self.logger.warning(f'Could not retrieve all dynamixels torque state ({e}).')
+
         for name, orbita in self.orbitas.items():
             zero = [int(x) for x in self.get_orbita_values('zero', name, clear_value=True, retry=10)]
             pos = [int(x) for x in self.get_orbita_values('absolute_position', name, clear_value=True, retry=10)]
             orbita.set_offset(zero, pos)
             self.set_orbita_values('recalibrate', name, {'roll': True})
 
+    def start_streaming(self, period: int = 10):
+        """Make all gates and orbitas publish the present position every period (in ms).
+
+        Present positions are then updated by the pushed messages, get requests are only sent for fresh (clear_value) reads
+        or if an expected publication is missing.
+        """
+        if not 0 < period < 256:
+            raise ValueError(f'Publication period should be in [1, 255]ms (got {period})!')
+
+        self._send_pub_period(period)
+        self.streaming_period = period
+        self._streaming_rates_start = self._present_position_update_counts()
+
+    def stop_streaming(self):
+        """Restore the default present position publication period of all gates and orbitas."""
+        self._send_pub_period(self.default_pub_period)
+        self.streaming_period = None
+        self._streaming_rates_start = None
+
+    def _send_pub_period(self, period: int):
+        for gate in self.gates:
+            gate.protocol.send_dxl_pub_period(period)
+        for name, orbita in self.orbitas.items():
+            self.set_orbita_values('position_pub_period', name, {axis: period for axis in orbita.get_joints_name()})
+
+    def get_streaming_rates(self) -> Dict[str, float]:
+        """Get the present position update rate (in Hz) achieved by each joint since the previous call (or since the streaming start)."""
+        if self._streaming_rates_start is None:
+            raise RuntimeError('Streaming is not started!')
+
+        start_time, start_counts = self._streaming_rates_start
+        self._streaming_rates_start = end_time, end_counts = self._present_position_update_counts()
+
+        dt = end_time - start_time
+        return {
+            name: (end_counts[name] - start_counts[name]) / dt if dt > 0 else 0.0
+            for name in end_counts
+        }
+
+    def _present_position_update_counts(self) -> Tuple[float, Dict[str, int]]:
+        counts = {name: dxl.registers['present_position'].update_count for name, dxl in self.dxls.items()}
+        for name, orbita in self.orbitas.items():
+            # All disks are published in the same message.
+            count = min(disk.present_position.update_count for disk in orbita.disks)
+            for axis in orbita.get_joints_name():
+                counts[f'{name}_{axis}'] = count
+        return time.monotonic(), counts
+
+    def get_metrics(self) -> Dict:
+        """Get a snapshot of the communication metrics.
+
+        It gathers per gate traffic counters and message handling durations (by port, see GateProtocol.measure_handler_durations),
+        the round trip time histograms of get requests (by register) and the retries statistics.
+        """
+        return {
+            'gates': {
+                gate.port: gate.protocol.get_metrics()
+                for gate in self.gates if hasattr(gate, 'protocol')
+            },
+            'round_trips': self.round_trips.snapshot(),
+            'retries': self.retry_policy.snapshot(),
+        }
+
     def get_all_joints_names(self) -> List[str]:
         """Return the names of all joints."""
         dxl_names = list(self.dxls.keys())
@@ -179,41 +290,105 @@ class Reachy(GateProtocol):
         return dxl_names + orbita_disk_names
 
     def get_joints_value(self, register: str, joint_names: List[str], retry: int = 10) -> List[float]:
-        """Return the value of the specified joints."""
-        # TODO: both get (dxl and orbita) should run in parallel (via asyncio?)
+        """Return the value of the specified joints.
+
+        All get requests (one per gate for the dynamixels and one per orbita) are sent first.
+        Then, we wait for all answers together, so the whole read costs about a single round trip.
+        """
         clear_value = False if register in ('present_position', 'temperature') else True
 
         dxl_names = [name for name in joint_names if name in self.dxls]
-        dxl_values = dict(zip(dxl_names, self.get_dxls_value(register, dxl_names, clear_value, retry)))
+
+        orbita_names: List[str] = []
+        for name in joint_names:
+            orbita_name = name.partition('_')[0]
+            if orbita_name in self.orbitas and orbita_name not in orbita_names:
+                orbita_names.append(orbita_name)
+
+        self._send_dxls_get(register, dxl_names, clear_value)
+        if register not in ['moving_speed']:
+            for orbita_name in orbita_names:
+                self._send_orbita_get(register, orbita_name, clear_value)
+
+        dxl_values = dict(zip(dxl_names, self._wait_dxls_value(register, dxl_names, clear_value, retry)))
 
         orbitas_values = {}
 
-        if register in ['moving_speed']:
-            for name in joint_names:
-                orbita_name = name.partition('_')[0]
-                if orbita_name in self.orbitas:
-                    orbita = self.orbitas[orbita_name]
-                    for joint in orbita.get_joints_name():
-                        orbitas_values[f'{orbita_name}_{joint}'] = 0.0
-        else:
-            for name in joint_names:
-                orbita_name = name.partition('_')[0]
-                if orbita_name in self.orbitas:
-                    disk_values = self.get_orbita_values(register, orbita_name, clear_value, retry)
-                    if register in ('present_position', 'goal_position'):
-                        values = self.orbitas[orbita_name].forward(disk_values)
-                    else:
-                        values = disk_values
-
-                    orbitas_values[f'{orbita_name}_roll'] = values[0]
-                    orbitas_values[f'{orbita_name}_pitch'] = values[1]
-                    orbitas_values[f'{orbita_name}_yaw'] = values[2]
+        for orbita_name in orbita_names:
+            orbita = self.orbitas[orbita_name]
+
+            if register in ['moving_speed']:
+                values = [0.0 for _ in orbita.get_joints_name()]
+            else:
+                disk_values = self._wait_orbita_values(register, orbita_name, clear_value, retry)
+                if register in ('present_position', 'goal_position'):
+                    values = orbita.forward(disk_values)
+                else:
+                    values = disk_values
+
+            for joint, value in zip(orbita.get_joints_name(), values):
+                orbitas_values[f'{orbita_name}_{joint}'] = value
 
         values = {}
         values.update(dxl_values)
         values.update(orbitas_values)
         return [values[joint] for joint in joint_names]
 
+    def get_latest_joints_value(self, register: str, joint_names: List[str], max_age: Optional[float] = None) -> List[JointSample]:
+        """Return the last received value of the specified joints without waiting nor sending any request.
+
+        Each value comes with the monotonic timestamp of its reception (0.0 if never received, with a nan value).
+        It is flagged as stale if it has never been received or is older than max_age (in s).
+        Only registers published by the gates (present_position, temperature) are refreshed on their own,
+        the others hold their last read or commanded value.
+        """
+        now = time.monotonic()
+        samples: Dict[str, Tuple[float, float]] = {}
+
+        dxl_names = [name for name in joint_names if name in self.dxls]
+        dxl_snapshots = [self.dxls[name].registers[register].snapshot() for name in dxl_names]
+
+        if register in self.dxl_position_registers and dxl_names:
+            raw_values = b''.join(val if val is not None else bytes(2) for val, _ in dxl_snapshots)
+            dxl_values = self._dxl_position_converter.to_usi(raw_values, self._dxl_position_indices(dxl_names)).tolist()
+        else:
+            dxl_values = [
+                self.dxls[name].registers[register].cvt_as_usi(val) if val is not None else 0.0
+                for name, (val, _) in zip(dxl_names, dxl_snapshots)
+            ]
+
+        for name, value, (val, timestamp) in zip(dxl_names, dxl_values, dxl_snapshots):
+            samples[name] = (value, timestamp) if val is not None else (np.nan, 0.0)
+
+        for name in joint_names:
+            orbita_name = name.partition('_')[0]
+            if name in samples or orbita_name not in self.orbitas:
+                continue
+
+            orbita = self.orbitas[orbita_name]
+            if register in ['moving_speed']:
+                values = [0.0 for _ in orbita.get_joints_name()]
+                timestamp = now
+            else:
+                disk_registers = [getattr(disk, register) for disk in orbita.disks]
+                disk_snapshots = [reg.snapshot() for reg in disk_registers]
+
+                if any(val is None for val, _ in disk_snapshots):
+                    values = [np.nan for _ in orbita.get_joints_name()]
+                    timestamp = 0.0
+                else:
+                    disk_values = [reg.cvt_as_usi(val) for reg, (val, _) in zip(disk_registers, disk_snapshots)]
+                    values = orbita.forward(disk_values) if register in ('present_position', 'goal_position') else disk_values
+                    timestamp = min(ts for _, ts in disk_snapshots)
+
+            for joint, value in zip(orbita.get_joints_name(), values):
+                samples[f'{orbita_name}_{joint}'] = (value, timestamp)
+
+        return [
+            JointSample(value, timestamp, timestamp == 0.0 or (max_age is not None and now - timestamp > max_age))
+            for value, timestamp in (samples[name] for name in joint_names)
+        ]
+
     def get_joints_pid(self, joint_names: List[str], retry: int = 10) -> List[Tuple[float, float, float]]:
         """Return the pids of the specified joints."""
         pids: Dict[str, Tuple[float, float, float]] = {}
@@ -249,6 +424,50 @@ class Reachy(GateProtocol):
 
     def set_joints_value(self, register: str, value_for_joint: Dict[str, float]):
         """Set the value for the specified joints."""
+        dxl_values, orbita_values = self._split_joints_value(value_for_joint)
+
+        if dxl_values:
+            self.set_dxls_value(register, dxl_values)
+        if orbita_values:
+            if register == 'moving_speed':
+                if self.logger is not None:
+                    self.logger.debug('Speed for orbita not handled!')
+                return
+            for orbita, values in orbita_values.items():
+                self.set_orbita_values(register, orbita, values)
+
+    def command_batch(self) -> 'CommandBatch':
+        """Create a batch of writes to several registers, sent together (eg. goal_position, moving_speed and torque_limit).
+
+        Use it as a context manager, the writes are sent when leaving it.
+        """
+        return CommandBatch(self)
+
+    def set_joints_values(self, values_for_register: Dict[str, Dict[str, float]]):
+        """Set the values of several registers for the specified joints at once.
+
+        The dynamixel writes are sent in as few set requests per gate as possible:
+        registers at contiguous addresses (eg. goal_position, moving_speed and torque_limit on V1 motors) are merged in a single span.
+        Torque enable is applied first, with its usual side effects.
+        """
+        if 'torque_enable' in values_for_register:
+            self.set_joints_value('torque_enable', values_for_register['torque_enable'])
+
+        dxl_writes: Dict[GateClient, Dict[int, Dict[int, bytes]]] = defaultdict(lambda: defaultdict(dict))
+        for register, value_for_joint in values_for_register.items():
+            if register == 'torque_enable':
+                continue
+
+            dxl_values, orbita_values = self._split_joints_value(value_for_joint)
+            if dxl_values:
+                self._prepare_dxls_set(register, dxl_values, dxl_writes)
+            if register != 'moving_speed':
+                for orbita, values in orbita_values.items():
+                    self.set_orbita_values(register, orbita, values)
+
+        self._send_dxls_set(dxl_writes)
+
+    def _split_joints_value(self, value_for_joint: Dict[str, float]) -> Tuple[Dict[str, float], Dict[str, Dict[str, float]]]:
         dxl_values: Dict[str, float] = {}
         orbita_values: Dict[str, Dict[str, float]] = {}
 
@@ -269,15 +488,7 @@ class Reachy(GateProtocol):
             else:
                 self.logger.warning(f'"{name}" is an unknown joints!')
 
-        if dxl_values:
-            self.set_dxls_value(register, dxl_values)
-        if orbita_values:
-            if register == 'moving_speed':
-                if self.logger is not None:
-                    self.logger.debug('Speed for orbita not handled!')
-                return
-            for orbita, values in orbita_values.items():
-                self.set_orbita_values(register, orbita, values)
+        return dxl_values, orbita_values
 
     def set_joints_pid(self, goal_pids: Dict[str, Tuple[float, float, float]]) -> None:
         """Set the PIDs for the specified joints."""
@@ -336,6 +547,11 @@ class Reachy(GateProtocol):
         Then, split joints among their respective gate and send a single get request per gate (multiple ids per request).
         Finally, wait for all joints to received the updated value, converts it and returns it.
         """
+        self._send_dxls_get(register, dxl_names, clear_value)
+        return self._wait_dxls_value(register, dxl_names, clear_value, retry)
+
+    def _send_dxls_get(self, register: str, dxl_names: List[str], clear_value: bool):
+        # While streaming, present positions are set by the publications, so they are only requested if cleared or missing.
         dxl_ids_per_gate: Dict[GateClient, List[int]] = defaultdict(list)
         dxl_reg_per_gate: Dict[GateClient, Tuple[int, int]] = {}
 
@@ -352,27 +568,25 @@ class Reachy(GateProtocol):
 
         for gate, ids in dxl_ids_per_gate.items():
             addr, num_bytes = dxl_reg_per_gate[gate]
+            for id in ids:
+                self.round_trips.sent(f'dxl.{register}', ('dxl', id, addr))
             gate.protocol.send_dxl_get(addr, num_bytes, ids)
 
-        try:
-            return [
-                self.dxls[name].get_value_as_usi(register)
-                for name in dxl_names
-            ]
-        except TimeoutError as e:
-            missing_dxls = [
-                name for name in dxl_names
-                if not self.dxls[name].is_value_set(register)
-            ]
-            if self.logger is not None:
-                self.logger.warning(f'Timeout occurs after GET cmd: dev="{missing_dxls}" reg="{register}"!')
-            if retry == 0:
-                raise e
-            if register in ('present_position', 'temperature'):
-                # We are waiting for te module to send us the data
-                # So wait before retrying
-                time.sleep(1)
-            return self.get_dxls_value(register, dxl_names, clear_value, retry - 1)
+    def _wait_dxls_value(self, register: str, dxl_names: List[str], clear_value: bool, retry: int) -> List[float]:
+        self.retry_policy.wait_for(
+            {name: self.dxls[name].registers[register] for name in dxl_names},
+            resend=lambda missing: self._send_dxls_get(register, missing, clear_value=False),
+            max_retries=retry, logger=self.logger, label=f'reg="{register}"',
+        )
+
+        if register in self.dxl_position_registers and dxl_names:
+            raw_values = b''.join(self.dxls[name].get_value(register) for name in dxl_names)
+            return self._dxl_position_converter.to_usi(raw_values, self._dxl_position_indices(dxl_names)).tolist()
+
+        return [
+            self.dxls[name].get_value_as_usi(register)
+            for name in dxl_names
+        ]
 
     def set_dxls_value(self, register: str, values_for_dxls: Dict[str, float]):
         """Set new value for register on the specified dynamixels.
@@ -380,32 +594,74 @@ class Reachy(GateProtocol):
         The values are splitted among the gates corresponding to the joints.
         One set request per gate is sent (with possible multiple ids).
         """
-        dxl_data_per_gate: Dict[GateClient, Dict[int, bytes]] = defaultdict(dict)
-        dxl_reg_per_gate: Dict[GateClient, Tuple[int, int]] = {}
+        self._send_dxls_set(self._prepare_dxls_set(register, values_for_dxls))
 
-        for name, dxl_value in values_for_dxls.items():
-            dxl = self.dxls[name]
+        if register == 'torque_enable':
+            names = [name for name, value in values_for_dxls.items() if value]
+            cached_speed = dict(zip(names, self.get_dxls_value('moving_speed', names, clear_value=False, retry=10)))
+            self.set_dxls_value('moving_speed', cached_speed)
+            self.get_dxls_value('goal_position', names, clear_value=True, retry=10)
 
-            if isinstance(dxl, DynamixelMotor):
-                self.dxl4id[dxl.id].update_value_using_usi(register, dxl_value)
+    def _prepare_dxls_set(self,
+                          register: str, values_for_dxls: Dict[str, float],
+                          writes: Optional[Dict[GateClient, Dict[int, Dict[int, bytes]]]] = None,
+                          ) -> Dict[GateClient, Dict[int, Dict[int, bytes]]]:
+        """Update the registers with the new values and gather the raw writes to send as {gate: {id: {addr: value}}}."""
+        if writes is None:
+            writes = defaultdict(lambda: defaultdict(dict))
 
-                if self._is_torque_enable(name) or register not in ['goal_position', 'moving_speed']:
-                    gate = self.gate4name[name]
-                    dxl_data_per_gate[gate][dxl.id] = self.dxl4id[dxl.id].get_value(register)
-                    dxl_reg_per_gate[gate] = self.dxl4id[dxl.id].get_register_config(register)
+        dxl_names = [name for name in values_for_dxls.keys() if isinstance(self.dxls[name], DynamixelMotor)]
 
-        for gate, value_for_id in dxl_data_per_gate.items():
-            addr, num_bytes = dxl_reg_per_gate[gate]
-            gate.protocol.send_dxl_set(addr, num_bytes, value_for_id)
+        if register in self.dxl_position_registers and dxl_names:
+            raw_values = self._dxl_position_converter.to_raw(
+                [values_for_dxls[name] for name in dxl_names],
+                self._dxl_position_indices(dxl_names),
+            )
+            for name, raw_value in zip(dxl_names, raw_values):
+                self.dxls[name].update_value(register, raw_value)
+        else:
+            for name in dxl_names:
+                self.dxls[name].update_value_using_usi(register, values_for_dxls[name])
 
         if register == 'torque_enable':
-            names = [name for name, value in values_for_dxls.items() if value == 1]
-            cached_speed = dict(zip(names, self.get_dxls_value('moving_speed', names, clear_value=False, retry=10)))
-            self.set_dxls_value('moving_speed', cached_speed)
-            self.get_dxls_value('goal_position', names, clear_value=True, retry=10)
+            for name in dxl_names:
+                # Same truthiness as the raw conversion, so the cache matches what is written.
+                self._torque_enabled[self.dxls[name].id] = bool(values_for_dxls[name])
+                # The motor may have moved while compliant, the goals have to be sent again.
+                self._last_sent_dxl.pop(self.dxls[name].id, None)
+
+        if register in ['goal_position', 'moving_speed']:
+            dxl_names = [name for name, enabled in zip(dxl_names, self._is_torque_enabled(dxl_names)) if enabled]
+
+        dead_band = register in self.dead_band_registers
+
+        for name in dxl_names:
+            dxl = self.dxls[name]
+            addr, _ = dxl.get_register_config(register)
+            value = dxl.get_value(register)
+
+            if dead_band:
+                last_sent = self._last_sent_dxl.setdefault(dxl.id, {})
+                if last_sent.get(addr) == value:
+                    continue
+                last_sent[addr] = value
+
+            writes[self.gate4name[name]][dxl.id][addr] = value
+
+        return writes
+
+    def _send_dxls_set(self, writes: Dict[GateClient, Dict[int, Dict[int, bytes]]]):
+        """Send the gathered writes, using as few set requests per gate as possible."""
+        for gate, writes_for_id in writes.items():
+            for addr, num_bytes, value_for_id in coalesce_writes(writes_for_id):
+                gate.protocol.send_dxl_set(addr, num_bytes, value_for_id)
 
     def get_orbita_values(self, register_name: str, orbita_name: str, clear_value: bool, retry: int) -> List[float]:
         """Retrieve register value on the specified orbita actuator."""
+        self._send_orbita_get(register_name, orbita_name, clear_value)
+        return self._wait_orbita_values(register_name, orbita_name, clear_value, retry)
+
+    def _send_orbita_get(self, register_name: str, orbita_name: str, clear_value: bool):
         orbita = self.orbitas[orbita_name]
         register = OrbitaActuator.register_address[register_name]
         gate = self.gate4name[orbita_name]
@@ -413,23 +669,28 @@ class Reachy(GateProtocol):
         if clear_value:
             orbita.clear_value(register)
 
+            self.round_trips.sent(f'orbita.{register_name}', ('orbita', orbita.id, register.value))
             gate.protocol.send_orbita_get(
                 orbita_id=orbita.id,
                 register=register.value,
             )
 
-        try:
-            return orbita.get_value_as_usi(register)
-        except TimeoutError as e:
-            if self.logger is not None:
-                self.logger.warning(f'Timeout occurs after GET cmd: dev="{orbita_name}" reg="{register_name}"!')
-            if retry == 0:
-                raise e
-            if register_name in ('present_position', 'temperature'):
-                # We are waiting for te module to send us the data
-                # So wait before retrying
-                time.sleep(1)
-            return self.get_orbita_values(register_name, orbita_name, clear_value, retry - 1)
+    def _wait_orbita_values(self, register_name: str, orbita_name: str, clear_value: bool, retry: int) -> List[float]:
+        orbita = self.orbitas[orbita_name]
+        register = OrbitaActuator.register_address[register_name]
+        gate = self.gate4name[orbita_name]
+
+        def resend(missing: List[str]):
+            # A single get request retrieves the values of all disks (also while streaming, the expected publication is late).
+            self.round_trips.sent(f'orbita.{register_name}', ('orbita', orbita.id, register.value))
+            gate.protocol.send_orbita_get(orbita_id=orbita.id, register=register.value)
+
+        self.retry_policy.wait_for(
+            {disk.name: getattr(disk, register.name) for disk in orbita.disks},
+            resend=resend,
+            max_retries=retry, logger=self.logger, label=f'orbita="{orbita_name}" reg="{register_name}"',
+        )
+        return orbita.get_value_as_usi(register)
 
     def set_orbita_values(self, register_name: str, orbita_name: str, value_for_rpys: Dict[str, float]):
         """Set new value for register on the specified disks."""
@@ -443,22 +704,28 @@ class Reachy(GateProtocol):
             'yaw': 'disk_bottom',
         }
 
+        # Only cached once the goal has been converted and sent, so an unreachable goal never completes later partial ones.
+        commanded_rpys: Optional[Dict[str, float]] = None
+
         if register_name in ('present_position', 'goal_position'):
             axes = axis2disk.keys()
 
-            angles = self.get_joints_value(
-                register='present_position',
-                joint_names=[f'{orbita_name}_{axis}' for axis in axes],
-            )
-            rpys = {axis: a for axis, a in zip(axes, angles)}
-
             goal_rpys = {
                 axis: pos for axis, pos in value_for_rpys.items()
                 if axis in axes
             }
-            rpys.update(goal_rpys)
 
-            pos = orbita.inverse(tuple(rpys.values()))
+            # Missing axes keep their last commanded value, the present position is only read if there is none.
+            last_rpys = self._last_orbita_rpys.get(orbita_name)
+            if last_rpys is None and len(goal_rpys) < len(axes):
+                angles = self.get_joints_value(
+                    register='present_position',
+                    joint_names=[f'{orbita_name}_{axis}' for axis in axes],
+                )
+                last_rpys = {axis: a for axis, a in zip(axes, angles)}
+
+            commanded_rpys = {axis: goal_rpys[axis] if axis in goal_rpys else last_rpys[axis] for axis in axes}
+            pos = orbita.inverse(tuple(commanded_rpys.values()))
             value_for_disks = {
                 disk: value
                 for disk, value in zip(orbita.get_disks_name(), pos)
@@ -477,11 +744,27 @@ class Reachy(GateProtocol):
             orbita.get_id_for_disk(disk_name): attrgetter(f'{disk_name}.{register_name}')(orbita).get()
             for disk_name in value_for_disks.keys()
         }
-        gate.protocol.send_orbita_set(orbita.id, register.value, value_for_id)
+
+        if register_name == 'torque_enable':
+            self._last_sent_orbita.pop(orbita.id, None)
+            # The orbita may have moved while compliant.
+            self._last_orbita_rpys.pop(orbita_name, None)
+        elif register_name in self.dead_band_registers:
+            last_sent = self._last_sent_orbita.setdefault(orbita.id, {})
+            value_for_id = {
+                motor_id: value for motor_id, value in value_for_id.items()
+                if last_sent.get((register.value, motor_id)) != value
+            }
+            for motor_id, value in value_for_id.items():
+                last_sent[(register.value, motor_id)] = value
+
+        if value_for_id:
+            gate.protocol.send_orbita_set(orbita.id, register.value, value_for_id)
+        if commanded_rpys is not None:
+            self._last_orbita_rpys[orbita_name] = commanded_rpys
 
     def get_fans_state(self, fan_names: List[str], retry=10) -> List[float]:
         """Retrieve state for the specified fans."""
-        dxl_fans_per_gate: Dict[GateClient, List[int]] = defaultdict(list)
         dxl_fans: List[str] = []
         orbita_fans: List[Tuple[str, str]] = []
 
@@ -490,28 +773,34 @@ class Reachy(GateProtocol):
 
             if isinstance(fan, DxlFan):
                 fan.state.reset()
-                dxl_fans_per_gate[self.gate4name[name]].append(fan.id)
                 dxl_fans.append(name)
             elif isinstance(fan, OrbitaFan):
                 orbita_fans.append((name, fan.orbita))
 
-        for gate, ids in dxl_fans_per_gate.items():
-            gate.protocol.send_dxl_fan_get(ids)
+        def send_fans_get(names: List[str]):
+            for gate, ids in self._fan_ids_per_gate(names).items():
+                gate.protocol.send_dxl_fan_get(ids)
 
-        try:
-            fans_state = {}
-            for name in dxl_fans:
-                fans_state[name] = self.fans[name].state.get_as_usi()
+        send_fans_get(dxl_fans)
+        self.retry_policy.wait_for(
+            {name: self.fans[name].state for name in dxl_fans},
+            resend=send_fans_get, max_retries=retry, logger=self.logger, label='reg="fan_state"',
+        )
+
+        fans_state = {}
+        for name in dxl_fans:
+            fans_state[name] = self.fans[name].state.get_as_usi()
 
-            for fan_name, orbita_name in orbita_fans:
-                fans_state[fan_name] = self.get_orbita_values('fan_state', orbita_name, clear_value=True, retry=retry)[0]
+        for fan_name, orbita_name in orbita_fans:
+            fans_state[fan_name] = self.get_orbita_values('fan_state', orbita_name, clear_value=True, retry=retry)[0]
 
-            return [fans_state[name] for name in fan_names]
+        return [fans_state[name] for name in fan_names]
 
-        except TimeoutError:
-            if retry > 0:
-                return self.get_fans_state(fan_names, retry - 1)
-            raise
+    def _fan_ids_per_gate(self, fan_names: List[str]) -> Dict[GateClient, List[int]]:
+        fan_ids_per_gate: Dict[GateClient, List[int]] = defaultdict(list)
+        for name in fan_names:
+            fan_ids_per_gate[self.gate4name[name]].append(self.fans[name].id)
+        return fan_ids_per_gate
 
     def set_fans_state(self, state_for_fan: Dict[str, float]):
         """Set state for the specified fans."""
@@ -526,34 +815,135 @@ class Reachy(GateProtocol):
         for gate, values in fans_per_gate.items():
             gate.protocol.send_dxl_fan_set(values)
 
-    def _is_torque_enable(self, name: str) -> bool:
-        return self.get_dxls_value('torque_enable', [name], clear_value=False, retry=10)[0] == 1
+    def _dxl_position_indices(self, dxl_names: List[str]) -> np.ndarray:
+        return np.fromiter((self._dxl_position_index[name] for name in dxl_names), dtype=np.intp, count=len(dxl_names))
+
+    def _is_torque_enabled(self, dxl_names: List[str]) -> List[bool]:
+        """Check the torque state of the dynamixels using the write-through cache (only never seen ones are read, all at once)."""
+        unknown = [name for name in dxl_names if self.dxls[name].id not in self._torque_enabled]
+        if unknown:
+            for name, value in zip(unknown, self.get_dxls_value('torque_enable', unknown, clear_value=False, retry=10)):
+                self._torque_enabled[self.dxls[name].id] = value == 1
+
+        return [self._torque_enabled[self.dxls[name].id] for name in dxl_names]
 
     def handle_dxl_pub_data(self, addr: int, ids: List[int], errors: List[int], values: List[bytes]):
         """Handle dxl update received on a gate client."""
         for id, err, val in zip(ids, errors, values):
-            if (err != 0) and self.logger is not None:
-                self.logger.warning(f'Dynamixel error {err} on motor id={id}!')
-            if id not in self.dxl4id and self.logger is not None:
-                self.logger.debug(f'Dynamixel id={id} not in config!')
+            if err != 0:
+                self.log_rate_limiter.log(self.logger, WARNING, ('dxl_error', id, err), 'Dynamixel error %d on motor id=%d!', err, id)
+            if id not in self.dxl4id:
+                self.log_rate_limiter.log(self.logger, DEBUG, ('unknown_dxl', id), 'Dynamixel id=%d not in config!', id)
                 continue
             m = self.dxl4id[id]
-            m.update_value(m.find_register_by_addr(addr), val)
+            register = m.find_register_by_addr(addr)
+            m.update_value(register, val)
+            self.round_trips.received(('dxl', id, addr))
+
+            last_sent = self._last_sent_dxl.get(id)
+            if last_sent and last_sent.get(addr, val) != val:
+                # The motor did not keep the last write (eg. reset or written elsewhere), the next one has to be sent.
+                last_sent.pop(addr, None)
+
+            if register == 'torque_enable':
+                enabled = val[0] == 1
+                if self._torque_enabled.get(id, enabled) != enabled:
+                    # Torque toggled outside of the HAL (eg. shutdown on error), the motor may have moved.
+                    self._last_sent_dxl.pop(id, None)
+                self._torque_enabled[id] = enabled
+            elif register == 'present_position' and self._subscriptions:
+                self._notify_subscriptions(('dxl', id))
 
     def handle_load_pub_data(self, ids: List[int], values: List[bytes]):
         """Handle load update received on a gate client."""
         for id, val in zip(ids, values):
-            if id not in self.force4id and self.logger is not None:
-                self.logger.info(f'Force sensor id={id} not in config!')
+            if id not in self.force4id:
+                self.log_rate_limiter.log(self.logger, INFO, ('unknown_force_sensor', id), 'Force sensor id=%d not in config!', id)
                 continue
             self.force4id[id].update_force(val)
 
     def handle_orbita_pub_data(self, orbita_id: int, reg_type: OrbitaRegister, values: bytes):
         """Handle orbita update received on a gate client."""
-        if orbita_id not in self.orbita4id and self.logger is not None:
-            self.logger.info(f'Orbita id={orbita_id} not in config!')
+        if orbita_id not in self.orbita4id:
+            self.log_rate_limiter.log(self.logger, INFO, ('unknown_orbita', orbita_id), 'Orbita id=%d not in config!', orbita_id)
             return
         self.orbita4id[orbita_id].update_value(reg_type, values)
+        self.round_trips.received(('orbita', orbita_id, reg_type.value))
+
+        last_sent = self._last_sent_orbita.get(orbita_id)
+        if last_sent:
+            n = len(values) // 3
+            for motor_id in range(3):
+                key, value = (reg_type.value, motor_id), values[motor_id * n: (motor_id + 1) * n]
+                if last_sent.get(key, value) != value:
+                    # The disk did not keep the last write, the next one has to be sent.
+                    last_sent.pop(key, None)
+        if reg_type == OrbitaRegister.present_position and self._subscriptions:
+            self._notify_subscriptions(('orbita', orbita_id))
+
+    def subscribe(self, joint_names: List[str], callback: Callable[[List[JointSample]], None]) -> 'JointSubscription':
+        """Call callback with the latest present position samples each time all specified joints have received a new one.
+
+        The callback is run by the gate reader thread which received the last missing sample, so it should return quickly.
+        """
+        keys = set()
+        for name in joint_names:
+            orbita_name = name.partition('_')[0]
+            if name in self.dxls:
+                keys.add(('dxl', self.dxls[name].id))
+            elif orbita_name in self.orbitas:
+                keys.add(('orbita', self.orbitas[orbita_name].id))
+            else:
+                raise ValueError(f'"{name}" is an unknown joints!')
+
+        subscription = JointSubscription(self, joint_names, keys, callback)
+        with self._subscriptions_lock:
+            # Lists are replaced (never modified) so reader threads can iterate over them without locking.
+            for key in keys:
+                self._subscriptions[key] = self._subscriptions.get(key, []) + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: 'JointSubscription'):
+        """Stop calling the subscription callback."""
+        with self._subscriptions_lock:
+            for key in subscription.keys:
+                subscriptions = [s for s in self._subscriptions.get(key, []) if s is not subscription]
+                if subscriptions:
+                    self._subscriptions[key] = subscriptions
+                else:
+                    self._subscriptions.pop(key, None)
+
+    async def stream(self, joint_names: List[str], maxsize: int = 1) -> AsyncIterator[List[JointSample]]:
+        """Iterate asynchronously over the complete present position samples of the specified joints.
+
+        At most maxsize samples are queued, the oldest ones are dropped if the consumer is too slow.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+        def push(samples: List[JointSample]):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(samples)
+
+        def forward(samples: List[JointSample]):
+            try:
+                loop.call_soon_threadsafe(push, samples)
+            except RuntimeError:
+                # The event loop has been closed before the subscription was cancelled.
+                pass
+
+        subscription = self.subscribe(joint_names, forward)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            subscription.cancel()
+
+    def _notify_subscriptions(self, key: Tuple[str, int]):
+        for subscription in self._subscriptions.get(key, ()):
+            if subscription.received(key):
+                subscription.callback(self.get_latest_joints_value('present_position', subscription.joint_names))
 
     def handle_fan_pub_data(self, fan_ids: List[int], states: List[int]):
         """Handle fan state update received on a gate client."""
@@ -565,6 +955,64 @@ class Reachy(GateProtocol):
         raise AssertionError(msg)
 
 
+class CommandBatch:
+    """Writes to several registers gathered and sent together by Reachy.set_joints_values."""
+
+    def __init__(self, reachy: Reachy) -> None:
+        """Start an empty batch."""
+        self.reachy = reachy
+        self.values_for_register: Dict[str, Dict[str, float]] = {}
+
+    def __enter__(self):
+        """Enter context handler."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Send the batch (unless an exception occured)."""
+        if exc_type is None:
+            self.send()
+
+    def set_joints_value(self, register: str, value_for_joint: Dict[str, float]):
+        """Add writes of the value for the specified joints."""
+        self.values_for_register.setdefault(register, {}).update(value_for_joint)
+
+    def send(self):
+        """Send all gathered writes and empty the batch."""
+        values_for_register, self.values_for_register = self.values_for_register, {}
+        if values_for_register:
+            self.reachy.set_joints_values(values_for_register)
+
+
+class JointSubscription:
+    """Subscription to complete present position samples of a group of joints (see Reachy.subscribe)."""
+
+    def __init__(self,
+                 reachy: Reachy, joint_names: List[str], keys: Set[Tuple[str, int]],
+                 callback: Callable[[List[JointSample]], None],
+                 ) -> None:
+        """Wait for a first sample of each device."""
+        self.reachy = reachy
+        self.joint_names = joint_names
+        self.keys = frozenset(keys)
+        self.callback = callback
+
+        self._lock = Lock()
+        self._waiting_for = set(self.keys)
+
+    def received(self, key: Tuple[str, int]) -> bool:
+        """Mark a new sample of the device as received, returns True when the group sample is complete."""
+        with self._lock:
+            self._waiting_for.discard(key)
+            if self._waiting_for:
+                return False
+            self._waiting_for = set(self.keys)
+            return True
+
+    def cancel(self):
+        """Unsubscribe."""
+        self.reachy.unsubscribe(self)
+
+
 class MissingContainerError(Exception):
     """Custom exception for missing container."""
 
@@ -0,0 +1,141 @@
+"""Binary recording of the raw gate traffic and its offline replay.
+
+A recording starts with a magic header, followed by one record per received chunk or sent frame:
+[TIMESTAMP (float64), DIRECTION (uint8), LENGTH (uint16), (DATA)+] (little endian).
+Received data is recorded as read from the serial port, so replaying it also exercises the frame parsing.
+"""
+
+import os
+import re
+import struct
+import time
+
+from collections import namedtuple
+from threading import Lock
+from typing import Iterator, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .pycore import GateProtocol
+
+TrafficRecord = namedtuple('TrafficRecord', ('timestamp', 'direction', 'data'))
+
+RX = 0
+TX = 1
+
+MAGIC = b'RPLH\x01'
+record_header = struct.Struct('<dBH')
+
+
+def get_traffic_recording_file(port: str) -> Optional[str]:
+    """Get the file the traffic of the gate on port should be recorded to (None unless REACHY_TRAFFIC_RECORDING_DIR is set).
+
+    The name is made unique by the process id, so a quick restart never reuses the previous recording.
+    """
+    recording_dir = os.getenv('REACHY_TRAFFIC_RECORDING_DIR')
+    if not recording_dir:
+        return None
+
+    name = re.sub(r'[^\w.-]', '_', port.split('/')[-1])
+    return os.path.join(recording_dir, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.rec')
+
+
+class TrafficRecorder:
+    """Append timestamped raw RX/TX traffic to a recording file.
+
+    Writes go through a large user space buffer, so recording a chunk costs a header pack and a buffered write.
+    """
+
+    def __init__(self, path: str, buffering: int = 1 << 20) -> None:
+        """Create the recording file (and its directory if needed) and write its header.
+
+        An existing file is never appended to, as its timestamps would come from another clock origin (FileExistsError).
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'xb', buffering=buffering)
+        self._file.write(MAGIC)
+        self._lock = Lock()
+
+    def record(self, direction: int, data: bytes):
+        """Append data received (RX) or sent (TX) now (split in several records if longer than 64KB)."""
+        timestamp = time.monotonic()
+        with self._lock:
+            if self._file.closed:
+                return
+            for i in range(0, len(data), 0xFFFF):
+                chunk = data[i: i + 0xFFFF]
+                self._file.write(record_header.pack(timestamp, direction, len(chunk)))
+                self._file.write(chunk)
+
+    def record_rx(self, data: bytes):
+        """Append received data."""
+        self.record(RX, data)
+
+    def record_tx(self, data: bytes):
+        """Append sent data."""
+        self.record(TX, data)
+
+    def flush(self):
+        """Write the buffered records to the file."""
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """Flush and close the recording file."""
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        """Enter context handler."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Close the recording file."""
+        self.close()
+
+
+def read_recording(path: str) -> Iterator[TrafficRecord]:
+    """Iterate over the records of a recording file (a truncated last record is ignored)."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'"{path}" is not a traffic recording!')
+
+        while True:
+            header = f.read(record_header.size)
+            if len(header) < record_header.size:
+                return
+            timestamp, direction, length = record_header.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield TrafficRecord(timestamp, direction, data)
+
+
+def replay(path: str, protocol: 'GateProtocol', speed: Optional[float] = 1.0) -> int:
+    """Feed the received traffic of a recording to protocol, returns the number of replayed chunks.
+
+    Chunks are replayed at the recorded pace divided by speed (eg. 10 for ten times faster),
+    or as fast as possible if speed is None.
+    Sent traffic is skipped, protocol.send_msg is never called.
+    """
+    nb_chunks = 0
+    start = time.monotonic()
+    first_timestamp = None
+
+    for timestamp, direction, data in read_recording(path):
+        if direction != RX:
+            continue
+
+        if speed is not None:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = start + (timestamp - first_timestamp) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        protocol.data_received(bytearray(data))
+        nb_chunks += 1
+
+    return nb_chunks
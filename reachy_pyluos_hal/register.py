@@ -1,9 +1,145 @@
 """Synced register class."""
 
 import time
+import weakref
 
-from threading import Event
-from typing import Callable, Union
+from array import array
+from threading import Condition, Lock, RLock
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+class RegisterStore:
+    """Array-backed state shared by all registers of a same kind.
+
+    Each register owns a slot in preallocated numpy buffers: its raw value, a sequence counter,
+    a monotonic timestamp of its last update and whether it has been set since its last reset.
+
+    Writers publish using a seqlock (the sequence is odd while a write is in progress).
+    A register may be written both by a user thread (eg. goals) and by its gate reader thread,
+    so writers of a same slot are serialized by a lock of their own: writers of different slots
+    (eg. the reader threads of different gates) never contend, and readers take consistent snapshots without blocking.
+    Only waiting for a new value (after a reset) goes through a condition.
+    """
+
+    capacity = 256
+    num_bytes = 16
+
+    stores: Dict[str, List['RegisterStore']] = {}
+    # Reentrant as slots may be released by the garbage collector while allocating.
+    stores_lock = RLock()
+
+    def __init__(self, kind: str) -> None:
+        """Preallocate the buffers for all slots.
+
+        Buffers are allocated as plain arrays (fast per slot access from Python)
+        and exposed as numpy views on the same memory (vectorized access over all slots).
+        """
+        self.kind = kind
+
+        self._values = bytearray(self.capacity * self.num_bytes)
+        self._lengths = bytearray(self.capacity)
+        self._seqs = array('Q', bytes(8 * self.capacity))
+        self._timestamps = array('d', bytes(8 * self.capacity))
+        self._synced = bytearray(self.capacity)
+
+        self.values = np.frombuffer(self._values, dtype=np.uint8).reshape(self.capacity, self.num_bytes)
+        self.lengths = np.frombuffer(self._lengths, dtype=np.uint8)
+        self.seqs = np.frombuffer(self._seqs, dtype=np.uint64)
+        self.timestamps = np.frombuffer(self._timestamps, dtype=np.float64)
+        self.synced = np.frombuffer(self._synced, dtype=bool)
+
+        self._free_slots = list(reversed(range(self.capacity)))
+        self._write_locks = [Lock() for _ in range(self.capacity)]
+        self._synced_cond = Condition(Lock())
+        self._nb_waiters = 0
+
+    @classmethod
+    def allocate(cls, kind: str) -> Tuple['RegisterStore', int]:
+        """Find a free slot for a new register of the given kind."""
+        with cls.stores_lock:
+            stores = cls.stores.setdefault(kind, [])
+            for store in stores:
+                if store._free_slots:
+                    break
+            else:
+                store = cls(kind)
+                stores.append(store)
+
+            slot = store._free_slots.pop()
+
+        store._seqs[slot] = 0
+        store._lengths[slot] = 0
+        store._timestamps[slot] = 0.0
+        store._synced[slot] = False
+
+        return store, slot
+
+    def release(self, slot: int):
+        """Give back a slot once its register is gone."""
+        with self.stores_lock:
+            self._synced[slot] = False
+            self._free_slots.append(slot)
+
+    def write(self, slot: int, val: bytes):
+        """Publish a new raw value for the register in slot."""
+        n = len(val)
+        if n > self.num_bytes:
+            raise ValueError(f'Register value too long ({n} > {self.num_bytes} bytes)!')
+
+        offset = slot * self.num_bytes
+
+        with self._write_locks[slot]:
+            seq = self._seqs[slot] + 1
+            self._seqs[slot] = seq
+            self._values[offset: offset + n] = val
+            self._lengths[slot] = n
+            self._timestamps[slot] = time.monotonic()
+            self._synced[slot] = True
+            self._seqs[slot] = seq + 1
+
+        if self._nb_waiters:
+            with self._synced_cond:
+                self._synced_cond.notify_all()
+
+    def read(self, slot: int) -> Tuple[Optional[bytes], float, int]:
+        """Take a consistent snapshot (raw value, timestamp, sequence) of the register in slot without blocking.
+
+        The value is None if the register has never been written.
+        """
+        offset = slot * self.num_bytes
+
+        while True:
+            seq = self._seqs[slot]
+            if seq & 1:
+                # A write is in progress on another thread, let it finish.
+                time.sleep(0)
+                continue
+
+            val = bytes(self._values[offset: offset + self._lengths[slot]])
+            timestamp = self._timestamps[slot]
+
+            if self._seqs[slot] == seq:
+                return (val if seq > 0 else None), timestamp, seq
+
+    def wait(self, slot: int, timeout: float) -> bool:
+        """Wait for the register in slot to be set, returns False on timeout."""
+        if self._synced[slot]:
+            return True
+
+        deadline = time.monotonic() + timeout
+        with self._synced_cond:
+            self._nb_waiters += 1
+            try:
+                while not self._synced[slot]:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._synced_cond.wait(remaining)
+                return True
+            finally:
+                self._nb_waiters -= 1
 
 
 class Register:
@@ -13,42 +149,66 @@ class Register:
                  cvt_as_usi: Callable[[bytes], float],
                  cvt_as_raw: Callable[[float], bytes],
                  timeout: float = 0.015,
+                 kind: str = 'default',
                  ) -> None:
         """Set up the register with a None value by default."""
-        self.val: Union[bytes, None] = None
-        self.timestamp = 0.0
-        self.synced = Event()
+        self.store, self.slot = RegisterStore.allocate(kind)
+        weakref.finalize(self, self.store.release, self.slot)
         self.timeout = timeout
 
         self.cvt_as_usi = cvt_as_usi
         self.cvt_as_raw = cvt_as_raw
 
+    @property
+    def val(self) -> Union[bytes, None]:
+        """Get the current raw value (None if it has been reset)."""
+        if not self.is_set():
+            return None
+        return self.store.read(self.slot)[0]
+
+    @property
+    def timestamp(self) -> float:
+        """Get the monotonic time of the last update (0.0 if it has never been updated)."""
+        return self.store._timestamps[self.slot]
+
+    @property
+    def update_count(self) -> int:
+        """Get the number of updates received since the register was created."""
+        return self.store._seqs[self.slot] // 2
+
     def is_set(self) -> bool:
         """Check if the register has been set since last reset."""
-        return self.synced.is_set()
+        return bool(self.store._synced[self.slot])
 
     def update(self, val: bytes):
         """Update the register with a raw value retrieve from its associated gate."""
-        self.val = val
-        self.timestamp = time.time()
-        self.synced.set()
+        self.store.write(self.slot, val)
 
     def update_using_usi(self, val: float):
         """Update the register with a USI value retrieve from its associated gate."""
         self.update(self.cvt_as_raw(val))
 
+    def wait(self, timeout: float) -> bool:
+        """Wait (up to timeout) for the register to be set, returns False on timeout."""
+        return self.store.wait(self.slot, timeout)
+
     def get(self) -> bytes:
         """Wait for an updated value and returns it."""
-        if not self.synced.wait(self.timeout):
+        if not self.store.wait(self.slot, self.timeout):
             raise TimeoutError
-        assert self.val is not None
-        return self.val
+        val = self.store.read(self.slot)[0]
+        assert val is not None
+        return val
 
     def get_as_usi(self) -> float:
         """Wait for an updated value and returns it converted as USI units."""
         return self.cvt_as_usi(self.get())
 
+    def snapshot(self) -> Tuple[Optional[bytes], float]:
+        """Get the last received raw value and its timestamp without waiting, even if it has been reset since."""
+        val, timestamp, _ = self.store.read(self.slot)
+        return val, timestamp
+
     def reset(self):
         """Mark the value as obsolete."""
-        self.synced.clear()
-        self.val = None
+        self.store._synced[self.slot] = False
@@ -0,0 +1,106 @@
+"""Deadline based retry policy for register reads."""
+
+import time
+
+from logging import Logger
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Optional
+
+from .register import Register
+
+
+class RetryPolicy:
+    """Wait for registers with an overall deadline, re-requesting only the missing ones with an exponential backoff.
+
+    The first attempt waits for timeout, each following one waits backoff times longer (up to max_timeout).
+    Waits return as soon as the registers are updated.
+    Stalls (reads which needed at least one retry) are accounted in stats,
+    and the number of times each key had to be re-requested in retries_per_key.
+    """
+
+    def __init__(self,
+                 timeout: float = 0.015,
+                 backoff: float = 2.0,
+                 max_timeout: float = 0.25,
+                 deadline: float = 1.0,
+                 max_retries: int = 10,
+                 ) -> None:
+        """Set up the policy and its stall statistics."""
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_timeout = max_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+
+        self._stats_lock = Lock()
+        self.stats = {
+            'reads': 0,
+            'stalls': 0,
+            'retries': 0,
+            'failures': 0,
+            'stall_time': 0.0,
+            'max_stall_time': 0.0,
+        }
+        self.retries_per_key: Dict[str, int] = {}
+
+    def wait_for(self,
+                 registers: Dict[Hashable, Register],
+                 resend: Callable[[List[Hashable]], None],
+                 max_retries: Optional[int] = None,
+                 logger: Optional[Logger] = None,
+                 label: str = '',
+                 ):
+        """Wait for all registers to be set, calling resend with the keys of the missing ones before each retry.
+
+        Raises a TimeoutError if some are still missing after the deadline or max_retries.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+
+        start = time.monotonic()
+        deadline = start + self.deadline
+        timeout = self.timeout
+        missing = list(registers.keys())
+        retries = 0
+
+        while True:
+            attempt_deadline = min(time.monotonic() + timeout, deadline)
+            missing = [
+                key for key in missing
+                if not registers[key].wait(attempt_deadline - time.monotonic())
+            ]
+            if not missing:
+                self._record(start, retries, failed=False)
+                return
+
+            if retries >= max_retries or time.monotonic() >= deadline:
+                self._record(start, retries, failed=True)
+                raise TimeoutError(f'Timeout after {retries} retries: dev="{missing}" {label}')
+
+            if logger is not None:
+                logger.warning(f'Timeout occurs after GET cmd: dev="{missing}" {label}!')
+
+            retries += 1
+            timeout = min(timeout * self.backoff, self.max_timeout)
+            with self._stats_lock:
+                for key in missing:
+                    self.retries_per_key[str(key)] = self.retries_per_key.get(str(key), 0) + 1
+            resend(missing)
+
+    def snapshot(self) -> Dict:
+        """Get a copy of the stall statistics and of the retries per key."""
+        with self._stats_lock:
+            return dict(self.stats, retries_per_key=dict(self.retries_per_key))
+
+    def _record(self, start: float, retries: int, failed: bool):
+        with self._stats_lock:
+            self.stats['reads'] += 1
+            if retries == 0 and not failed:
+                return
+
+            stall = time.monotonic() - start
+            self.stats['stalls'] += 1
+            self.stats['retries'] += retries
+            self.stats['failures'] += int(failed)
+            self.stats['stall_time'] += stall
+            self.stats['max_stall_time'] = max(self.stats['max_stall_time'], stall)
@@ -0,0 +1,423 @@
+"""Hardware-free simulation of Reachy Luos gates.
+
+A SimulatedGate answers the gate protocol (detection, dynamixel, orbita and fan get/set, load tare and scale)
+and publishes present positions, temperatures and loads at configurable rates.
+Latency, dropped and corrupted frames can be injected.
+
+Simulated gates are reached through the pyserial URL "sim://<name>" (see protocol_sim), eg.:
+
+    ports = simulate_config('full_kit')
+    with Reachy('full_kit', logger, ports=ports) as reachy:
+        ...
+"""
+
+import heapq
+import random
+import struct
+import time
+
+from itertools import count
+from threading import Condition, RLock, Thread
+from typing import Dict, List, Optional, Tuple
+
+import serial
+
+from ..config import load_config
+from ..device import Device
+from ..dynamixel import DynamixelMotor
+from ..fan import DxlFan
+from ..force_sensor import ForceSensor
+from ..orbita import OrbitaActuator, OrbitaRegister
+from ..pycore import GateProtocol, LuosContainer
+
+if __name__ not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append(__name__)
+
+
+_simulated_gates: Dict[str, 'SimulatedGate'] = {}
+
+
+def register_simulated_gate(name: str, gate: 'SimulatedGate') -> str:
+    """Make the gate reachable as "sim://<name>" and return this URL."""
+    _simulated_gates[name] = gate
+    return f'sim://{name}'
+
+
+def unregister_simulated_gate(name: str):
+    """Remove a simulated gate (and stop it)."""
+    gate = _simulated_gates.pop(name, None)
+    if gate is not None:
+        gate.stop()
+
+
+def get_simulated_gate(name: str) -> 'SimulatedGate':
+    """Get the simulated gate registered as name."""
+    return _simulated_gates[name]
+
+
+def simulate_config(config_name: str, **gate_options) -> List[str]:
+    """Create and start one simulated gate per part of the config, returns their URLs."""
+    ports = []
+    for i, devices in enumerate(load_config(config_name)):
+        name = f'{config_name}_{i}'
+        unregister_simulated_gate(name)
+
+        gate = SimulatedGate(devices, **gate_options)
+        gate.start()
+        ports.append(register_simulated_gate(name, gate))
+    return ports
+
+
+class SimulatedGate:
+    """Simulated Luos gate with its connected devices.
+
+    Dynamixel and orbita motors reach their goal position instantly while their torque is enabled.
+    Publication only starts once a keep alive has been received on the current connection.
+    Frames sent by the gate are delayed by latency (in s), dropped with probability drop_rate,
+    and one of their bytes is overwritten with probability corruption_rate.
+    """
+
+    node_for_type = {'DynamixelMotor': 1, 'Load': 1, 'ControllerMotor': 2}
+
+    orbita_defaults = {
+        OrbitaRegister.angle_limit: struct.pack('ii', -4096, 4096),
+        OrbitaRegister.temperature_shutdown: struct.pack('f', 50.0),
+        OrbitaRegister.present_position: struct.pack('i', 0),
+        OrbitaRegister.present_speed: struct.pack('f', 0.0),
+        OrbitaRegister.present_load: struct.pack('f', 0.0),
+        OrbitaRegister.absolute_position: struct.pack('i', 0),
+        OrbitaRegister.goal_position: struct.pack('i', 0),
+        OrbitaRegister.moving_speed: struct.pack('f', 0.0),
+        OrbitaRegister.torque_limit: struct.pack('f', 100.0),
+        OrbitaRegister.torque_enable: bytes([0]),
+        OrbitaRegister.pid: struct.pack('fff', 4.0, 0.02, 0.0),
+        OrbitaRegister.temperature: struct.pack('f', 37.0),
+        OrbitaRegister.zero: struct.pack('i', 0),
+        OrbitaRegister.recalibrate: bytes([0]),
+        OrbitaRegister.magnetic_quality: bytes([0]),
+        OrbitaRegister.fan_state: bytes([0]),
+        OrbitaRegister.fan_trigger_temperature_threshold: struct.pack('f', 45.0),
+        OrbitaRegister.position_pub_period: bytes([10]),
+    }
+
+    def __init__(self,
+                 devices: Dict[str, Device],
+                 pub_period: float = 0.01,
+                 temperature_pub_period: float = 0.1,
+                 latency: float = 0.0,
+                 drop_rate: float = 0.0,
+                 corruption_rate: float = 0.0,
+                 seed: Optional[int] = None,
+                 ) -> None:
+        """Set up the simulated devices with their default register values."""
+        self.pub_period = pub_period
+        self.orbita_pub_period = pub_period
+        self.temperature_pub_period = temperature_pub_period
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.corruption_rate = corruption_rate
+        self.random = random.Random(seed)
+
+        self.dxls: Dict[int, Tuple[DynamixelMotor, bytearray]] = {}
+        self.orbitas: Dict[int, Dict[OrbitaRegister, List[bytes]]] = {}
+        # Force applied on each load sensor, published as (load - tare offset) * scale.
+        self.loads: Dict[int, float] = {}
+        self.load_offsets: Dict[int, float] = {}
+        self.load_scales: Dict[int, float] = {}
+        self.fans: Dict[int, int] = {}
+        self.containers: List[LuosContainer] = []
+
+        for dev in devices.values():
+            if isinstance(dev, DynamixelMotor):
+                self.dxls[dev.id] = (dev, self._dxl_memory(dev))
+                self.containers.append(LuosContainer(len(self.containers) + 2, f'dxl_{dev.id}', 'DynamixelMotor'))
+            elif isinstance(dev, OrbitaActuator):
+                self.orbitas[dev.id] = {reg: [val] * 3 for reg, val in self.orbita_defaults.items()}
+                self.containers.append(LuosContainer(len(self.containers) + 2, f'orbita_{dev.id}', 'ControllerMotor'))
+            elif isinstance(dev, ForceSensor):
+                self.loads[dev.id] = 0.0
+                self.load_offsets[dev.id] = 0.0
+                self.load_scales[dev.id] = 1.0
+                self.containers.append(LuosContainer(len(self.containers) + 2, f'load_{dev.id}', 'Load'))
+            elif isinstance(dev, DxlFan):
+                self.fans[dev.id] = 0
+
+        self.stats = {'received': 0, 'sent': 0, 'dropped': 0, 'corrupted': 0}
+
+        self._lock = RLock()
+        self._serial = None
+        self._publishing = False
+        self._rx = bytearray()
+        self._scheduled: List[Tuple[float, int, bytes]] = []
+        self._sequence = count()
+        self._wake_up = Condition(self._lock)
+        self._running = False
+
+        self._handlers = {
+            GateProtocol.MSG_TYPE_KEEP_ALIVE: self._on_keep_alive,
+            GateProtocol.MSG_TYPE_DXL_GET_REG: self._on_dxl_get,
+            GateProtocol.MSG_TYPE_DXL_SET_REG: self._on_dxl_set,
+            GateProtocol.MSG_TYPE_DXL_SET_POS_PUB_PERIOD: self._on_dxl_pub_period,
+            GateProtocol.MSG_TYPE_LOAD_TARE: self._on_load_tare,
+            GateProtocol.MSG_TYPE_LOAD_SET_SCALE: self._on_load_set_scale,
+            GateProtocol.MSG_TYPE_FAN_GET_STATE: self._on_fan_get,
+            GateProtocol.MSG_TYPE_FAN_SET_STATE: self._on_fan_set,
+            GateProtocol.MSG_TYPE_ORBITA_GET_REG: self._on_orbita_get,
+            GateProtocol.MSG_TYPE_ORBITA_SET_REG: self._on_orbita_set,
+            GateProtocol.MSG_DETECTION_GET_NODES: self._on_get_nodes,
+            GateProtocol.MSG_DETECTION_GET_CONTAINERS: self._on_get_containers,
+            GateProtocol.MSG_DETECTION_GET_CONTAINER_INFO: self._on_get_container_info,
+        }
+
+    def __enter__(self):
+        """Start the gate."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Stop the gate."""
+        self.stop()
+
+    def start(self):
+        """Start publishing (and sending the delayed frames)."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop publishing."""
+        with self._lock:
+            self._running = False
+            self._wake_up.notify_all()
+        if hasattr(self, '_thread'):
+            self._thread.join()
+
+    def connect(self, port):
+        """Connect a serial port (only one at a time, as a real gate)."""
+        with self._lock:
+            self._serial = port
+            self._publishing = False
+            self._rx.clear()
+
+    def disconnect(self, port):
+        """Disconnect the serial port."""
+        with self._lock:
+            if self._serial is port:
+                self._serial = None
+                self._scheduled.clear()
+
+    def receive(self, data: bytes):
+        """Handle the bytes sent to the gate."""
+        with self._lock:
+            self._rx.extend(data)
+            while len(self._rx) >= 3:
+                if self._rx[0] != 255 or self._rx[1] != 255:
+                    del self._rx[0]
+                    continue
+                end = 3 + self._rx[2]
+                if len(self._rx) < end:
+                    break
+                payload = bytes(self._rx[3:end])
+                del self._rx[:end]
+
+                self.stats['received'] += 1
+                handler = self._handlers.get(payload[0])
+                if handler is not None:
+                    handler(payload)
+
+    def send(self, payload: bytes):
+        """Send a frame to the connected port, with the injected latency and faults."""
+        with self._lock:
+            if self._serial is None:
+                return
+
+            if self.drop_rate > 0 and self.random.random() < self.drop_rate:
+                self.stats['dropped'] += 1
+                return
+
+            data = bytearray(GateProtocol.header + bytes([len(payload)]) + payload)
+            if self.corruption_rate > 0 and self.random.random() < self.corruption_rate:
+                data[self.random.randrange(len(data))] = self.random.randrange(256)
+                self.stats['corrupted'] += 1
+
+            if self.latency > 0:
+                heapq.heappush(self._scheduled, (time.monotonic() + self.latency, next(self._sequence), bytes(data)))
+                self._wake_up.notify_all()
+            else:
+                self._write(bytes(data))
+
+    def _write(self, data: bytes):
+        self.stats['sent'] += 1
+        self._serial.feed(data)
+
+    def _run(self):
+        next_pub = next_orbita_pub = next_temperature_pub = time.monotonic()
+
+        with self._lock:
+            while self._running:
+                now = time.monotonic()
+
+                while self._scheduled and self._scheduled[0][0] <= now:
+                    _, _, data = heapq.heappop(self._scheduled)
+                    if self._serial is not None:
+                        self._write(data)
+
+                if not self._publishing:
+                    next_pub = next_orbita_pub = next_temperature_pub = now
+                    self._wake_up.wait(self._scheduled[0][0] - now if self._scheduled else None)
+                    continue
+
+                if now >= next_pub:
+                    self._publish_dxls('present_position')
+                    self._publish_loads()
+                    next_pub = max(next_pub + self.pub_period, now)
+                if now >= next_orbita_pub:
+                    self._publish_orbitas(OrbitaRegister.present_position)
+                    next_orbita_pub = max(next_orbita_pub + self.orbita_pub_period, now)
+                if now >= next_temperature_pub:
+                    self._publish_dxls('temperature')
+                    next_temperature_pub = max(next_temperature_pub + self.temperature_pub_period, now)
+
+                next_event = min(next_pub, next_orbita_pub, next_temperature_pub)
+                if self._scheduled:
+                    next_event = min(next_event, self._scheduled[0][0])
+                self._wake_up.wait(max(0.0, next_event - time.monotonic()))
+
+    def _on_keep_alive(self, payload: bytes):
+        if not self._publishing:
+            self._publishing = True
+            self._wake_up.notify_all()
+
+    def _publish_dxls(self, register: str):
+        ids_per_config: Dict[Tuple[int, int], List[int]] = {}
+        for id, (motor, _) in self.dxls.items():
+            ids_per_config.setdefault(motor.get_register_config(register), []).append(id)
+
+        for (addr, num_bytes), ids in ids_per_config.items():
+            self.send(self._dxl_pub_data(addr, num_bytes, ids))
+
+    def _publish_loads(self):
+        if self.loads:
+            msg = bytearray([GateProtocol.MSG_TYPE_LOAD_PUB_DATA])
+            for id, force in self.loads.items():
+                msg += bytes([id]) + struct.pack('<f', (force - self.load_offsets[id]) * self.load_scales[id])
+            self.send(bytes(msg))
+
+    def _on_load_tare(self, payload: bytes):
+        id = payload[1]
+        if id in self.loads:
+            self.load_offsets[id] = self.loads[id]
+
+    def _on_load_set_scale(self, payload: bytes):
+        id = payload[1]
+        if id in self.loads:
+            self.load_scales[id] = struct.unpack('<f', payload[2:6])[0]
+
+    def _publish_orbitas(self, register: OrbitaRegister):
+        for orbita_id in self.orbitas:
+            self.send(self._orbita_pub_data(orbita_id, register))
+
+    def _dxl_memory(self, motor: DynamixelMotor) -> bytearray:
+        memory = bytearray(128)
+
+        def write(register: str, value: int):
+            addr, num_bytes = motor.get_register_config(register)
+            memory[addr: addr + num_bytes] = value.to_bytes(num_bytes, 'little')
+
+        write('id', motor.id)
+        write('present_position', motor.max_position // 2)
+        write('goal_position', motor.max_position // 2)
+        write('cw_angle_limit', 0)
+        write('ccw_angle_limit', motor.max_position - 1)
+        write('torque_limit', 1023)
+        write('temperature', 37)
+        write('temperature_limit', 55)
+        return memory
+
+    def _dxl_pub_data(self, addr: int, num_bytes: int, ids: List[int]) -> bytes:
+        msg = bytearray([GateProtocol.MSG_TYPE_DXL_PUB_DATA, addr, num_bytes])
+        for id in ids:
+            _, memory = self.dxls[id]
+            msg += bytes([id]) + struct.pack('<H', 0) + memory[addr: addr + num_bytes]
+        return bytes(msg)
+
+    def _on_dxl_get(self, payload: bytes):
+        addr, num_bytes = payload[1], payload[2]
+        ids = [id for id in payload[3:] if id in self.dxls]
+        if ids:
+            self.send(self._dxl_pub_data(addr, num_bytes, ids))
+
+    def _on_dxl_set(self, payload: bytes):
+        addr, num_bytes = payload[1], payload[2]
+        for i in range(3, len(payload), num_bytes + 1):
+            id = payload[i]
+            if id not in self.dxls:
+                continue
+            motor, memory = self.dxls[id]
+            memory[addr: addr + num_bytes] = payload[i + 1: i + 1 + num_bytes]
+
+            torque_addr, _ = motor.get_register_config('torque_enable')
+            goal_addr, _ = motor.get_register_config('goal_position')
+            present_addr, _ = motor.get_register_config('present_position')
+            if memory[torque_addr]:
+                if addr <= torque_addr < addr + num_bytes:
+                    # Enabling the torque keeps the motor where it is.
+                    memory[goal_addr: goal_addr + 2] = memory[present_addr: present_addr + 2]
+                memory[present_addr: present_addr + 2] = memory[goal_addr: goal_addr + 2]
+
+    def _on_dxl_pub_period(self, payload: bytes):
+        self.pub_period = payload[1] / 1000
+        self._wake_up.notify_all()
+
+    def _orbita_pub_data(self, orbita_id: int, register: OrbitaRegister) -> bytes:
+        return bytes([GateProtocol.MSG_TYPE_ORBITA_PUB_DATA, orbita_id, register.value]) + b''.join(self.orbitas[orbita_id][register])
+
+    def _on_orbita_get(self, payload: bytes):
+        orbita_id, register = payload[1], OrbitaRegister(payload[2])
+        if orbita_id in self.orbitas:
+            self.send(self._orbita_pub_data(orbita_id, register))
+
+    def _on_orbita_set(self, payload: bytes):
+        orbita_id, register = payload[1], OrbitaRegister(payload[2])
+        if orbita_id not in self.orbitas:
+            return
+        registers = self.orbitas[orbita_id]
+
+        num_bytes = len(self.orbita_defaults[register])
+        for i in range(3, len(payload), num_bytes + 1):
+            registers[register][payload[i]] = bytes(payload[i + 1: i + 1 + num_bytes])
+
+        if register == OrbitaRegister.goal_position:
+            registers[OrbitaRegister.present_position] = list(registers[OrbitaRegister.goal_position])
+        elif register == OrbitaRegister.position_pub_period:
+            self.orbita_pub_period = registers[register][0][0] / 1000
+            self._wake_up.notify_all()
+
+    def _on_fan_get(self, payload: bytes):
+        msg = bytearray([GateProtocol.MSG_TYPE_FAN_PUB_DATA])
+        for id in payload[1:]:
+            if id in self.fans:
+                msg += bytes([id, self.fans[id]])
+        self.send(bytes(msg))
+
+    def _on_fan_set(self, payload: bytes):
+        for id, state in zip(payload[1::2], payload[2::2]):
+            if id in self.fans:
+                self.fans[id] = state
+
+    def _on_get_nodes(self, payload: bytes):
+        nodes = sorted({self.node_for_type[c.type] for c in self.containers})
+        self.send(bytes([GateProtocol.MSG_DETECTION_PUB_NODES] + nodes))
+
+    def _on_get_containers(self, payload: bytes):
+        node_id = payload[1]
+        ids = [c.id for c in self.containers if self.node_for_type[c.type] == node_id]
+        self.send(bytes([GateProtocol.MSG_DETECTION_PUB_CONTAINERS, node_id] + ids))
+
+    def _on_get_container_info(self, payload: bytes):
+        for c in self.containers:
+            if c.id == payload[1]:
+                self.send(bytes([GateProtocol.MSG_DETECTION_PUB_CONTAINER_INFO, c.id]) + f'{c.alias} {c.type}'.encode())
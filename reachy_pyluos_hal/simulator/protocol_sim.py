@@ -0,0 +1,114 @@
+"""Pyserial URL handler for simulated gates: "sim://<name>" connects to the SimulatedGate registered as name."""
+
+import time
+
+from threading import Condition
+from urllib.parse import urlsplit
+
+from serial.serialutil import PortNotOpenError, SerialBase, SerialException
+
+
+class Serial(SerialBase):
+    """In-memory serial port connected to a simulated gate."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Prepare the input buffer."""
+        self._gate = None
+        self._rx = bytearray()
+        self._rx_cond = Condition()
+        self._read_cancelled = False
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        """Connect to the simulated gate named by the port URL."""
+        from . import get_simulated_gate
+
+        if self.is_open:
+            raise SerialException('Port is already open.')
+        if self._port is None:
+            raise SerialException('Port must be configured before it can be used.')
+
+        parts = urlsplit(self._port)
+        if parts.scheme != 'sim':
+            raise SerialException(f'expected a string in the form "sim://<name>": not starting with sim:// ({self._port!r})')
+        try:
+            self._gate = get_simulated_gate(parts.netloc)
+        except KeyError:
+            raise SerialException(f'No simulated gate named "{parts.netloc}"')
+
+        self._rx.clear()
+        self.is_open = True
+        self._gate.connect(self)
+
+    def close(self):
+        """Disconnect from the simulated gate."""
+        if self.is_open:
+            self.is_open = False
+            self._gate.disconnect(self)
+            with self._rx_cond:
+                self._rx_cond.notify_all()
+        super().close()
+
+    def _reconfigure_port(self):
+        """Ignore all port settings."""
+
+    def feed(self, data: bytes):
+        """Receive data sent by the simulated gate."""
+        with self._rx_cond:
+            self._rx.extend(data)
+            self._rx_cond.notify_all()
+
+    @property
+    def in_waiting(self) -> int:
+        """Return the number of bytes currently in the input buffer."""
+        if not self.is_open:
+            raise PortNotOpenError()
+        return len(self._rx)
+
+    def read(self, size: int = 1) -> bytes:
+        """Read up to size bytes, waiting for at least one until timeout (forever if None) or read cancellation."""
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        with self._rx_cond:
+            while not self._rx and self.is_open and not self._read_cancelled:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._rx_cond.wait(remaining)
+
+            self._read_cancelled = False
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+        return data
+
+    def cancel_read(self):
+        """Wake up a blocking read."""
+        with self._rx_cond:
+            self._read_cancelled = True
+            self._rx_cond.notify_all()
+
+    def write(self, data: bytes) -> int:
+        """Send data to the simulated gate."""
+        if not self.is_open:
+            raise PortNotOpenError()
+        self._gate.receive(bytes(data))
+        return len(data)
+
+    def reset_input_buffer(self):
+        """Clear input buffer."""
+        with self._rx_cond:
+            self._rx.clear()
+
+    def reset_output_buffer(self):
+        """Nothing to clear, data is sent immediately."""
+
+    def _update_break_state(self):
+        """Ignore break state."""
+
+    def _update_rts_state(self):
+        """Ignore RTS state."""
+
+    def _update_dtr_state(self):
+        """Ignore DTR state."""
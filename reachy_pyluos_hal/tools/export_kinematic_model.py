@@ -0,0 +1,35 @@
+"""Command line utility tool to export the pickled Orbita forward kinematic model as NumPy weights."""
+
+import argparse
+import pickle
+
+from pathlib import Path
+
+import numpy as np
+
+from ..orbita_kinematic_model import MLPForwardModel
+
+
+def main():
+    """Export a pickled scikit-learn MLPRegressor to a .npz file and check both give the same predictions."""
+    import reachy_pyluos_hal
+    model_dir = Path(reachy_pyluos_hal.__file__).parent
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', type=Path, default=model_dir / 'mlpreg.obj')
+    parser.add_argument('--output', type=Path, default=model_dir / 'mlpreg.npz')
+    args = parser.parse_args()
+
+    with open(args.input, 'rb') as f:
+        estimator = pickle.load(f)
+
+    model = MLPForwardModel.from_estimator(estimator)
+    model.save(args.output)
+
+    disks = np.random.uniform(-np.pi, np.pi, (10000, 3))
+    error = np.abs(MLPForwardModel.load(args.output).predict(disks) - estimator.predict(disks)).max()
+    print(f'Exported "{args.input}" to "{args.output}" (max error {error:.2e}).')
+
+
+if __name__ == '__main__':
+    main()
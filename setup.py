@@ -15,10 +15,14 @@ setup(
         'pyserial',
         'PyYAML',
         'scipy',
-        'sklearn',
     ],
 
-    package_data={'': ['config/*.yaml']},
+    extras_require={
+        # Only needed to load or export the original pickled kinematic model.
+        'sklearn': ['scikit-learn'],
+    },
+
+    package_data={'': ['config/*.yaml', 'mlpreg.npz', 'mlpreg.obj']},
 
     entry_points={
         'console_scripts': [
@@ -26,6 +30,7 @@ setup(
             'reachy-dynamixel-config=reachy_pyluos_hal.tools.reachy_dynamixel_config:main',
             'reachy-identify-model=reachy_pyluos_hal.tools.reachy_identify_model:main',
             'reachy-identify-zuuu-model=reachy_pyluos_hal.tools.reachy_identify_model:zuuu_config',
+            'reachy-export-kinematic-model=reachy_pyluos_hal.tools.export_kinematic_model:main',
         ],
     },
 
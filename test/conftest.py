@@ -0,0 +1,55 @@
+from reachy_pyluos_hal.pycore import GateProtocol
+
+
+def frame(payload):
+    return bytes([255, 255, len(payload)]) + payload
+
+
+class PayloadRecordingTransport:
+    """Transport keeping the payload (without the frame header) of every written frame."""
+
+    def __init__(self):
+        self.sent = []
+
+    def write(self, data):
+        self.sent.append(bytes(data[3:]))
+
+
+class PayloadRecordingProtocol(GateProtocol):
+    """Protocol keeping every received payload instead of dispatching it."""
+
+    def __init__(self):
+        super().__init__()
+        self.received = []
+
+    def handle_message(self, payload):
+        self.received.append(bytes(payload))
+
+
+class PubDataDecodingProtocol(GateProtocol):
+    """Protocol keeping the decoded dxl, load and fan published data."""
+
+    def __init__(self):
+        super().__init__()
+        self.decoded = []
+
+    def handle_dxl_pub_data(self, register, ids, errors, values):
+        self.decoded.append(('dxl', register, ids, errors, values))
+
+    def handle_load_pub_data(self, ids, values):
+        self.decoded.append(('load', ids, values))
+
+    def handle_fan_pub_data(self, fan_ids, states):
+        self.decoded.append(('fan', fan_ids, states))
+
+
+class FakeGateClient:
+    """GateClient replacement connected to a PayloadRecordingTransport instead of a serial port."""
+
+    def __init__(self, port, protocol_factory, recording_file=None, logger=None):
+        self.port = port
+        self.protocol = protocol_factory()
+        self.protocol.transport = PayloadRecordingTransport()
+
+    def start(self):
+        pass
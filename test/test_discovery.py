@@ -0,0 +1,148 @@
+import pytest
+
+from reachy_pyluos_hal import discovery
+from reachy_pyluos_hal.config import load_config
+from reachy_pyluos_hal.dynamixel import DynamixelMotor
+from reachy_pyluos_hal.force_sensor import ForceSensor
+from reachy_pyluos_hal.orbita import OrbitaActuator
+from reachy_pyluos_hal.pycore import LuosContainer
+
+
+def containers_for(devices):
+    containers = []
+    for dev in devices.values():
+        if isinstance(dev, DynamixelMotor):
+            containers.append(LuosContainer(dev.id, f'dxl_{dev.id}', 'DynamixelMotor'))
+        elif isinstance(dev, ForceSensor):
+            containers.append(LuosContainer(dev.id, f'load_{dev.id}', 'Load'))
+        elif isinstance(dev, OrbitaActuator):
+            containers.append(LuosContainer(dev.id, f'orbita_{dev.id}', 'ControllerMotor'))
+    return containers
+
+
+def test_find_gates_runs_a_single_detection(monkeypatch):
+    parts = load_config('full_kit')
+    ports = ['/dev/gate0', '/dev/gate1', '/dev/gate2']
+    detected = {port: containers_for(devices) for port, devices in zip(ports, reversed(parts))}
+
+    calls = []
+
+    def identify(port, logger=None):
+        calls.append(port)
+        return {0: detected[port]}
+
+    monkeypatch.setattr(discovery, 'identify_luos_containers', identify)
+
+    solutions = discovery.find_gates(parts, ports, logger=None)
+    assert sorted(calls) == ports
+    assert [port for port, _, _ in solutions] == list(reversed(ports))
+    assert all(len(missing) == 0 for _, _, missing in solutions)
+
+
+def test_find_gates_retries_when_missing(monkeypatch):
+    parts = load_config('mini')
+    attempts = []
+
+    def identify(port, logger=None):
+        attempts.append(port)
+        if len(attempts) < 3:
+            raise TimeoutError
+        return {0: containers_for(parts[0])}
+
+    monkeypatch.setattr(discovery, 'identify_luos_containers', identify)
+
+    [(port, matching, missing)] = discovery.find_gates(parts, ['/dev/gate0'], logger=None)
+    assert len(attempts) == 3
+    assert port == '/dev/gate0'
+    assert missing == []
+
+
+def test_find_gates_stops_retrying_on_deterministic_failure(monkeypatch):
+    parts = load_config('mini')
+    calls = []
+
+    def identify(port, logger=None):
+        calls.append(port)
+        return {0: containers_for(parts[0])[1:]}
+
+    monkeypatch.setattr(discovery, 'identify_luos_containers', identify)
+
+    [(port, matching, missing)] = discovery.find_gates(parts, ['/dev/gate0'], logger=None, retry=10)
+    assert len(calls) == 2
+    assert port == '/dev/gate0'
+    assert len(missing) == 1
+
+
+def test_find_gate_is_deprecated(monkeypatch):
+    parts = load_config('mini')
+    monkeypatch.setattr(discovery, 'identify_luos_containers', lambda port, logger=None: {0: containers_for(parts[0])})
+
+    with pytest.deprecated_call():
+        port, matching, missing = discovery.find_gate(parts[0], ['/dev/gate0'], None)
+    assert port == '/dev/gate0'
+    assert missing == []
+
+
+def test_discovery_cache_roundtrip(tmp_path):
+    cache_file = str(tmp_path / 'cache.json')
+    assert discovery.load_discovery_cache(cache_file) == {}
+
+    containers = {'/dev/gate0': [LuosContainer(10, 'dxl_10', 'DynamixelMotor')]}
+    discovery.save_discovery_cache(cache_file, containers)
+    assert discovery.load_discovery_cache(cache_file) == containers
+
+    with open(cache_file, 'w') as f:
+        f.write('{corrupted')
+    assert discovery.load_discovery_cache(cache_file) == {}
+
+
+def test_discovery_cache_is_never_half_written(tmp_path, monkeypatch):
+    cache_file = str(tmp_path / 'cache.json')
+    containers = {'/dev/gate0': [LuosContainer(10, 'dxl_10', 'DynamixelMotor')]}
+    discovery.save_discovery_cache(cache_file, containers)
+
+    def crash(*args, **kwargs):
+        raise OSError
+
+    monkeypatch.setattr(discovery.json, 'dump', crash)
+    discovery.save_discovery_cache(cache_file, {'/dev/gate1': []})
+
+    assert discovery.load_discovery_cache(cache_file) == containers
+    assert [p.name for p in tmp_path.iterdir()] == ['cache.json']
+
+
+def test_discovery_cache_is_opt_in(monkeypatch):
+    monkeypatch.delenv('REACHY_DISCOVERY_CACHE_FILE', raising=False)
+    assert discovery.get_discovery_cache_file() is None
+
+    monkeypatch.setenv('REACHY_DISCOVERY_CACHE_FILE', '/tmp/cache.json')
+    assert discovery.get_discovery_cache_file() == '/tmp/cache.json'
+
+
+def test_find_gates_skips_detection_with_valid_cache(monkeypatch, tmp_path):
+    parts = load_config('full_kit')
+    ports = ['/dev/gate0', '/dev/gate1', '/dev/gate2']
+    detected = {port: containers_for(devices) for port, devices in zip(ports, parts)}
+    cache_file = str(tmp_path / 'cache.json')
+
+    calls = []
+
+    def identify(port, logger=None):
+        calls.append(port)
+        return {0: detected[port]}
+
+    monkeypatch.setattr(discovery, 'identify_luos_containers', identify)
+    monkeypatch.setattr(discovery, 'check_luos_containers', lambda port, containers, logger=None: True)
+
+    solutions = discovery.find_gates(parts, ports, logger=None, cache_file=cache_file)
+    assert sorted(calls) == ports
+    assert discovery.load_discovery_cache(cache_file) == detected
+
+    calls.clear()
+    assert discovery.find_gates(parts, ports, logger=None, cache_file=cache_file) == solutions
+    assert calls == []
+
+    # A gate whose topology changed is detected again.
+    monkeypatch.setattr(discovery, 'check_luos_containers', lambda port, containers, logger=None: port != '/dev/gate1')
+    assert discovery.find_gates(parts, ports, logger=None, cache_file=cache_file) == solutions
+    assert calls == ['/dev/gate1']
@@ -0,0 +1,66 @@
+import numpy as np
+
+from reachy_pyluos_hal.config import load_config
+from reachy_pyluos_hal.dynamixel import DynamixelMotor, DynamixelPositionConverter, coalesce_writes
+
+
+def get_motors():
+    motors = []
+    for part in load_config('full_kit'):
+        motors += [dev for dev in part.values() if isinstance(dev, DynamixelMotor)]
+    return motors
+
+
+def test_position_converter_matches_motors():
+    motors = get_motors()
+    converter = DynamixelPositionConverter(motors)
+
+    positions = np.linspace(-1.5, 1.5, len(motors))
+    raw_values = converter.to_raw(positions)
+    assert raw_values == [m.position_to_raw(p) for m, p in zip(motors, positions)]
+
+    usi = converter.to_usi(b''.join(raw_values))
+    expected = [m.position_to_usi(r) for m, r in zip(motors, raw_values)]
+    assert np.allclose(usi, expected)
+
+
+def test_position_converter_subsets_by_indices():
+    motors = get_motors()
+    converter = DynamixelPositionConverter(motors)
+    indices = np.array([3, 0, 5])
+    subset = DynamixelPositionConverter([motors[i] for i in indices])
+
+    positions = [0.5, -0.2, 1.0]
+    raw_values = converter.to_raw(positions, indices)
+    assert raw_values == subset.to_raw(positions)
+    assert np.allclose(converter.to_usi(b''.join(raw_values), indices), subset.to_usi(b''.join(raw_values)))
+
+
+def test_position_converter_clips_corrupted_values():
+    motors = get_motors()[:2]
+    converter = DynamixelPositionConverter(motors)
+
+    raw = np.array([motors[0].max_position + 10, 0], dtype='<u2').tobytes()
+    usi = converter.to_usi(raw)
+    assert np.isclose(usi[0], motors[0].position_to_usi(np.array([motors[0].max_position], dtype='<u2').tobytes()))
+
+
+def test_coalesce_contiguous_writes():
+    writes = {
+        # V1 layout: goal_position (30), moving_speed (32), torque_limit (34)
+        10: {30: b'\x01\x00', 32: b'\x02\x00', 34: b'\x03\x00'},
+        11: {30: b'\x04\x00', 32: b'\x05\x00', 34: b'\x06\x00'},
+        # V2 layout: torque_limit (35) is not contiguous
+        12: {30: b'\x07\x00', 32: b'\x08\x00', 35: b'\x09\x00'},
+    }
+
+    assert coalesce_writes(writes) == [
+        (30, 4, {12: b'\x07\x00\x08\x00'}),
+        (30, 6, {10: b'\x01\x00\x02\x00\x03\x00', 11: b'\x04\x00\x05\x00\x06\x00'}),
+        (35, 2, {12: b'\x09\x00'}),
+    ]
+
+
+def test_coalesce_single_register():
+    writes = {10: {30: b'\x01\x00'}, 11: {30: b'\x02\x00'}}
+    assert coalesce_writes(writes) == [(30, 2, {10: b'\x01\x00', 11: b'\x02\x00'})]
@@ -0,0 +1,27 @@
+import logging
+
+from reachy_pyluos_hal.log import RateLimiter
+
+
+def test_repeated_messages_are_rate_limited(caplog):
+    logger = logging.getLogger('test_log')
+    limiter = RateLimiter(period=3600)
+
+    with caplog.at_level(logging.WARNING, logger='test_log'):
+        for _ in range(10):
+            limiter.log(logger, logging.WARNING, ('dxl_error', 10), 'Dynamixel error %d on motor id=%d!', 4, 10)
+        limiter.log(logger, logging.WARNING, ('dxl_error', 11), 'Dynamixel error %d on motor id=%d!', 4, 11)
+        limiter.log(logger, logging.DEBUG, 'debug', 'Not enabled')
+
+    assert [r.getMessage() for r in caplog.records] == [
+        'Dynamixel error 4 on motor id=10!',
+        'Dynamixel error 4 on motor id=11!',
+    ]
+
+    limiter.period = 0.0
+    with caplog.at_level(logging.WARNING, logger='test_log'):
+        limiter.log(logger, logging.WARNING, ('dxl_error', 10), 'Dynamixel error %d on motor id=%d!', 4, 10)
+
+    assert caplog.records[-1].getMessage() == 'Dynamixel error 4 on motor id=10! (9 similar messages suppressed)'
+    # Nothing is formatted when there is no logger.
+    limiter.log(None, logging.WARNING, 'key', '%d', 'not a number')
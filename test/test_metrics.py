@@ -0,0 +1,107 @@
+import sys
+import threading
+
+from reachy_pyluos_hal.metrics import LatencyHistogram, RoundTripTracker
+from reachy_pyluos_hal.pycore import GateProtocol
+
+from conftest import PayloadRecordingTransport, PubDataDecodingProtocol, frame
+
+
+def test_histogram_quantiles():
+    histogram = LatencyHistogram()
+    for _ in range(99):
+        histogram.record(0.0001)
+    histogram.record(0.5)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100
+    assert snapshot['p50_us'] == 100
+    assert snapshot['max_us'] == 500000
+    assert sum(snapshot['buckets'].values()) == 100
+
+    assert LatencyHistogram().snapshot()['p99_us'] == 0.0
+
+
+def test_round_trips_are_measured_per_register():
+    tracker = RoundTripTracker()
+    tracker.sent('dxl.present_position', ('dxl', 10, 36))
+    tracker.sent('dxl.temperature', ('dxl', 10, 43))
+    tracker.received(('dxl', 10, 36))
+    # Unrequested (eg. published) values are ignored.
+    tracker.received(('dxl', 11, 36))
+
+    snapshot = tracker.snapshot()
+    assert snapshot['pending'] == 1
+    assert list(snapshot['registers']) == ['dxl.present_position']
+    assert snapshot['registers']['dxl.present_position']['count'] == 1
+
+
+def test_gate_traffic_counters():
+    protocol = PubDataDecodingProtocol()
+    protocol.measure_handler_durations = True
+    protocol.transport = PayloadRecordingTransport()
+
+    fan_pub = frame(bytes([GateProtocol.MSG_TYPE_FAN_PUB_DATA, 1, 0]))
+    protocol.data_received(bytearray([1, 2]) + fan_pub + fan_pub)
+    protocol.send_keep_alive()
+
+    metrics = protocol.get_metrics()
+    assert metrics['bytes_received'] == 14
+    assert metrics['frames_received'] == 2
+    assert metrics['corrupted_buffers'] == 1
+    assert metrics['bytes_sent'] == 4
+    assert metrics['frames_sent'] == 1
+    assert metrics['handler_durations']['fan_pub_data']['count'] == 2
+    assert protocol.decoded == [('fan', [1], [0])] * 2
+    assert protocol.transport.sent == [bytes([GateProtocol.MSG_TYPE_KEEP_ALIVE])]
+
+
+def test_handler_durations_are_not_measured_by_default():
+    protocol = PubDataDecodingProtocol()
+    protocol.data_received(bytearray(frame(bytes([GateProtocol.MSG_TYPE_FAN_PUB_DATA, 1, 0]))))
+
+    metrics = protocol.get_metrics()
+    assert metrics['frames_received'] == 1
+    assert metrics['handler_durations'] == {}
+
+
+def run_concurrently(target, nb_threads=4):
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=target, args=(i, )) for i in range(nb_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_concurrent_senders_are_all_counted():
+    protocol = PubDataDecodingProtocol()
+    protocol.transport = PayloadRecordingTransport()
+    nb_sends = 5000
+
+    run_concurrently(lambda _: [protocol.send_keep_alive() for _ in range(nb_sends)])
+
+    metrics = protocol.get_metrics()
+    assert metrics['frames_sent'] == 4 * nb_sends
+    assert metrics['bytes_sent'] == 4 * 4 * nb_sends
+    assert len(protocol.transport.sent) == 4 * nb_sends
+
+
+def test_concurrent_round_trips():
+    tracker = RoundTripTracker()
+    nb_requests = 5000
+
+    def request_and_answer(i):
+        for j in range(nb_requests):
+            tracker.sent('dxl.temperature', ('dxl', i, j))
+            tracker.received(('dxl', i, j))
+
+    run_concurrently(request_and_answer)
+
+    snapshot = tracker.snapshot()
+    assert snapshot['pending'] == 0
+    assert snapshot['registers']['dxl.temperature']['count'] == 4 * nb_requests
@@ -0,0 +1,126 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from reachy_pyluos_hal.config import load_config
+from reachy_pyluos_hal.orbita_kinematic_model import MLPForwardModel
+
+
+def get_orbita():
+    return load_config('mini')[0]['neck']
+
+
+def test_forward_batch_matches_forward():
+    orbita = get_orbita()
+
+    rng = np.random.default_rng(0)
+    disks = rng.uniform(-0.5, 0.5, (20, 3))
+
+    rpys = orbita.forward_batch(disks)
+    assert rpys.shape == (20, 3)
+    for d, rpy in zip(disks, rpys):
+        assert np.allclose(orbita.forward(d), rpy)
+
+
+def test_inverse_batch_matches_inverse():
+    t = np.linspace(0, 10, 200)
+    rpys = np.stack([0.4 * np.sin(t), 0.3 * np.sin(1.3 * t), 1.5 * np.sin(0.7 * t)], axis=1)
+
+    orbita = get_orbita()
+    expected = np.array([orbita.inverse(rpy) for rpy in rpys])
+
+    orbita = get_orbita()
+    disks = orbita.inverse_batch(rpys)
+
+    assert disks.shape == (200, 3)
+    assert np.allclose(disks, expected)
+    assert np.allclose(orbita.kin_model.last_angles[0], expected[-1][0])
+
+
+
+# Quaternions (x, y, z, w) of a roll, pitch, yaw trajectory whose yaw crosses +-pi back and forth,
+# and the disk positions computed for them, in this order, by the former pyquaternion implementation.
+GOLDEN_QUATERNIONS = np.array([
+    [0.0, 0.0, 0.0, 1.0],
+    [0.10891222102190146, -0.02351519745119192, 0.2506948010244541, 0.961632611936709],
+    [-0.19251795546448913, -0.010869278272037042, 0.6823582505571401, 0.7051282957804325],
+    [-0.031630334056244436, 0.06311004283931343, 0.9458264849962535, 0.3169051983479322],
+    [0.0, 0.0, 0.999783764189357, 0.020794827803092428],
+    [0.0, 0.0, -0.999783764189357, 0.020794827803092428],
+    [-0.01583495660052989, -0.031594506325513194, -0.948194592101579, 0.3157183188046379],
+    [0.17781436703297324, 0.015341743204846797, -0.4847664540368659, 0.856240717808154],
+    [0.0, 0.0, -0.9974949866040544, 0.0707372016677029],
+    [0.0, 0.0, 0.9974949866040544, 0.0707372016677029],
+    [-0.17410813759359595, 0.0, 0.0, 0.9847265389049334],
+    [0.0, 0.17410813759359595, 0.0, 0.9847265389049334],
+])
+GOLDEN_DISKS = np.array([
+    [-0.9125544570086752, -1.1818406453845198, -1.0471975511965972],
+    [-0.26310485520244375, -0.6886083091958483, -0.6969923972859294],
+    [0.3074810373356106, 0.46703059572010114, 0.782653973057155],
+    [1.532204001910989, 1.4264204440578276, 1.358920915668128],
+    [2.187445542991325, 1.9181593546154807, 2.0528024488034027],
+    [2.270630850170911, 2.0013446617950654, 2.1359877559829887],
+    [2.9287096833944477, 2.576338725266871, 2.696538689007134],
+    [4.262048594682854, 4.349141478097443, 3.917885091581951],
+    [2.3706308501709112, 2.1013446617950664, 2.2359877559829893],
+    [2.0874455429913246, 1.81815935461548, 1.9528024488034028],
+    [5.235644817864058, 5.023870590050859, -0.7358954423907792],
+    [5.114027373837734, 5.357948138128243, -1.0471975511965976],
+])
+
+
+def test_inverse_matches_former_implementation():
+    kin_model = get_orbita().kin_model
+    disks = np.array([kin_model.inverse_kinematics(q) for q in GOLDEN_QUATERNIONS])
+    assert np.allclose(disks, GOLDEN_DISKS, rtol=0, atol=1e-12)
+
+    kin_model = get_orbita().kin_model
+    disks = kin_model.inverse_kinematics_batch(GOLDEN_QUATERNIONS)
+    assert np.allclose(disks, GOLDEN_DISKS, rtol=0, atol=1e-12)
+
+
+def test_numpy_forward_model_matches_estimator():
+    pytest.importorskip('sklearn')
+    import pickle
+
+    import reachy_pyluos_hal
+    model_dir = Path(reachy_pyluos_hal.__file__).parent
+
+    with open(model_dir / 'mlpreg.obj', 'rb') as f:
+        estimator = pickle.load(f)
+    model = MLPForwardModel.load(model_dir / 'mlpreg.npz')
+
+    disks = np.random.default_rng(0).uniform(-np.pi, np.pi, (1000, 3))
+    assert np.allclose(model.predict(disks), estimator.predict(disks), atol=1e-12)
+
+
+def test_forward_model_is_shared():
+    a, b = get_orbita(), get_orbita()
+
+    assert a.kin_model.model is b.kin_model.model
+    assert a.kin_model.last_angles is not b.kin_model.last_angles
+
+
+def test_unwrap_matches_sequential_unwrap():
+    def sequential_unwrap(last_angles, angles):
+        unwrapped = []
+        for a in angles:
+            jump = np.abs(a - last_angles) >= 2.96
+            last_angles = a + jump * np.sign(last_angles) * 2 * np.pi
+            unwrapped.append(last_angles)
+        return np.array(unwrapped)
+
+    kin_model = get_orbita().kin_model
+    rng = np.random.default_rng(0)
+
+    for n in (1, 2, 3, 17, 256):
+        angles = rng.choice([-np.pi, -3.0, -0.1, 0.0, 0.1, 3.0, np.pi], (n, 3))
+        last_angles = rng.uniform(-3 * np.pi, 3 * np.pi, 3)
+
+        kin_model.last_angles = last_angles
+        unwrapped = kin_model._unwrap(angles)
+
+        assert np.array_equal(unwrapped, sequential_unwrap(last_angles, angles))
+        assert np.array_equal(kin_model.last_angles, unwrapped[-1])
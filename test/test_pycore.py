@@ -0,0 +1,165 @@
+import struct
+import threading
+
+import pytest
+
+from reachy_pyluos_hal.pycore import GateProtocol
+
+from conftest import PayloadRecordingProtocol, PubDataDecodingProtocol, frame
+
+
+def test_split_frames():
+    payloads = [bytes([15, 36, 2, 1, 0, 0, 16, 0]), bytes([200]), bytes([55, 40, 10]) + bytes(12)]
+    data = b''.join(frame(p) for p in payloads)
+
+    protocol = PayloadRecordingProtocol()
+    for i in range(0, len(data), 5):
+        protocol.data_received(bytearray(data[i: i + 5]))
+
+    assert protocol.received == payloads
+    assert len(protocol.buffer) == 0
+
+
+def test_partial_frame_is_kept():
+    protocol = PayloadRecordingProtocol()
+    protocol.data_received(bytearray(frame(bytes([200]))[:3]))
+
+    assert protocol.received == []
+    assert protocol.buffer == bytearray([255, 255, 1])
+
+
+def test_corrupted_bytes_are_skipped():
+    payload = bytes([20, 1, 0, 0, 128, 63])
+    protocol = PayloadRecordingProtocol()
+    protocol.data_received(bytearray([1, 2, 3]) + frame(payload) + bytearray([7, 7, 7]))
+
+    assert protocol.received == [payload]
+    assert protocol.buffer == bytearray()
+
+
+def test_kept_payloads_outlive_the_buffer():
+    class KeepingProtocol(GateProtocol):
+        kept = []
+
+        def handle_message(self, payload):
+            self.kept.append(payload)
+
+    protocol = KeepingProtocol()
+    protocol.data_received(bytearray(frame(bytes([200, 1])) + frame(bytes([200, 2]))[:4]))
+    assert protocol.buffer == bytearray([255, 255, 2, 200])
+
+    protocol.data_received(bytearray(bytes([2]) + frame(bytes([200]) + bytes(250))))
+    assert protocol.kept[:2] == [bytes([200, 1]), bytes([200, 2])]
+    assert protocol.kept[2] == bytes([200]) + bytes(250)
+    assert protocol.buffer == bytearray()
+
+
+def test_reads_of_any_size_are_parsed_the_same():
+    payloads = [bytes([15, 36, 2, 1, 0, 0, 16, 0]), bytes([200]), bytes([55, 40, 10]) + bytes(12)] * 50
+    data = bytes([1, 2]) + b''.join(frame(p) for p in payloads)
+
+    for chunk_size in (7, 256, len(data)):
+        protocol = PayloadRecordingProtocol()
+        for i in range(0, len(data), chunk_size):
+            protocol.data_received(bytearray(data[i: i + chunk_size]))
+        assert protocol.received == payloads
+        assert protocol.buffer == bytearray()
+
+
+def test_decode_dxl_pub_data():
+    payload = bytes([GateProtocol.MSG_TYPE_DXL_PUB_DATA, 36, 2])
+    payload += bytes([10]) + struct.pack('<HH', 0, 2048)
+    payload += bytes([11]) + struct.pack('<HH', 32, 1024)
+
+    protocol = PubDataDecodingProtocol()
+    protocol.data_received(bytearray(frame(payload)))
+
+    assert protocol.decoded == [('dxl', 36, [10, 11], [0, 32], [struct.pack('<H', 2048), struct.pack('<H', 1024)])]
+
+
+def test_decode_load_and_fan_pub_data():
+    load = bytes([GateProtocol.MSG_TYPE_LOAD_PUB_DATA, 10]) + struct.pack('<f', 1.5) + bytes([11]) + struct.pack('<f', -2.0)
+    fan = bytes([GateProtocol.MSG_TYPE_FAN_PUB_DATA, 10, 1, 11, 0])
+
+    protocol = PubDataDecodingProtocol()
+    protocol.data_received(bytearray(frame(load) + frame(fan)))
+
+    assert protocol.decoded == [
+        ('load', [10, 11], [struct.pack('<f', 1.5), struct.pack('<f', -2.0)]),
+        ('fan', [10, 11], [1, 0]),
+    ]
+
+
+class FakeGate:
+    """Transport answering detection requests, delaying container info answers until enough requests are queued."""
+
+    def __init__(self, protocol, containers_per_node, batch=4):
+        self.protocol = protocol
+        self.containers_per_node = containers_per_node
+        self.batch = batch
+        self.queued = []
+        self.max_outstanding = 0
+
+    def reply(self, payload):
+        self.protocol.data_received(bytearray(frame(payload)))
+
+    def write(self, data):
+        msg_type, args = data[3], list(data[4:])
+        if msg_type == GateProtocol.MSG_DETECTION_GET_NODES:
+            self.reply(bytes([GateProtocol.MSG_DETECTION_PUB_NODES] + list(self.containers_per_node)))
+        elif msg_type == GateProtocol.MSG_DETECTION_GET_CONTAINERS:
+            node_id = args[0]
+            self.reply(bytes([GateProtocol.MSG_DETECTION_PUB_CONTAINERS, node_id] + self.containers_per_node[node_id]))
+        elif msg_type == GateProtocol.MSG_DETECTION_GET_CONTAINER_INFO:
+            self.queued.append(args[0])
+            self.max_outstanding = max(self.max_outstanding, len(self.queued))
+            if len(self.queued) >= self.batch:
+                self.flush()
+
+    def flush(self):
+        queued, self.queued = self.queued, []
+        for id in queued:
+            self.reply(bytes([GateProtocol.MSG_DETECTION_PUB_CONTAINER_INFO, id]) + f'dxl_{id} DynamixelMotor'.encode())
+
+
+def test_detection_is_windowed():
+    protocol = GateProtocol()
+    protocol.detection_window = 4
+    protocol.transport = FakeGate(protocol, {1: [10, 11, 12], 2: [13, 14, 15, 16, 17]})
+
+    devices = protocol.send_detection_signal()
+
+    assert [c.id for c in devices[1]] == [10, 11, 12]
+    assert [c.alias for c in devices[2]] == [f'dxl_{id}' for id in range(13, 18)]
+    assert protocol.transport.max_outstanding == 4
+    assert set(protocol.detection_timings) == {'nodes', 'containers', 'container_info', 'total'}
+
+
+def test_detection_timeout():
+    protocol = GateProtocol(timeout=0.05)
+    protocol.transport = FakeGate(protocol, {1: [10, 11, 12]})
+
+    with pytest.raises(TimeoutError):
+        protocol.send_detection_signal()
+
+
+class SlowGate(FakeGate):
+    """Transport answering each container info request after a delay (from another thread)."""
+
+    def __init__(self, protocol, containers_per_node, delay):
+        super().__init__(protocol, containers_per_node, batch=1)
+        self.delay = delay
+
+    def flush(self):
+        threading.Timer(self.delay, super().flush).start()
+
+
+def test_detection_timeout_is_per_request():
+    protocol = GateProtocol(timeout=0.1)
+    protocol.detection_window = 1
+    protocol.transport = SlowGate(protocol, {1: list(range(10, 18))}, delay=0.02)
+
+    devices = protocol.send_detection_signal()
+
+    assert [c.id for c in devices[1]] == list(range(10, 18))
+    assert protocol.detection_timings['container_info'] > protocol.timeout
@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from reachy_pyluos_hal import reachy as reachy_module
+from reachy_pyluos_hal.orbita import OrbitaRegister
+from reachy_pyluos_hal.reachy import Reachy
+
+from conftest import FakeGateClient
+
+
+@pytest.fixture
+def reachy(monkeypatch):
+    monkeypatch.setattr(reachy_module, 'glob', lambda template: ['/dev/gate0', '/dev/gate1', '/dev/gate2'])
+    monkeypatch.setattr(reachy_module, 'GateClient', FakeGateClient)
+    monkeypatch.setattr(
+        reachy_module, 'find_gates',
+        lambda parts, ports, logger, cache_file=None: [(port, list(devices.values()), []) for port, devices in zip(ports, parts)],
+    )
+    return Reachy('full_kit', logging.getLogger('test'))
+
+
+def test_latest_joints_value_does_not_block(reachy):
+    names = ['l_shoulder_pitch', 'l_elbow_pitch', 'neck_roll']
+
+    samples = reachy.get_latest_joints_value('present_position', names)
+    assert all(sample.stale for sample in samples)
+    assert all(np.isnan(sample.value) for sample in samples)
+
+    reachy.handle_dxl_pub_data(36, [reachy.dxls['l_shoulder_pitch'].id], [0], [bytes([0, 8])])
+    shoulder, elbow, _ = reachy.get_latest_joints_value('present_position', names, max_age=1.0)
+
+    assert not shoulder.stale
+    assert shoulder.timestamp > 0
+    assert shoulder.value == pytest.approx(reachy.get_joints_value('present_position', ['l_shoulder_pitch'])[0])
+    assert elbow.stale
+
+    shoulder, _, _ = reachy.get_latest_joints_value('present_position', names, max_age=0.0)
+    assert shoulder.stale
+
+
+def test_command_batch_sends_a_single_frame_per_gate(reachy):
+    names = ['l_shoulder_pitch', 'l_shoulder_roll', 'l_arm_yaw']
+    for name in names:
+        reachy.dxls[name].update_value('torque_enable', bytes([1]))
+    gate = reachy.gate4name[names[0]]
+
+    with reachy.command_batch() as batch:
+        batch.set_joints_value('goal_position', {name: 0.1 for name in names})
+        batch.set_joints_value('moving_speed', {name: 1.0 for name in names})
+        batch.set_joints_value('torque_limit', {name: 50.0 for name in names})
+
+    assert len(gate.protocol.transport.sent) == 1
+    msg = gate.protocol.transport.sent[0]
+    assert list(msg[:3]) == [gate.protocol.MSG_TYPE_DXL_SET_REG, 30, 6]
+    assert len(msg) == 3 + len(names) * 7
+
+
+def test_goal_position_write_uses_torque_cache(reachy):
+    shoulder, elbow = 'l_shoulder_pitch', 'l_elbow_pitch'
+    gate = reachy.gate4name[shoulder]
+
+    reachy.handle_dxl_pub_data(24, [reachy.dxls[shoulder].id, reachy.dxls[elbow].id], [0, 0], [bytes([1]), bytes([0])])
+    # Clearing the registers (eg. by a torque_enable read) does not make the writes block.
+    reachy.dxls[shoulder].clear_value('torque_enable')
+    reachy.dxls[elbow].clear_value('torque_enable')
+
+    reachy.set_joints_value('goal_position', {shoulder: 0.0, elbow: 0.0})
+    assert len(gate.protocol.transport.sent) == 1
+    msg = gate.protocol.transport.sent[0]
+    assert list(msg[:4]) == [gate.protocol.MSG_TYPE_DXL_SET_REG, 30, 2, reachy.dxls[shoulder].id]
+    assert len(msg) == 6
+
+
+def test_torque_cache_matches_the_written_value(reachy, monkeypatch):
+    shoulder = 'l_shoulder_pitch'
+    monkeypatch.setattr(reachy, 'get_dxls_value', lambda register, names, clear_value, retry: [0.0] * len(names))
+
+    reachy.set_joints_value('torque_enable', {shoulder: np.int8(2)})
+    assert reachy.dxls[shoulder].get_value('torque_enable') == bytes([1])
+    assert reachy._is_torque_enabled([shoulder]) == [True]
+
+
+def test_dead_band_skips_unchanged_writes(reachy):
+    shoulder, elbow = 'l_shoulder_pitch', 'l_elbow_pitch'
+    gate = reachy.gate4name[shoulder]
+    sent = gate.protocol.transport.sent
+
+    reachy.dead_band_registers.add('torque_limit')
+
+    reachy.set_joints_value('torque_limit', {shoulder: 50.0, elbow: 50.0})
+    assert len(sent) == 1
+
+    reachy.set_joints_value('torque_limit', {shoulder: 50.0, elbow: 50.0})
+    assert len(sent) == 1
+
+    reachy.set_joints_value('torque_limit', {shoulder: 50.0, elbow: 60.0})
+    assert len(sent) == 2
+    assert sent[-1][3] == reachy.dxls[elbow].id
+    assert len(sent[-1]) == 6
+
+    # Changing the torque state invalidates the last sent values.
+    reachy.set_joints_value('torque_enable', {shoulder: 0})
+    del sent[:]
+    reachy.set_joints_value('torque_limit', {shoulder: 50.0, elbow: 60.0})
+    assert len(sent) == 1
+    assert sent[0][3] == reachy.dxls[shoulder].id
+
+
+def test_dead_band_is_invalidated_by_the_motor_state(reachy, monkeypatch):
+    shoulder = 'l_shoulder_pitch'
+    id = reachy.dxls[shoulder].id
+    addr, _ = reachy.dxls[shoulder].get_register_config('torque_limit')
+    sent = reachy.gate4name[shoulder].protocol.transport.sent
+
+    reachy.dead_band_registers.add('torque_limit')
+    reachy.set_joints_value('torque_limit', {shoulder: 50.0})
+    raw = reachy.dxls[shoulder].get_value('torque_limit')
+
+    def resent():
+        del sent[:]
+        reachy.set_joints_value('torque_limit', {shoulder: 50.0})
+        return len(sent) == 1
+
+    # The same value read back keeps the dead band.
+    reachy.handle_dxl_pub_data(addr, [id], [0], [raw])
+    assert not resent()
+
+    # A different value read back means the write was lost.
+    reachy.handle_dxl_pub_data(addr, [id], [0], [bytes(2)])
+    assert resent()
+
+    # So does a torque toggled outside of the HAL.
+    reachy.handle_dxl_pub_data(24, [id], [0], [bytes([1])])
+    assert not resent()
+    reachy.handle_dxl_pub_data(24, [id], [0], [bytes([0])])
+    assert resent()
+
+    # Or a new connection to the gates.
+    monkeypatch.setattr(reachy, 'setup', lambda: None)
+    reachy.start()
+    assert resent()
+
+
+def test_orbita_dead_band_is_invalidated_by_the_disks_state(reachy):
+    sent = reachy.gate4name['neck'].protocol.transport.sent
+    orbita = reachy.orbitas['neck']
+    reachy.dead_band_registers.add('goal_position')
+    goal = {'neck_roll': 0.1, 'neck_pitch': 0.2, 'neck_yaw': 0.3}
+
+    reachy.set_joints_value('goal_position', goal)
+    del sent[:]
+    reachy.set_joints_value('goal_position', goal)
+    assert sent == []
+
+    raw = b''.join(disk.goal_position.get() for disk in orbita.disks)
+    reachy.handle_orbita_pub_data(orbita.id, OrbitaRegister.goal_position, raw[:-4] + bytes(4))
+    reachy.set_joints_value('goal_position', goal)
+    assert len(sent) == 1
+    assert list(sent[0][3::5]) == [orbita.get_id_for_disk('disk_bottom')]
+
+
+def test_orbita_partial_goal_uses_last_commanded_rpy(reachy, monkeypatch):
+    gate = reachy.gate4name['neck']
+    sent = gate.protocol.transport.sent
+
+    def no_read(*args, **kwargs):
+        raise AssertionError('present_position should not be read')
+
+    reachy.set_joints_value('goal_position', {'neck_roll': 0.1, 'neck_pitch': 0.2, 'neck_yaw': 0.3})
+    full = sent[-1]
+
+    monkeypatch.setattr(reachy, 'get_joints_value', no_read)
+    reachy.set_joints_value('goal_position', {'neck_pitch': 0.2})
+    assert sent[-1] == full
+    assert reachy._last_orbita_rpys['neck'] == {'roll': 0.1, 'pitch': 0.2, 'yaw': 0.3}
+
+
+def test_orbita_unreachable_goal_is_not_cached(reachy):
+    sent = reachy.gate4name['neck'].protocol.transport.sent
+    reachy.set_joints_value('goal_position', {'neck_roll': 0.0, 'neck_pitch': 0.0, 'neck_yaw': 0.0})
+    nb_sent = len(sent)
+
+    with pytest.raises(ValueError):
+        reachy.set_joints_value('goal_position', {'neck_roll': 0.0, 'neck_pitch': -1.5, 'neck_yaw': 0.0})
+    assert len(sent) == nb_sent
+    assert reachy._last_orbita_rpys['neck'] == {'roll': 0.0, 'pitch': 0.0, 'yaw': 0.0}
+
+    reachy.set_joints_value('goal_position', {'neck_yaw': 0.1})
+    assert len(sent) == nb_sent + 1
+    assert reachy._last_orbita_rpys['neck'] == {'roll': 0.0, 'pitch': 0.0, 'yaw': 0.1}
+
+
+def test_streaming(reachy):
+    reachy.start_streaming(period=5)
+
+    for gate in reachy.gates:
+        assert bytes([gate.protocol.MSG_TYPE_DXL_SET_POS_PUB_PERIOD, 5]) in gate.protocol.transport.sent
+    neck_sent = reachy.gate4name['neck'].protocol.transport.sent
+    assert neck_sent[-1][:3] == bytes([reachy.MSG_TYPE_ORBITA_SET_REG, reachy.orbitas['neck'].id, 60])
+
+    shoulder = reachy.dxls['l_shoulder_pitch']
+    for _ in range(3):
+        reachy.handle_dxl_pub_data(36, [shoulder.id], [0], [bytes([0, 8])])
+
+    gate = reachy.gate4name['l_shoulder_pitch']
+    del gate.protocol.transport.sent[:]
+    shoulder.clear_value('present_position')
+    reachy.handle_dxl_pub_data(36, [shoulder.id], [0], [bytes([0, 8])])
+    reachy.get_joints_value('present_position', ['l_shoulder_pitch'])
+    assert gate.protocol.transport.sent == []
+
+    rates = reachy.get_streaming_rates()
+    assert rates['l_shoulder_pitch'] > 0
+    assert rates['l_elbow_pitch'] == 0
+    assert rates['neck_roll'] == 0
+
+    # A fresh value is still requested while streaming.
+    reachy.retry_policy.timeout = 0.01
+    reachy.retry_policy.deadline = 0.05
+    with pytest.raises(TimeoutError):
+        reachy.get_dxls_value('present_position', ['l_shoulder_pitch'], clear_value=True, retry=0)
+    assert gate.protocol.transport.sent[0][:3] == bytes([reachy.MSG_TYPE_DXL_GET_REG, 36, 2])
+
+    reachy.stop_streaming()
+    assert reachy.streaming_period is None
+    for gate in reachy.gates:
+        assert bytes([gate.protocol.MSG_TYPE_DXL_SET_POS_PUB_PERIOD, reachy.default_pub_period]) in gate.protocol.transport.sent
+    with pytest.raises(RuntimeError):
+        reachy.get_streaming_rates()
+
+
+def test_subscription_fires_on_complete_samples(reachy):
+    shoulder, elbow = reachy.dxls['l_shoulder_pitch'], reachy.dxls['l_elbow_pitch']
+    received = []
+    subscription = reachy.subscribe(['l_shoulder_pitch', 'l_elbow_pitch'], received.append)
+
+    reachy.handle_dxl_pub_data(36, [shoulder.id], [0], [bytes([0, 8])])
+    reachy.handle_dxl_pub_data(36, [shoulder.id], [0], [bytes([0, 8])])
+    assert received == []
+
+    reachy.handle_dxl_pub_data(36, [elbow.id], [0], [bytes([0, 8])])
+    assert len(received) == 1
+    assert not any(sample.stale for sample in received[0])
+
+    # Temperature updates are not samples of the group.
+    reachy.handle_dxl_pub_data(43, [shoulder.id, elbow.id], [0, 0], [bytes([30]), bytes([30])])
+    assert len(received) == 1
+
+    subscription.cancel()
+    reachy.handle_dxl_pub_data(36, [shoulder.id, elbow.id], [0, 0], [bytes([0, 8]), bytes([0, 8])])
+    assert len(received) == 1
+
+
+def test_stream(reachy):
+    shoulder = reachy.dxls['l_shoulder_pitch']
+
+    async def main():
+        samples = []
+        async for sample in reachy.stream(['l_shoulder_pitch']):
+            samples.append(sample)
+            if len(samples) == 2:
+                break
+        return samples
+
+    def publish():
+        for i in range(50):
+            reachy.handle_dxl_pub_data(36, [shoulder.id], [0], [bytes([i, 8])])
+            time.sleep(0.005)
+
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    samples = asyncio.run(main())
+    publisher.join()
+
+    assert len(samples) == 2
+    assert samples[0][0].value != samples[1][0].value
+    assert reachy._subscriptions == {}
+
+
+def test_metrics_snapshot(reachy):
+    name = 'l_shoulder_pitch'
+    dxl_id = reachy.dxls[name].id
+
+    reachy._send_dxls_get('temperature', [name], clear_value=True)
+    reachy.handle_dxl_pub_data(43, [dxl_id], [0], [bytes([40])])
+
+    metrics = reachy.get_metrics()
+    assert metrics['round_trips']['registers']['dxl.temperature']['count'] == 1
+    assert metrics['gates'][reachy.gate4name[name].port]['frames_sent'] == 1
+    assert metrics['retries']['reads'] == 0
+
+
+def test_get_joints_value_sends_all_requests_before_waiting(reachy, monkeypatch):
+    names = ['l_shoulder_pitch', 'r_shoulder_pitch', 'neck_roll', 'neck_yaw', 'l_elbow_pitch']
+    events = []
+
+    for gate in reachy.gates:
+        def write(data, port=gate.port):
+            events.append(('send', port, data[3]))
+        monkeypatch.setattr(gate.protocol.transport, 'write', write)
+
+    def wait_for(registers, resend, label='', **kwargs):
+        events.append(('wait', label))
+        for register in registers.values():
+            register.update(bytes(4) if 'orbita' in label else bytes(2))
+
+    monkeypatch.setattr(reachy.retry_policy, 'wait_for', wait_for)
+
+    dxl_gates = sorted({reachy.gate4name[name].port for name in ('l_shoulder_pitch', 'r_shoulder_pitch', 'l_elbow_pitch')})
+    assert len(dxl_gates) == 2
+
+    for _ in range(2):
+        events.clear()
+        reachy.get_joints_value('torque_limit', names)
+
+        sends = [event for event in events if event[0] == 'send']
+        waits = [event for event in events if event[0] == 'wait']
+        assert events == sends + waits
+        assert len(waits) == 2
+
+        assert sorted(port for _, port, msg_type in sends if msg_type == reachy.MSG_TYPE_DXL_GET_REG) == dxl_gates
+        assert [port for _, port, msg_type in sends if msg_type == reachy.MSG_TYPE_ORBITA_GET_REG] == [reachy.gate4name['neck'].port]
@@ -0,0 +1,79 @@
+import logging
+import os
+import time
+
+import pytest
+
+from reachy_pyluos_hal.pycore import GateClient, GateProtocol
+from reachy_pyluos_hal.recorder import RX, TX, TrafficRecorder, get_traffic_recording_file, read_recording, replay
+
+from conftest import PayloadRecordingProtocol, PayloadRecordingTransport, frame
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / 'gate.rec')
+    payloads = [bytes([35, 1, 0]), bytes([35, 1, 1])]
+    data = b''.join(frame(p) for p in payloads)
+
+    protocol = PayloadRecordingProtocol()
+    protocol.transport = PayloadRecordingTransport()
+    with TrafficRecorder(path) as recorder:
+        protocol.recorder = recorder
+        protocol.send_keep_alive()
+        protocol.data_received(bytearray(data[:4]))
+        time.sleep(0.05)
+        protocol.data_received(bytearray(data[4:]))
+
+    assert protocol.transport.sent == [bytes([GateProtocol.MSG_TYPE_KEEP_ALIVE])]
+    assert protocol.received == payloads
+
+    records = list(read_recording(path))
+    assert [r.direction for r in records] == [TX, RX, RX]
+    assert records[0].data == frame(bytes([GateProtocol.MSG_TYPE_KEEP_ALIVE]))
+    assert b''.join(r.data for r in records[1:]) == data
+
+    replayed = PayloadRecordingProtocol()
+    t0 = time.monotonic()
+    assert replay(path, replayed, speed=None) == 2
+    assert time.monotonic() - t0 < 0.05
+    assert replayed.received == payloads
+
+    replayed = PayloadRecordingProtocol()
+    t0 = time.monotonic()
+    replay(path, replayed, speed=1.0)
+    assert time.monotonic() - t0 >= 0.04
+    assert replayed.received == payloads
+
+
+def test_not_a_recording(tmp_path):
+    path = tmp_path / 'gate.rec'
+    path.write_bytes(b'garbage')
+
+    with pytest.raises(ValueError):
+        list(read_recording(str(path)))
+
+
+def test_recording_file_is_created_and_never_appended(tmp_path):
+    path = str(tmp_path / 'missing' / 'gate.rec')
+    TrafficRecorder(path).close()
+    assert list(read_recording(path)) == []
+
+    with pytest.raises(FileExistsError):
+        TrafficRecorder(path)
+
+
+def test_recording_file_is_unique_per_process(tmp_path, monkeypatch):
+    monkeypatch.setenv('REACHY_TRAFFIC_RECORDING_DIR', str(tmp_path))
+    path = get_traffic_recording_file('/dev/gate0')
+    assert os.path.dirname(path) == str(tmp_path)
+    assert path.endswith(f'-{os.getpid()}.rec')
+
+
+def test_recording_errors_do_not_prevent_the_connection(tmp_path, caplog):
+    not_a_dir = tmp_path / 'file'
+    not_a_dir.write_bytes(b'')
+
+    gate = GateClient('loop://', GateProtocol, recording_file=str(not_a_dir / 'gate.rec'), logger=logging.getLogger('test'))
+    assert gate.recorder is None
+    assert 'recording disabled' in caplog.text
+    gate.serial.close()
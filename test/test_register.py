@@ -0,0 +1,105 @@
+import gc
+import sys
+import threading
+import time
+
+import pytest
+
+from reachy_pyluos_hal.register import Register, RegisterStore
+
+
+def make_register(timeout=0.015):
+    return Register(lambda val: val[0], lambda val: bytes([val]), timeout=timeout, kind='test')
+
+
+def test_update_and_get():
+    reg = make_register()
+    assert not reg.is_set()
+    assert reg.val is None
+
+    reg.update_using_usi(42)
+    assert reg.is_set()
+    assert reg.get_as_usi() == 42
+    assert reg.timestamp > 0
+
+
+def test_reset_keeps_snapshot():
+    reg = make_register()
+    assert reg.snapshot() == (None, 0.0)
+
+    reg.update(bytes([1, 2]))
+    reg.reset()
+    assert not reg.is_set()
+    assert reg.val is None
+    assert reg.snapshot()[0] == bytes([1, 2])
+
+    with pytest.raises(TimeoutError):
+        reg.get()
+
+
+def test_get_wakes_up_on_update():
+    reg = make_register(timeout=1.0)
+
+    def publish():
+        time.sleep(0.05)
+        reg.update(bytes([7]))
+
+    t = threading.Thread(target=publish)
+    t.start()
+    t0 = time.monotonic()
+    assert reg.get() == bytes([7])
+    assert time.monotonic() - t0 < 0.5
+    t.join()
+
+
+def test_slots_are_released():
+    reg = make_register()
+    store, slot = reg.store, reg.slot
+    del reg
+    gc.collect()
+
+    assert slot in store._free_slots
+    assert RegisterStore.allocate('test')[0] is store
+
+
+def test_concurrent_writers():
+    reg = make_register()
+    nb_writes = 20000
+    torn = []
+
+    def write(byte):
+        for _ in range(nb_writes):
+            reg.update(bytes([byte]) * 16)
+
+    def read():
+        for _ in range(nb_writes):
+            val, _ = reg.snapshot()
+            if val is not None and len(set(val)) != 1:
+                torn.append(val)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=write, args=(i, )) for i in (1, 2)] + [threading.Thread(target=read)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert torn == []
+    assert reg.update_count == 2 * nb_writes
+
+
+def test_writers_of_different_slots_do_not_contend():
+    reg, other = make_register(), make_register()
+    assert reg.store is other.store
+
+    with reg.store._write_locks[reg.slot]:
+        t = threading.Thread(target=other.update, args=(bytes([3]), ))
+        t.start()
+        t.join(timeout=1.0)
+        assert not t.is_alive()
+
+    assert other.get() == bytes([3])
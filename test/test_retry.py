@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from reachy_pyluos_hal.register import Register
+from reachy_pyluos_hal.retry import RetryPolicy
+
+
+def make_register():
+    return Register(lambda val: val[0], lambda val: bytes([val]), kind='test')
+
+
+def test_wakes_up_as_soon_as_set():
+    policy = RetryPolicy(timeout=1.0)
+    reg = make_register()
+
+    threading.Timer(0.01, reg.update, args=(bytes([1]),)).start()
+    t0 = time.monotonic()
+    policy.wait_for({'a': reg}, resend=lambda missing: None)
+
+    assert time.monotonic() - t0 < 0.5
+    assert policy.stats['reads'] == 1
+    assert policy.stats['stalls'] == 0
+
+
+def test_only_missing_are_requested_again():
+    policy = RetryPolicy(timeout=0.005)
+    regs = {'a': make_register(), 'b': make_register()}
+    regs['a'].update(bytes([1]))
+
+    resent = []
+
+    def resend(missing):
+        resent.append(missing)
+        regs['b'].update(bytes([2]))
+
+    policy.wait_for(regs, resend=resend)
+
+    assert resent == [['b']]
+    assert policy.stats['stalls'] == 1
+    assert policy.stats['retries'] == 1
+
+
+def test_gives_up_after_deadline():
+    policy = RetryPolicy(timeout=0.005, backoff=2.0, deadline=0.05, max_retries=100)
+    resent = []
+
+    t0 = time.monotonic()
+    with pytest.raises(TimeoutError):
+        policy.wait_for({'a': make_register()}, resend=resent.append)
+
+    assert time.monotonic() - t0 < 0.2
+    assert 0 < len(resent) < 5
+    assert policy.stats['failures'] == 1
+    assert policy.snapshot()['retries_per_key'] == {'a': len(resent)}
@@ -0,0 +1,111 @@
+import logging
+import struct
+import time
+
+import pytest
+
+from reachy_pyluos_hal.config import load_config
+from reachy_pyluos_hal.fan import DxlFan
+from reachy_pyluos_hal.discovery import check_luos_containers, identify_luos_containers
+from reachy_pyluos_hal.pycore import GateProtocol
+from reachy_pyluos_hal.reachy import Reachy
+from reachy_pyluos_hal.simulator import SimulatedGate, register_simulated_gate, simulate_config, unregister_simulated_gate
+
+
+@pytest.fixture
+def head_gate():
+    gate = SimulatedGate(load_config('mini')[0], seed=0)
+    with gate:
+        yield gate, register_simulated_gate('test_head', gate)
+    unregister_simulated_gate('test_head')
+
+
+def test_detection(head_gate):
+    gate, port = head_gate
+    containers = identify_luos_containers(port)
+
+    found = sorted(c for node in containers.values() for c in node)
+    assert found == sorted(gate.containers)
+
+
+def test_cached_containers_are_all_checked(head_gate):
+    gate, port = head_gate
+    cached = list(gate.containers)
+    assert check_luos_containers(port, cached)
+
+    # A missing container in the middle of the network invalidates the cache.
+    del gate.containers[len(cached) // 2]
+    assert not check_luos_containers(port, cached)
+
+
+def test_detection_with_dropped_frames(head_gate):
+    gate, port = head_gate
+    gate.drop_rate = 1.0
+
+    with pytest.raises(TimeoutError):
+        identify_luos_containers(port)
+    assert gate.stats['dropped'] > 0
+
+
+def test_reachy_end_to_end(monkeypatch):
+    monkeypatch.setenv('REACHY_DISCOVERY_CACHE_FILE', '')
+    ports = simulate_config('full_kit', latency=0.001)
+
+    with Reachy('full_kit', logging.getLogger('test'), ports=ports) as reachy:
+        names = ['l_shoulder_pitch', 'r_elbow_pitch', 'l_gripper']
+        initial = [reachy.dxls[name].position_to_usi(bytes([0, reachy.dxls[name].max_position // 512])) for name in names]
+        assert reachy.get_joints_value('present_position', names) == pytest.approx(initial)
+        assert reachy.get_joints_value('temperature', names) == [37, 37, 37]
+
+        reachy.set_joints_value('torque_enable', {name: 1 for name in names})
+        reachy.set_joints_value('goal_position', {name: 0.5 for name in names})
+        assert reachy.get_joints_value('goal_position', names) == pytest.approx([0.5, 0.5, 0.5], abs=0.01)
+        time.sleep(0.05)
+        assert reachy.get_joints_value('present_position', names) == pytest.approx([0.5, 0.5, 0.5], abs=0.01)
+
+        # Present positions are published by the gates.
+        samples = reachy.get_latest_joints_value('present_position', names, max_age=0.5)
+        assert not any(sample.stale for sample in samples)
+
+        reachy.set_joints_value('goal_position', {'neck_roll': 0.1, 'neck_pitch': 0.2, 'neck_yaw': 0.3})
+        goal_disks = reachy.get_orbita_values('goal_position', 'neck', clear_value=True, retry=10)
+        time.sleep(0.05)
+        assert reachy.get_orbita_values('present_position', 'neck', clear_value=False, retry=10) == pytest.approx(goal_disks)
+
+        dxl_fans = [name for name, fan in reachy.fans.items() if isinstance(fan, DxlFan)]
+        reachy.set_fans_state({name: 1 for name in dxl_fans})
+        assert reachy.get_fans_state(dxl_fans) == [1] * len(dxl_fans)
+
+    for i in range(len(ports)):
+        unregister_simulated_gate(f'full_kit_{i}')
+
+
+def test_load_tare_and_scale():
+    class FeedRecorder:
+        def __init__(self):
+            self.data = bytearray()
+
+        def feed(self, data):
+            self.data += data
+
+    part = load_config('full_kit')[0]
+    sensor = part['l_force_gripper']
+    gate = SimulatedGate(part)
+    port = FeedRecorder()
+    gate.connect(port)
+
+    def published_force():
+        port.data.clear()
+        gate._publish_loads()
+        return struct.unpack_from('<f', port.data, 5)[0]
+
+    gate.loads[sensor.id] = 3.0
+    assert published_force() == 3.0
+
+    gate.receive(bytes([255, 255, 2, GateProtocol.MSG_TYPE_LOAD_TARE, sensor.id]))
+    gate.loads[sensor.id] = 5.0
+    assert published_force() == 2.0
+
+    scale = struct.pack('<f', 0.5)
+    gate.receive(bytes([255, 255, 6, GateProtocol.MSG_TYPE_LOAD_SET_SCALE, sensor.id]) + scale)
+    assert published_force() == 1.0